@@ -2,7 +2,7 @@
 FastAPI Application for Plant Disease Detection
 Provides RESTful API endpoints for disease detection
 """
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
@@ -11,11 +11,14 @@ import sys
 from pathlib import Path
 from PIL import Image
 import io
+import time
+import asyncio
 import numpy as np
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 from src.inference import DiseasePredictor
+from src.streaming import InferenceBatcher, FrameStream
 import config
 
 # Initialize FastAPI app
@@ -39,6 +42,9 @@ app.add_middleware(
 # Initialize disease predictor (loaded once at startup)
 predictor = None
 
+# Batches frames from concurrent WebSocket streams into shared model calls
+batcher = None
+
 
 # Pydantic models for request/response
 class PredictionResponse(BaseModel):
@@ -59,16 +65,25 @@ class HealthResponse(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     """Initialize the model on startup"""
-    global predictor
+    global predictor, batcher
     try:
         print("🚀 Initializing Plant Disease Detection Model...")
-        predictor = DiseasePredictor()
+        predictor = DiseasePredictor(image_size=config.SERVING_IMAGE_SIZE)
+        batcher = InferenceBatcher(predictor.predict_proba)
+        await batcher.start()
         print("✓ Model loaded successfully")
     except Exception as e:
         print(f"❌ Error loading model: {e}")
         raise
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the streaming batcher on shutdown"""
+    if batcher is not None:
+        await batcher.stop()
+
+
 @app.get("/", response_model=dict)
 async def root():
     """Root endpoint"""
@@ -79,6 +94,7 @@ async def root():
             "health": "/health",
             "predict": "/predict",
             "classes": "/classes",
+            "stream": "/ws/predict",
             "docs": "/docs"
         }
     }
@@ -226,6 +242,96 @@ async def predict_batch(
     }
 
 
+@app.websocket("/ws/predict")
+async def stream_predict(websocket: WebSocket, top_k: int = 3):
+    """
+    Live disease prediction over a WebSocket camera stream
+    
+    The client sends encoded frames (JPEG/PNG) as binary messages. Only the
+    most recent frame is kept while inference is busy, near-identical frames
+    are skipped, and smoothed predictions are pushed back at most
+    config.STREAM_MAX_FPS times per second.
+    
+    Args:
+        top_k: Number of top predictions per message (default: 3)
+    """
+    await websocket.accept()
+    
+    if predictor is None or batcher is None:
+        await websocket.close(code=1013, reason="Model not loaded")
+        return
+    
+    loop = asyncio.get_running_loop()
+    stream = FrameStream()
+    frame_ready = asyncio.Event()
+    state = {'frame': None, 'closed': False}
+    
+    async def receive_frames():
+        """Keep only the newest frame, counting the stale ones it replaces"""
+        try:
+            while True:
+                data = await websocket.receive_bytes()
+                stream.frames_received += 1
+                if state['frame'] is not None:
+                    stream.frames_dropped += 1
+                state['frame'] = data
+                frame_ready.set()
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            state['closed'] = True
+            frame_ready.set()
+    
+    receiver = asyncio.create_task(receive_frames())
+    min_interval = 1.0 / config.STREAM_MAX_FPS
+    last_sent = 0.0
+    
+    try:
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            
+            if state['closed']:
+                break
+            
+            frame, state['frame'] = state['frame'], None
+            if frame is None:
+                continue
+            
+            try:
+                image_array = await loop.run_in_executor(None, predictor.load_image_array, frame)
+            except Exception as e:
+                await websocket.send_json({"success": False, "error": f"Invalid frame: {str(e)}"})
+                continue
+            
+            if stream.is_near_duplicate(image_array):
+                stream.frames_skipped += 1
+                continue
+            
+            probabilities = await batcher.submit(image_array)
+            smoothed = stream.update(probabilities)
+            result = predictor.format_prediction(smoothed, top_k=top_k)
+            
+            # Hold the push rate at the configured frame rate
+            wait = min_interval - (time.monotonic() - last_sent)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            
+            await websocket.send_json({
+                "success": True,
+                "frame": stream.frames_received,
+                "top_prediction": result['top_prediction'],
+                "all_predictions": result['predictions'],
+                "stats": stream.stats()
+            })
+            last_sent = time.monotonic()
+    
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+
 @app.get("/disease-info/{disease_name}", response_model=dict)
 async def get_disease_info(disease_name: str):
     """
@@ -2,6 +2,7 @@
 Configuration file for Plant Disease Detection Module
 """
 import os
+import json
 from pathlib import Path
 
 # Base directories
@@ -38,6 +39,7 @@ MODEL_NAME = "EfficientNetB0"
 WEIGHTS = "imagenet"
 INCLUDE_TOP = False
 POOLING = "avg"
+HEAD_DROPOUT = 0.4  # Dropout before the first head layer (the next two use 0.75x and 0.5x of it)
 
 # Data augmentation parameters
 AUGMENTATION_CONFIG = {
@@ -67,7 +69,155 @@ MODEL_H5_PATH = MODELS_DIR / "plant_disease_efficientnet.h5"
 MODEL_SAVEDMODEL_PATH = MODELS_DIR / "plant_disease_savedmodel"
 CLASS_MAPPING_PATH = MODELS_DIR / "class_mapping.json"
 TRAINING_HISTORY_PATH = MODELS_DIR / "training_history.json"
+FAST_MODEL_H5_PATH = MODELS_DIR / "plant_disease_fast.h5"
+CASCADE_CONFIG_PATH = MODELS_DIR / "cascade_config.json"
 
 # GPU Memory Configuration (important for 2GB GPU)
 GPU_MEMORY_LIMIT = 1800  # MB - leave some headroom
 MIXED_PRECISION = True  # Enable for better performance on limited VRAM
+CPU_MIXED_PRECISION = False  # mixed_bfloat16 when training on a CPU with AVX512_BF16/AMX (--bf16)
+JIT_COMPILE = False  # XLA-compile the training step (--xla)
+
+# Gradient accumulation (effective batch = BATCH_SIZE * accumulation steps)
+ACCUMULATION_STEPS = 1  # Micro-batches per optimizer update in stage 1
+FINE_TUNE_ACCUMULATION_STEPS = 1  # Micro-batches per update when fine-tuning (e.g. 8 = 256 images)
+SCALE_LR_WITH_BATCH = True  # Scale learning rates linearly with the effective batch size
+LR_REFERENCE_BATCH_SIZE = 32  # Batch size LEARNING_RATE was tuned for
+
+# Resumable training checkpoints (see src/checkpointing.py, --resume)
+CHECKPOINT_DIR = MODELS_DIR / "checkpoints"
+CHECKPOINTS_TO_KEEP = 3  # In-stage checkpoints kept on disk (stage ends are always kept)
+CHECKPOINT_EVERY_STEPS = 0  # Also checkpoint every N steps within an epoch (0 = epoch ends only)
+
+# Training instrumentation (see src/training_monitor.py)
+METRICS_EVERY_STEPS = 100  # Throughput/resource record every N steps, besides one per epoch
+PROFILE_STEPS = None  # (first, last) step to trace with the TensorFlow profiler, e.g. (100, 120)
+PROFILE_STAGE = 'stage1'  # Stage the profiler window applies to
+
+# Streaming inference configuration (WebSocket camera feeds)
+INFERENCE_MAX_BATCH_SIZE = 16  # Frames from concurrent streams batched per model call
+INFERENCE_MAX_WAIT_MS = 10  # How long the batcher waits to fill a batch
+STREAM_MAX_FPS = 10  # Maximum prediction rate pushed back per stream
+STREAM_FRAME_DIFF_THRESHOLD = 0.02  # Mean abs difference below which a frame is skipped
+STREAM_EMA_ALPHA = 0.4  # Weight of the newest frame in the smoothed probabilities
+
+# Model cascade configuration (small model first, full model when unsure)
+USE_CASCADE = True  # Only active when FAST_MODEL_H5_PATH exists
+CASCADE_DEFAULT_THRESHOLD = 0.9  # Used until cascade_calibration.py has been run
+CASCADE_TARGET_ACCURACY = 0.97  # Validation accuracy the calibrated cascade must reach
+
+# Knowledge distillation configuration (--distill)
+STUDENT_ARCHITECTURE = "MobileNetV3Small"  # Or "MobileNetV3Large"
+STUDENT_IMAGE_SIZE = (160, 160)
+STUDENT_MODEL_H5_PATH = FAST_MODEL_H5_PATH  # Student doubles as the cascade fast model
+DISTILL_TEMPERATURE = 4.0  # Softens teacher probabilities
+DISTILL_ALPHA = 0.7  # Weight of the soft-target loss vs the hard-label loss
+DISTILL_EPOCHS = 20
+DISTILL_LEARNING_RATE = 0.0005
+DISTILL_CACHE_DIR = MODELS_DIR / "distill_cache"
+DISTILLATION_REPORT_PATH = MODELS_DIR / "distillation_report.json"
+
+# Pruning and weight clustering (--optimize, see src/model_optimization.py)
+HEAD_KEEP_FRACTION = 0.5  # Units of each hidden head layer kept by structured pruning
+PRUNE_SPARSITY = 0.5  # Share of each conv/dense kernel zeroed by magnitude pruning
+PRUNE_MIN_WEIGHTS = 4096  # Smaller kernels (e.g. squeeze-excite) stay dense
+WEIGHT_CLUSTERS = 16  # Distinct values per kernel after clustering
+OPTIMIZE_RECOVERY_EPOCHS = 2  # Fine-tuning while sparsity ramps up (over the first half)
+OPTIMIZE_CLUSTER_EPOCHS = 1  # Fine-tuning of the cluster centroids
+OPTIMIZED_MODEL_H5_PATH = MODELS_DIR / "plant_disease_efficientnet_optimized.h5"
+OPTIMIZATION_REPORT_PATH = MODELS_DIR / "optimization_report.json"
+
+# Inference-only export (see src/inference_export.py)
+EXPORT_INFERENCE_MODEL = True  # Export after training; the predictor prefers this model
+INFERENCE_MODEL_H5_PATH = MODELS_DIR / "plant_disease_efficientnet_inference.h5"
+INFERENCE_EXPORT_REPORT_PATH = MODELS_DIR / "inference_export_report.json"
+INFERENCE_PARITY_TOLERANCE = 1e-4  # Max probability difference to the original model
+INFERENCE_PARITY_BATCHES = 4  # Test batches compared
+
+# Backbone feature cache for stage 1 (--feature-cache)
+USE_FEATURE_CACHE = False  # Train the head on cached EfficientNetB0 features
+FEATURE_CACHE_VIEWS = 1  # Augmented views per training image
+FEATURE_CACHE_AUGMENT = True  # Apply training augmentation to the cached views
+FEATURE_CACHE_DIR = MODELS_DIR / "feature_cache"
+
+# Preprocessed dataset cache (decode and resize once, see src/dataset_cache.py)
+USE_DATASET_CACHE = False  # Read uint8 images from the cache instead of decoding JPEGs
+DATASET_CACHE_DIR = MODELS_DIR / "dataset_cache"
+DATASET_CACHE_COMPACT_FRACTION = 0.25  # Rewrite the cache once this share of its rows is unused
+
+# Batch-level augmentation (see src/augmentation.py)
+BATCH_AUGMENTATION = True  # Augment whole batches after batch() instead of per image
+AUGMENT_JIT_COMPILE = False  # XLA-compile the batched augmentation stage
+
+# Dataset index (single os.scandir pass, refreshed by directory mtime)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')  # Matched case-insensitively
+DATASET_INDEX_PATH = MODELS_DIR / "dataset_index.json"
+
+# Persisted train/val/test split (see src/dataset_split.py)
+SPLIT_MANIFEST_PATH = MODELS_DIR / "split_manifest.json"
+SPLIT_HASH_WORKERS = 16  # Threads used to hash new image files
+VALIDATE_IMAGES = True  # Test-decode new images and quarantine the ones that fail
+SKIP_CORRUPT_IMAGES = True  # Drop (and count) images that fail to decode during training
+
+# Dataset deduplication (see src/dataset_dedup.py)
+USE_DEDUP = True  # Train/evaluate on one image per duplicate cluster
+DEDUP_HAMMING_THRESHOLD = 3  # Max differing dHash bits for near-duplicates
+DEDUP_DROP_CONFLICTS = True  # Drop clusters whose images carry different labels
+DEDUP_WORKERS = None  # Processes for perceptual hashing (None = all cores)
+DEDUP_DIR = MODELS_DIR / "dedup"
+
+# Sequential TFRecord shards (see src/dataset_shards.py)
+USE_SHARDS = False  # Stream encoded images from shards instead of individual files
+SHARD_DIR = MODELS_DIR / "shards"
+SHARD_SIZE_MB = 256  # Target size of one shard
+SHARD_CYCLE_LENGTH = 8  # Shards read concurrently
+SHARD_SHUFFLE_BUFFER = 2048  # Example-level shuffle buffer after interleaving
+
+# Input pipeline tuning (see src/pipeline_profiler.py)
+PIPELINE_NUM_PARALLEL_CALLS = None  # Parallel map calls (None = tf.data.AUTOTUNE)
+SHUFFLE_BUFFER_SIZE = 1000  # Shuffle buffer of the file-path pipelines
+PREFETCH_BUFFER_SIZE = None  # Batches to prefetch (None = tf.data.AUTOTUNE)
+PRIVATE_THREADPOOL_SIZE = 0  # Dedicated tf.data thread pool size (0 = shared pool)
+DETERMINISTIC_PIPELINE = True  # False lets parallel stages return elements out of order
+PIPELINE_TUNING_PATH = MODELS_DIR / "pipeline_tuning.json"
+
+# Hyperparameter sweep (see src/hyperparameter_sweep.py)
+SWEEP_SPACE = {  # Values tried per config setting
+    'LEARNING_RATE': [0.00003, 0.0001, 0.0003, 0.001],
+    'LABEL_SMOOTHING': [0.0, 0.1, 0.2],
+    'FINE_TUNE_LAYERS': [20, 50, 100],
+    'HEAD_DROPOUT': [0.2, 0.4, 0.5],
+    'BATCH_SIZE': [16, 32]
+}
+SWEEP_TRIALS = 12  # Configurations sampled from SWEEP_SPACE
+SWEEP_WORKERS = 2  # Trials trained in parallel
+SWEEP_THREADS_PER_TRIAL = None  # CPU threads per trial (None = cores / SWEEP_WORKERS)
+SWEEP_MEMORY_LIMIT_MB = 8192  # A trial whose resident memory exceeds this is stopped
+SWEEP_MIN_EPOCHS = 1  # First pruning rung (epochs)
+SWEEP_REDUCTION_FACTOR = 3  # Only the top 1/3 of trials continue past each rung
+SWEEP_DIR = MODELS_DIR / "sweeps"
+SWEEP_DB_PATH = SWEEP_DIR / "sweep.db"
+
+# Time-budgeted training (--time-budget, see src/training_budget.py)
+TIME_BUDGET_MINUTES = None  # Whole run incl. data loading and final evaluation; None = no budget
+BUDGET_FINE_TUNE_COST_RATIO = 2.0  # Assumed stage 2 / stage 1 epoch time until stage 2 is measured
+BUDGET_SAVE_SECONDS = 60  # Kept back at the end of each stage for saving models and plots
+BUDGET_EXPORT_SECONDS = 30  # Kept back per serving export (rebuild, save, latency runs), plus its test evaluation
+
+# Progressive resizing and multi-resolution serving (see src/progressive_resizing.py)
+PROGRESSIVE_RESIZING = False  # Early stage 1 epochs on smaller images (--progressive)
+PROGRESSIVE_SIZES = [(128, 128), (160, 160)]  # Sizes before IMAGE_SIZE, smallest first
+PROGRESSIVE_FULL_SIZE_FRACTION = 0.3  # Last share of stage 1 epochs at IMAGE_SIZE
+EXPORT_IMAGE_SIZES = [(160, 160), (192, 192)]  # Extra serving models saved after training
+SERVING_IMAGE_SIZE = None  # Model the API loads (e.g. (160, 160)); None = IMAGE_SIZE
+
+# Class-balanced sampling (alternative to class weights)
+TRAIN_SAMPLING = 'shuffle'  # 'shuffle' = every image once per epoch; 'balanced' = per-class streams
+SAMPLER_CLASS_POWER = 0.0  # Class share ~ count**power (0 = equal shares, 1 = as in the data)
+SAMPLER_STEPS_PER_EPOCH = None  # None = enough steps to draw the median class size per class
+
+# Per-machine overrides written by `python src/pipeline_profiler.py --apply`
+if PIPELINE_TUNING_PATH.exists():
+    with open(PIPELINE_TUNING_PATH, 'r') as _f:
+        globals().update(json.load(_f)['settings'])
+
@@ -0,0 +1,219 @@
+"""
+Batch-level vectorized data augmentation
+Applies the same augmentations as augment_image (flip, rot90, brightness,
+contrast, saturation, hue, random zoom) to a whole batch at once, with
+per-sample random parameters and no data-dependent Python branches, so the
+stage can be fused and optionally XLA-compiled.
+"""
+import sys
+import argparse
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+
+
+# NumPy constants, so importing the module does not start the TensorFlow runtime
+# (MultiWorkerMirroredStrategy must be created before any op runs)
+_RGB_TO_YIQ = np.array([[0.299, 0.587, 0.114],
+                        [0.596, -0.274, -0.322],
+                        [0.211, -0.523, 0.312]], dtype=np.float32)
+_YIQ_TO_RGB = np.linalg.inv(_RGB_TO_YIQ).astype(np.float32)
+
+
+def _select(mask, if_true, if_false):
+    """Per-sample select written as a blend (much cheaper than a broadcast tf.where on CPU)"""
+    return if_false + mask * (if_true - if_false)
+
+
+def _gather_rows(images, coords):
+    """Bilinearly sample the rows of each image at fractional per-sample coordinates"""
+    size = tf.shape(images)[1]
+    coords = tf.clip_by_value(coords, 0.0, tf.cast(size - 1, tf.float32))
+    
+    lower = tf.floor(coords)
+    weight = coords - lower
+    lower = tf.cast(lower, tf.int32)
+    upper = tf.minimum(lower + 1, size - 1)
+    
+    lower_values = tf.gather(images, lower, axis=1, batch_dims=1)
+    upper_values = tf.gather(images, upper, axis=1, batch_dims=1)
+    
+    return lower_values + (upper_values - lower_values) * weight[:, :, None, None]
+
+
+def _sample_coords(size, crop, offset, flip):
+    """
+    Source coordinates along one axis for a crop window resized to the full size
+    
+    Half-pixel centred like tf.image.resize; flipped samples read the window
+    back to front.
+    """
+    positions = tf.range(size)[None, :]
+    positions = tf.where(flip[:, None], size - 1.0 - positions, positions)
+    return offset[:, None] + (positions + 0.5) * crop[:, None] - 0.5
+
+
+def _color_matrices(batch_size):
+    """
+    Per-sample RGB matrices applying random saturation and hue
+    
+    Hue is rotated and saturation scaled on the chroma plane of YIQ, so both
+    adjustments become a single 3x3 matrix per image.
+    """
+    saturation = tf.random.uniform([batch_size], 0.8, 1.2)
+    angle = tf.random.uniform([batch_size], -0.1, 0.1) * 2.0 * np.pi
+    cos, sin = tf.cos(angle) * saturation, tf.sin(angle) * saturation
+    ones, zeros = tf.ones_like(cos), tf.zeros_like(cos)
+    
+    chroma = tf.stack([
+        tf.stack([ones, zeros, zeros], axis=-1),
+        tf.stack([zeros, cos, -sin], axis=-1),
+        tf.stack([zeros, sin, cos], axis=-1)
+    ], axis=1)
+    
+    return tf.matmul(_YIQ_TO_RGB, tf.matmul(chroma, _RGB_TO_YIQ))
+
+
+def _random_color(images):
+    """
+    Random brightness, contrast, saturation and hue as one affine map per image
+    
+    brightness: p + b, contrast: c * (p - mean) + mean, then the colour
+    matrix M, which together is c * M @ p + M @ ((1 - c) * mean + b).
+    """
+    batch_size = tf.shape(images)[0]
+    pixels = tf.reshape(images, [batch_size, -1, 3])
+    
+    brightness = tf.random.uniform([batch_size, 1, 1], -0.2, 0.2)
+    contrast = tf.random.uniform([batch_size, 1, 1], 0.8, 1.2)
+    matrices = _color_matrices(batch_size)
+    
+    mean = tf.reduce_mean(pixels, axis=1, keepdims=True)
+    offset = tf.matmul((1.0 - contrast) * mean + brightness, matrices, transpose_b=True)
+    pixels = tf.matmul(pixels, contrast * matrices, transpose_b=True) + offset
+    
+    return tf.reshape(pixels, tf.shape(images))
+
+
+def _random_geometry(images):
+    """
+    Random flip, rotation (multiples of 90 degrees) and zoom in one resampling
+    
+    A random transpose plus independent row and column reversals covers the
+    same eight orientations as a flip followed by rot90. Half of the batch is
+    also zoomed by up to 20% (crop and resize). Both axes are resampled with
+    row gathers, transposing in between; whether the result is transposed back
+    is the random transpose, which is only possible for square images.
+    """
+    batch_size = tf.shape(images)[0]
+    height, width = images.shape[1], images.shape[2]
+    height_f = tf.cast(tf.shape(images)[1], tf.float32)
+    width_f = tf.cast(tf.shape(images)[2], tf.float32)
+    
+    zoom = tf.random.uniform([batch_size]) < 0.5
+    crop = tf.where(zoom, tf.random.uniform([batch_size], 0.8, 1.0), 1.0)
+    top = tf.random.uniform([batch_size]) * (1.0 - crop) * height_f
+    left = tf.random.uniform([batch_size]) * (1.0 - crop) * width_f
+    
+    rows = _sample_coords(height_f, crop, top, tf.random.uniform([batch_size]) < 0.5)
+    cols = _sample_coords(width_f, crop, left, tf.random.uniform([batch_size]) < 0.5)
+    
+    transposed = _gather_rows(tf.transpose(_gather_rows(images, rows), [0, 2, 1, 3]), cols)
+    images = tf.transpose(transposed, [0, 2, 1, 3])
+    
+    if height is not None and height == width:
+        transpose = tf.cast(tf.random.uniform([batch_size, 1, 1, 1]) < 0.5, tf.float32)
+        images = _select(transpose, transposed, images)
+    
+    return images
+
+
+def augment_batch(images):
+    """
+    Augment a batch of float32 images in [0, 255]
+    
+    Same augmentations as augment_image (flip, rot90, brightness, contrast,
+    saturation, hue, random zoom) with independent parameters per sample.
+    
+    Args:
+        images: Tensor of shape (batch, height, width, 3)
+    
+    Returns:
+        Augmented images of the same shape, clipped to [0, 255]
+    """
+    images = tf.cast(images, tf.float32)
+    
+    # Colour first: the contrast mean is taken over the whole image, as before
+    images = _random_color(images)
+    images = _random_geometry(images)
+    
+    # Ensure values are valid
+    return tf.clip_by_value(images, 0.0, 255.0)
+
+
+# Compiled once per process; XLA fuses the whole augmentation stage
+augment_batch_compiled = tf.function(augment_batch, jit_compile=config.AUGMENT_JIT_COMPILE)
+
+
+def benchmark_augmentation(num_images: int = 2048, batch_size: int = None) -> dict:
+    """
+    Compare per-image augmentation in dataset.map with the batched stage
+    
+    Uses synthetic images so only the augmentation cost is measured.
+    
+    Returns:
+        Images per second for each variant
+    """
+    from src.data_preprocessing import augment_image
+    from src.dataset_cache import measure_throughput
+    
+    batch_size = batch_size or config.BATCH_SIZE
+    num_batches = max(num_images // batch_size, 2)
+    image = tf.random.uniform([*config.IMAGE_SIZE, 3], 0.0, 255.0)
+    batch = tf.random.uniform([batch_size, *config.IMAGE_SIZE, 3], 0.0, 255.0)
+    
+    per_image_ds = (tf.data.Dataset.from_tensors((image, 0))
+                    .repeat(num_batches * batch_size)
+                    .map(lambda x, y: (augment_image(x), y), num_parallel_calls=tf.data.AUTOTUNE)
+                    .batch(batch_size)
+                    .prefetch(tf.data.AUTOTUNE))
+    
+    results = {'per_image': measure_throughput(per_image_ds, num_batches)}
+    
+    for name, jit in (('batched', False), ('batched_xla', True)):
+        fn = tf.function(augment_batch, jit_compile=jit)
+        batched_ds = (tf.data.Dataset.from_tensors((batch, tf.zeros([batch_size], tf.int32)))
+                      .repeat(num_batches)
+                      .map(lambda x, y: (fn(x), y), num_parallel_calls=tf.data.AUTOTUNE)
+                      .prefetch(tf.data.AUTOTUNE))
+        try:
+            results[name] = measure_throughput(batched_ds, num_batches)
+        except (tf.errors.InvalidArgumentError, tf.errors.UnimplementedError) as e:
+            print(f"⚠️  {name} unavailable: {e.message.splitlines()[0]}")
+    
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark per-image vs batched augmentation')
+    parser.add_argument('--images', type=int, default=2048,
+                       help='Number of images to push through each pipeline')
+    
+    args = parser.parse_args()
+    
+    print("=" * 80)
+    print("🌱 AgriSense AI - Augmentation Throughput")
+    print("=" * 80)
+    
+    results = benchmark_augmentation(args.images)
+    
+    print(f"\n{'Pipeline':<20} {'Images/sec':>12}")
+    print("-" * 34)
+    for name, rate in results.items():
+        print(f"{name:<20} {rate:>12,.0f}")
+    print("-" * 34)
+    print(f"  - Batched speedup: {results.get('batched', 0) / results['per_image']:.2f}x")
@@ -0,0 +1,192 @@
+"""
+Cascade threshold calibration for Plant Disease Detection
+Picks the fast-model confidence threshold that meets a target validation
+accuracy with the fewest escalations, and reports the resulting average cost
+"""
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+from src.data_preprocessing import setup_gpu, create_tf_dataset
+from src.dataset_split import load_split
+from src.inference import resize_batch_for_model
+
+
+def collect_validation_outputs(fast_model, full_model, val_ds):
+    """
+    Run both models over the validation set
+    
+    Returns:
+        fast_probs, full_probs, labels, fast_ms_per_image, full_ms_per_image
+    """
+    fast_probs, full_probs, labels = [], [], []
+    fast_time, full_time = 0.0, 0.0
+    warmed_up = False
+    
+    for images, batch_labels in val_ds:
+        images = images.numpy()
+        fast_input = resize_batch_for_model(fast_model, images)
+        
+        # Exclude graph tracing from the latency measurement
+        if not warmed_up:
+            fast_model.predict_on_batch(fast_input)
+            full_model.predict_on_batch(images)
+            warmed_up = True
+        
+        start = time.perf_counter()
+        fast_probs.append(np.asarray(fast_model.predict_on_batch(fast_input)))
+        fast_time += time.perf_counter() - start
+        
+        start = time.perf_counter()
+        full_probs.append(np.asarray(full_model.predict_on_batch(images)))
+        full_time += time.perf_counter() - start
+        
+        labels.append(batch_labels.numpy())
+    
+    labels = np.concatenate(labels)
+    n = max(len(labels), 1)
+    
+    return (np.concatenate(fast_probs), np.concatenate(full_probs), labels,
+            fast_time * 1000 / n, full_time * 1000 / n)
+
+
+def choose_threshold(fast_probs: np.ndarray, full_probs: np.ndarray,
+                     labels: np.ndarray, target_accuracy: float) -> dict:
+    """
+    Pick the lowest threshold whose cascade accuracy meets the target
+    
+    Images are ranked by fast-model confidence; accepting the i most confident
+    ones from the fast model and escalating the rest gives a cascade accuracy
+    that is evaluated for every i at once with cumulative sums.
+    
+    Args:
+        fast_probs: Fast model probabilities (n, num_classes)
+        full_probs: Full model probabilities (n, num_classes)
+        labels: True labels (n,)
+        target_accuracy: Required cascade accuracy
+    
+    Returns:
+        Dictionary with threshold, accuracy and escalation rate
+    """
+    confidence = fast_probs.max(axis=1)
+    fast_correct = (fast_probs.argmax(axis=1) == labels).astype(np.int64)
+    full_correct = (full_probs.argmax(axis=1) == labels).astype(np.int64)
+    
+    order = np.argsort(-confidence, kind='stable')
+    confidence = confidence[order]
+    fast_correct = fast_correct[order]
+    full_correct = full_correct[order]
+    n = len(labels)
+    
+    # accuracy[i] = accept the first i images from the fast model
+    fast_hits = np.concatenate([[0], np.cumsum(fast_correct)])
+    full_hits = np.concatenate([[0], np.cumsum(full_correct)])
+    accuracy = (fast_hits + (full_hits[-1] - full_hits)) / n
+    
+    # A threshold can only split between distinct confidence values
+    valid = np.ones(n + 1, dtype=bool)
+    valid[1:n] = confidence[:-1] > confidence[1:]
+    
+    meets_target = np.flatnonzero(valid & (accuracy >= target_accuracy))
+    if len(meets_target):
+        accepted = int(meets_target[-1])
+        target_met = True
+    else:
+        # Target unreachable: fall back to the most accurate split
+        accepted = int(np.flatnonzero(valid)[np.argmax(accuracy[valid])])
+        target_met = False
+    
+    threshold = float(confidence[accepted - 1]) if accepted > 0 else 1.01
+    
+    return {
+        'threshold': threshold,
+        'target_accuracy': target_accuracy,
+        'target_met': target_met,
+        'cascade_accuracy': float(accuracy[accepted]),
+        'fast_accuracy': float(fast_hits[-1] / n),
+        'full_accuracy': float(full_hits[-1] / n),
+        'escalation_rate': float((n - accepted) / n)
+    }
+
+
+def calibrate_cascade(target_accuracy: float = None, fast_model_path: Path = None) -> dict:
+    """
+    Calibrate the cascade threshold on the validation split and save it
+    
+    Args:
+        target_accuracy: Required cascade accuracy (defaults to config)
+        fast_model_path: Path to the fast model (defaults to config)
+    
+    Returns:
+        Calibration results
+    """
+    print("=" * 80)
+    print("🌱 AgriSense AI - Cascade Calibration")
+    print("=" * 80)
+    
+    target_accuracy = target_accuracy or config.CASCADE_TARGET_ACCURACY
+    fast_model_path = fast_model_path or config.FAST_MODEL_H5_PATH
+    
+    setup_gpu()
+    
+    print(f"\n📦 Loading full model from {config.MODEL_H5_PATH}")
+    full_model = tf.keras.models.load_model(config.MODEL_H5_PATH)
+    print(f"📦 Loading fast model from {fast_model_path}")
+    fast_model = tf.keras.models.load_model(fast_model_path)
+    
+    val_paths, val_labels, _ = load_split(config.DATA_DIR, 'val')
+    val_ds = create_tf_dataset(val_paths, val_labels, is_training=False, split='val')
+    
+    print("\n🔄 Scoring validation set with both models...")
+    fast_probs, full_probs, labels, fast_ms, full_ms = collect_validation_outputs(
+        fast_model, full_model, val_ds
+    )
+    
+    results = choose_threshold(fast_probs, full_probs, labels, target_accuracy)
+    
+    # Every image pays for the fast model, escalated ones also for the full model
+    average_ms = fast_ms + results['escalation_rate'] * full_ms
+    results.update({
+        'fast_model_path': str(fast_model_path),
+        'validation_samples': int(len(labels)),
+        'fast_ms_per_image': fast_ms,
+        'full_ms_per_image': full_ms,
+        'cascade_ms_per_image': average_ms,
+        'speedup_vs_full': full_ms / average_ms if average_ms > 0 else None
+    })
+    
+    with open(config.CASCADE_CONFIG_PATH, 'w') as f:
+        json.dump(results, f, indent=4)
+    
+    print(f"\n🎯 Cascade Calibration:")
+    print(f"  - Threshold: {results['threshold']:.4f}")
+    print(f"  - Target accuracy: {target_accuracy*100:.2f}% "
+          f"({'met' if results['target_met'] else 'NOT met'})")
+    print(f"  - Cascade accuracy: {results['cascade_accuracy']*100:.2f}%")
+    print(f"  - Fast / full accuracy: {results['fast_accuracy']*100:.2f}% / "
+          f"{results['full_accuracy']*100:.2f}%")
+    print(f"  - Escalation rate: {results['escalation_rate']*100:.1f}%")
+    print(f"  - Avg cost: {average_ms:.2f} ms/image "
+          f"(full model: {full_ms:.2f} ms, fast model: {fast_ms:.2f} ms)")
+    print(f"\n✓ Cascade config saved to {config.CASCADE_CONFIG_PATH}")
+    
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Calibrate the fast/full model cascade')
+    parser.add_argument('--target-accuracy', type=float, default=None,
+                       help='Required validation accuracy of the cascade')
+    parser.add_argument('--fast-model', type=Path, default=None,
+                       help='Path to the fast first-tier model')
+    
+    args = parser.parse_args()
+    
+    calibrate_cascade(args.target_accuracy, args.fast_model)
@@ -0,0 +1,348 @@
+"""
+Resumable training checkpoints
+Saves model weights, optimizer state and the position in the epoch so an
+interrupted run continues where it stopped instead of starting over. The
+training thread only copies the variables to host memory; writing the files
+happens in a background thread, and only the last few checkpoints are kept.
+The end of stage 1 is stored as its own checkpoint, so a two-stage run that
+is interrupted while fine-tuning does not repeat stage 1.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import numpy as np
+import tensorflow as tf
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+
+
+def _checkpoint_metas() -> list:
+    """Metadata of every complete checkpoint on disk, oldest first"""
+    if not config.CHECKPOINT_DIR.exists():
+        return []
+    
+    metas = []
+    # The .json is written after the .npz, so its presence marks a finished checkpoint
+    for meta_path in sorted(config.CHECKPOINT_DIR.glob('ckpt-*.json')):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        meta['path'] = str(meta_path.with_suffix('.npz'))
+        metas.append(meta)
+    
+    return metas
+
+
+def _next_sequence() -> int:
+    """Sequence number for the next checkpoint"""
+    metas = _checkpoint_metas()
+    return metas[-1]['sequence'] + 1 if metas else 0
+
+
+def _write_npz(path: Path, arrays: dict):
+    """Atomically write arrays to an .npz file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.npz.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _write_checkpoint(meta: dict, weights: list, optimizer_variables: list):
+    """Write one checkpoint (.npz with the variables, then .json with the metadata)"""
+    name = f"ckpt-{meta['sequence']:06d}"
+    
+    arrays = {f'w{i}': w for i, w in enumerate(weights)}
+    arrays.update({f'o{i}': v for i, v in enumerate(optimizer_variables)})
+    _write_npz(config.CHECKPOINT_DIR / f"{name}.npz", arrays)
+    
+    tmp_path = config.CHECKPOINT_DIR / f"{name}.json.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, config.CHECKPOINT_DIR / f"{name}.json")
+
+
+def _prune_checkpoints(keep: int):
+    """Delete all but the newest `keep` in-stage checkpoints (stage ends are kept)"""
+    in_stage = [meta for meta in _checkpoint_metas() if not meta['complete']]
+    for meta in in_stage[:max(len(in_stage) - keep, 0)]:
+        npz_path = Path(meta['path'])
+        npz_path.with_suffix('.json').unlink()
+        npz_path.unlink(missing_ok=True)
+
+
+def _snapshot(model: tf.keras.Model, include_optimizer: bool = True) -> tuple:
+    """Host copies of the model weights and (if built) the optimizer variables"""
+    weights = model.get_weights()
+    optimizer_variables = []
+    if include_optimizer and model.optimizer is not None and model.optimizer.built:
+        optimizer_variables = [v.numpy() for v in model.optimizer.variables]
+    return weights, optimizer_variables
+
+
+class AsyncCheckpoint(tf.keras.callbacks.Callback):
+    """
+    Checkpoint weights, optimizer state and epoch/step position in a background thread
+    
+    A checkpoint is taken at the end of every epoch and, with every_steps, also
+    every N steps within an epoch. Only the host copy of the variables is made
+    on the training thread; at most one write is in flight at a time.
+    
+    The best weights (by `monitor`) are kept in memory and on disk, and written
+    once as a full model to best_path when training ends, instead of a full
+    model save every time the metric improves.
+    """
+    
+    def __init__(self, stage: str, keep: int = None, every_steps: int = None,
+                 best_path: Optional[Path] = None, monitor: str = 'val_accuracy'):
+        super().__init__()
+        self.stage = stage
+        self.keep = keep or config.CHECKPOINTS_TO_KEEP
+        self.every_steps = config.CHECKPOINT_EVERY_STEPS if every_steps is None else every_steps
+        self.best_path = best_path
+        self.monitor = monitor
+        self.history = {}
+        self.best = -np.inf
+        self._best_weights = None
+        self._elapsed_offset = 0.0
+        self._step_offset = 0
+        self._epoch = 0
+        self._steps_per_epoch = None
+        self._executor = None
+        self._pending = None
+        self._sequence = -1
+    
+    def resume_from(self, state: dict):
+        """Continue the history, timing, best metric and step count of a checkpoint"""
+        self.history = {k: list(v) for k, v in state['history'].items()}
+        self._elapsed_offset = state['elapsed_seconds']
+        self._step_offset = state['step']
+        self._steps_per_epoch = state.get('steps_per_epoch')
+        if state.get('best') is not None:
+            self.best = state['best']
+    
+    def _best_weights_path(self) -> Path:
+        return config.CHECKPOINT_DIR / f"best-{self.stage}.npz"
+    
+    def _submit(self, fn, *args):
+        """Queue a write, waiting for the previous one first (bounds host memory)"""
+        if self._pending is not None:
+            self._pending.result()
+        self._pending = self._executor.submit(fn, *args)
+    
+    def _save(self, epoch: int, step: int):
+        weights, optimizer_variables = _snapshot(self.model)
+        meta = {
+            'sequence': self._sequence + 1,
+            'stage': self.stage,
+            'epoch': epoch,
+            'step': step,
+            'steps_per_epoch': self._steps_per_epoch,
+            'complete': False,
+            'history': {k: list(v) for k, v in self.history.items()},
+            'elapsed_seconds': self._elapsed_offset + time.time() - self._train_start,
+            'best': None if np.isinf(self.best) else float(self.best),
+            'timestamp': datetime.now().isoformat()
+        }
+        self._sequence = meta['sequence']
+        
+        def write():
+            _write_checkpoint(meta, weights, optimizer_variables)
+            _prune_checkpoints(self.keep)
+        
+        self._submit(write)
+    
+    def on_train_begin(self, logs=None):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+        self._train_start = time.time()
+        self._last_step = 0
+        self._sequence = _next_sequence() - 1
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = epoch
+    
+    def on_train_batch_end(self, batch, logs=None):
+        step = self._step_offset + batch + 1
+        self._last_step = step
+        if self.every_steps and step % self.every_steps == 0:
+            self._save(self._epoch, step)
+    
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        # Datasets with unknown cardinality only reveal their length after an epoch
+        self._steps_per_epoch = self._last_step
+        self._step_offset = 0
+        for key, value in logs.items():
+            self.history.setdefault(key, []).append(float(value))
+        
+        current = logs.get(self.monitor)
+        if current is not None and current > self.best:
+            self.best = float(current)
+            self._best_weights = self.model.get_weights()
+            arrays = {f'w{i}': w for i, w in enumerate(self._best_weights)}
+            self._submit(_write_npz, self._best_weights_path(), arrays)
+        
+        self._save(epoch + 1, 0)
+        print(f"\n💾 Checkpoint queued ({self.stage}, epoch {epoch + 1})")
+    
+    def on_train_end(self, logs=None):
+        if self._pending is not None:
+            self._pending.result()
+        self._executor.shutdown()
+        
+        if self.best_path is None:
+            return
+        
+        best = self._best_weights
+        if best is None and self._best_weights_path().exists():
+            with np.load(self._best_weights_path()) as data:
+                best = [data[f'w{i}'] for i in range(len(data.files))]
+        if best is None:
+            return
+        
+        current = self.model.get_weights()
+        self.model.set_weights(best)
+        self.model.save(self.best_path)
+        self.model.set_weights(current)
+        print(f"✓ Best {self.stage} model ({self.monitor}={self.best:.4f}) saved to {self.best_path}")
+
+
+def latest_checkpoint() -> Optional[dict]:
+    """Metadata of the newest checkpoint (None if there is none)"""
+    metas = _checkpoint_metas()
+    return metas[-1] if metas else None
+
+
+def completed_stage(stage: str) -> Optional[dict]:
+    """Metadata of the end-of-stage checkpoint of a stage (None if the stage did not finish)"""
+    for meta in reversed(_checkpoint_metas()):
+        if meta['stage'] == stage and meta['complete']:
+            return meta
+    return None
+
+
+def save_stage_checkpoint(model: tf.keras.Model, stage: str, history: dict, elapsed_seconds: float):
+    """
+    Mark a stage as finished with the model weights at its end
+    
+    Stage checkpoints are exempt from pruning; the optimizer state is not
+    stored because the next stage compiles a fresh optimizer.
+    """
+    weights, _ = _snapshot(model, include_optimizer=False)
+    meta = {
+        'sequence': _next_sequence(),
+        'stage': stage,
+        'epoch': len(history.get('loss', [])),
+        'step': 0,
+        'complete': True,
+        'history': {k: [float(v) for v in values] for k, values in history.items()},
+        'elapsed_seconds': elapsed_seconds,
+        'best': None,
+        'timestamp': datetime.now().isoformat()
+    }
+    _write_checkpoint(meta, weights, [])
+    print(f"💾 {stage} checkpoint saved (an interrupted run continues from here)")
+
+
+def clear_checkpoints():
+    """Remove the checkpoints of a finished run (or of one started over with --fresh)"""
+    if config.CHECKPOINT_DIR.exists():
+        shutil.rmtree(config.CHECKPOINT_DIR)
+
+
+def restore_checkpoint(model: tf.keras.Model, state: dict):
+    """
+    Load the weights and optimizer state of a checkpoint into a compiled model
+    
+    The model must be built and compiled the same way as when the checkpoint
+    was taken (same stage, same trainable layers).
+    """
+    with np.load(state['path']) as data:
+        num_weights = sum(name.startswith('w') for name in data.files)
+        num_optimizer = sum(name.startswith('o') for name in data.files)
+        weights = [data[f'w{i}'] for i in range(num_weights)]
+        optimizer_variables = [data[f'o{i}'] for i in range(num_optimizer)]
+    
+    model.set_weights(weights)
+    
+    if optimizer_variables:
+        optimizer = model.optimizer
+        if not optimizer.built:
+            optimizer.build(model.trainable_variables)
+        if len(optimizer.variables) != len(optimizer_variables):
+            raise ValueError(
+                f"Checkpoint has {len(optimizer_variables)} optimizer variables, the model's optimizer "
+                f"{len(optimizer.variables)}. Resume with the same settings as the interrupted run."
+            )
+        for variable, value in zip(optimizer.variables, optimizer_variables):
+            variable.assign(value)
+    
+    print(f"✓ Restored {Path(state['path']).name} ({state['stage']}, epoch {state['epoch']}, "
+          f"step {state['step']})")
+
+
+def fit_resumable(model: tf.keras.Model, train_data, epochs: int, callbacks: list,
+                  state: Optional[dict] = None, **fit_kwargs):
+    """
+    model.fit that continues from a checkpoint of the same stage
+    
+    An epoch that was interrupted is finished with its remaining number of
+    steps (taken from a freshly shuffled pass, not the exact batches that were
+    left), then training continues at the next epoch.
+    
+    Args:
+        model: Compiled model
+        train_data: Training dataset
+        epochs: Total epochs of the stage
+        callbacks: Callbacks, including an AsyncCheckpoint
+        state: Checkpoint metadata to continue from (None starts the stage fresh)
+        **fit_kwargs: Passed on to model.fit
+    
+    Returns:
+        History covering the whole stage
+    """
+    if state is None:
+        return model.fit(train_data, epochs=epochs, callbacks=callbacks, **fit_kwargs)
+    
+    restore_checkpoint(model, state)
+    for callback in callbacks:
+        if isinstance(callback, AsyncCheckpoint):
+            callback.resume_from(state)
+    
+    history = {k: list(v) for k, v in state['history'].items()}
+    epoch, step = state['epoch'], state['step']
+    
+    def fit(**kwargs):
+        result = model.fit(train_data, callbacks=callbacks, **{**fit_kwargs, **kwargs})
+        for key, values in result.history.items():
+            history.setdefault(key, []).extend(values)
+    
+    steps_per_epoch = fit_kwargs.get('steps_per_epoch') or state.get('steps_per_epoch')
+    if step and not steps_per_epoch and train_data.cardinality() >= 0:
+        steps_per_epoch = int(train_data.cardinality())
+    
+    if step and steps_per_epoch:
+        print(f"\n⏩ Finishing epoch {epoch + 1} ({steps_per_epoch - step} of {steps_per_epoch} steps left)")
+        fit(epochs=epoch + 1, initial_epoch=epoch, steps_per_epoch=steps_per_epoch - step)
+        epoch += 1
+    elif step:
+        # Length of the epoch is unknown (no full epoch yet), so it is repeated
+        print(f"\n⏩ Repeating epoch {epoch + 1} (epoch length not known yet)")
+        for callback in callbacks:
+            if isinstance(callback, AsyncCheckpoint):
+                callback._step_offset = 0
+    
+    if epoch < epochs:
+        fit(epochs=epochs, initial_epoch=epoch)
+    
+    result = tf.keras.callbacks.History()
+    result.history = history
+    return result
@@ -14,6 +14,7 @@ from collections import Counter
 sys.path.append(str(Path(__file__).parent.parent))
 import config
 from src.data_preprocessing import get_class_names
+from src.dataset_index import load_dataset_index, list_class_images
 
 
 def analyze_dataset():
@@ -29,7 +30,8 @@ def analyze_dataset():
         return
     
     # Get class information
-    class_names = get_class_names(data_dir)
+    index = load_dataset_index(data_dir)
+    class_names = get_class_names(data_dir, index)
     
     # Collect detailed statistics
     class_stats = {}
@@ -37,9 +39,7 @@ def analyze_dataset():
     
     print("\n🔍 Analyzing images...")
     for class_name in class_names:
-        class_path = data_dir / class_name
-        image_files = list(class_path.glob('*.jpg')) + list(class_path.glob('*.JPG')) + \
-                     list(class_path.glob('*.png')) + list(class_path.glob('*.PNG'))
+        image_files = list_class_images(index, class_name)
         
         class_stats[class_name] = {
             'count': len(image_files),
@@ -138,7 +138,8 @@ def display_sample_images(num_samples: int = 5):
     print("\n🖼️  Displaying sample images from each class...")
     
     data_dir = config.DATA_DIR
-    class_names = get_class_names(data_dir)
+    index = load_dataset_index(data_dir)
+    class_names = get_class_names(data_dir, index)
     
     # Create figure
     num_classes = len(class_names)
@@ -148,8 +149,7 @@ def display_sample_images(num_samples: int = 5):
         axes = axes.reshape(1, -1)
     
     for class_idx, class_name in enumerate(class_names):
-        class_path = data_dir / class_name
-        image_files = list(class_path.glob('*.jpg')) + list(class_path.glob('*.JPG'))
+        image_files = list_class_images(index, class_name)
         
         # Select random samples
         sample_files = np.random.choice(image_files, min(num_samples, len(image_files)), replace=False)
@@ -8,6 +8,11 @@ import tensorflow as tf
 from pathlib import Path
 from typing import Tuple, Dict
 import config
+from src.dataset_cache import update_dataset_cache, open_dataset_cache
+from src.augmentation import augment_batch_compiled
+from src.dataset_index import load_dataset_index, class_counts
+from src.dataset_split import update_split_manifest, get_split
+from src.dataset_dedup import deduplicate
 
 
 def setup_gpu():
@@ -39,19 +44,33 @@ def setup_gpu():
             print(f"GPU configuration error: {e}")
     else:
         print("⚠ No GPU detected, using CPU")
+        
+        # bfloat16 keeps float32's range, so no loss scaling is needed
+        if config.CPU_MIXED_PRECISION and cpu_supports_bfloat16():
+            tf.keras.mixed_precision.set_global_policy('mixed_bfloat16')
+            print("  - Mixed precision: bfloat16 (AVX512_BF16/AMX)")
+
+
+def cpu_supports_bfloat16() -> bool:
+    """Whether the CPU has native bfloat16 instructions (AVX512_BF16 or AMX)"""
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            flags = next((line.split(':', 1)[1].split() for line in f if line.startswith('flags')), [])
+    except OSError:
+        return False
+    
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
 
 
-def get_class_names(data_dir: Path) -> list:
-    """Extract class names from dataset directory structure"""
-    class_names = sorted([d.name for d in data_dir.iterdir() if d.is_dir()])
+def get_class_names(data_dir: Path, index: dict = None) -> list:
+    """Extract class names from the dataset index"""
+    index = index or load_dataset_index(data_dir)
+    class_names = index['class_names']
     print(f"\n📊 Dataset Analysis:")
     print(f"  - Total classes: {len(class_names)}")
     
     # Count images per class
-    for class_name in class_names:
-        class_path = data_dir / class_name
-        image_count = len(list(class_path.glob('*.jpg'))) + len(list(class_path.glob('*.JPG'))) + \
-                     len(list(class_path.glob('*.png'))) + len(list(class_path.glob('*.PNG')))
+    for class_name, image_count in class_counts(index).items():
         print(f"  - {class_name}: {image_count} images")
     
     return class_names
@@ -66,43 +85,20 @@ def create_datasets(data_dir: Path) -> Tuple[tf.data.Dataset, tf.data.Dataset, t
     """
     print("\n🔄 Creating datasets...")
     
-    # Get all image paths and labels
-    image_paths = []
-    labels = []
-    class_names = get_class_names(data_dir)
-    
-    for class_idx, class_name in enumerate(class_names):
-        class_path = data_dir / class_name
-        class_images = list(class_path.glob('*.jpg')) + list(class_path.glob('*.JPG')) + \
-                      list(class_path.glob('*.png')) + list(class_path.glob('*.PNG'))
-        
-        image_paths.extend([str(p) for p in class_images])
-        labels.extend([class_idx] * len(class_images))
-    
-    # Convert to numpy arrays
-    image_paths = np.array(image_paths)
-    labels = np.array(labels)
-    
-    # Shuffle data
-    np.random.seed(config.RANDOM_SEED)
-    indices = np.random.permutation(len(image_paths))
-    image_paths = image_paths[indices]
-    labels = labels[indices]
-    
-    # Split dataset
-    total_size = len(image_paths)
-    test_size = int(total_size * config.TEST_SPLIT)
-    val_size = int(total_size * config.VALIDATION_SPLIT)
-    train_size = total_size - test_size - val_size
+    # Get class names from the dataset index
+    index = load_dataset_index(data_dir)
+    class_names = get_class_names(data_dir, index)
     
-    train_paths = image_paths[:train_size]
-    train_labels = labels[:train_size]
+    # Split assignments are persisted, so adding images never moves existing ones
+    manifest = update_split_manifest(index)
     
-    val_paths = image_paths[train_size:train_size + val_size]
-    val_labels = labels[train_size:train_size + val_size]
+    # Keep one image per exact/near-duplicate cluster
+    if config.USE_DEDUP:
+        manifest = deduplicate(index, manifest)
     
-    test_paths = image_paths[train_size + val_size:]
-    test_labels = labels[train_size + val_size:]
+    train_paths, train_labels = get_split(index, manifest, 'train')
+    val_paths, val_labels = get_split(index, manifest, 'val')
+    test_paths, test_labels = get_split(index, manifest, 'test')
     
     print(f"\n📦 Dataset Split:")
     print(f"  - Training: {len(train_paths)} images")
@@ -110,9 +106,10 @@ def create_datasets(data_dir: Path) -> Tuple[tf.data.Dataset, tf.data.Dataset, t
     print(f"  - Test: {len(test_paths)} images")
     
     # Create TensorFlow datasets
-    train_ds = create_tf_dataset(train_paths, train_labels, is_training=True)
-    val_ds = create_tf_dataset(val_paths, val_labels, is_training=False)
-    test_ds = create_tf_dataset(test_paths, test_labels, is_training=False)
+    sampling = config.TRAIN_SAMPLING
+    train_ds = create_tf_dataset(train_paths, train_labels, is_training=True, split='train', sampling=sampling)
+    val_ds = create_tf_dataset(val_paths, val_labels, is_training=False, split='val')
+    test_ds = create_tf_dataset(test_paths, test_labels, is_training=False, split='test')
     
     # Dataset info
     dataset_info = {
@@ -122,7 +119,19 @@ def create_datasets(data_dir: Path) -> Tuple[tf.data.Dataset, tf.data.Dataset, t
         'val_size': len(val_paths),
         'test_size': len(test_paths),
         'image_size': config.IMAGE_SIZE,
-        'batch_size': config.BATCH_SIZE
+        'batch_size': config.BATCH_SIZE,
+        'sampling': sampling,
+        # Balanced sampling repeats forever, so fit() needs the epoch length
+        'steps_per_epoch': balanced_steps_per_epoch(train_labels) if sampling == 'balanced' else None,
+        'splits': {
+            'train': {'paths': train_paths, 'labels': train_labels},
+            'val': {'paths': val_paths, 'labels': val_labels},
+            'test': {'paths': test_paths, 'labels': test_labels}
+        },
+        'class_counts': {
+            split: np.bincount(split_labels, minlength=len(class_names)).tolist()
+            for split, split_labels in (('train', train_labels), ('val', val_labels), ('test', test_labels))
+        }
     }
     
     # Save class mapping
@@ -146,54 +155,159 @@ def random_rotation(image):
     return tf.convert_to_tensor(image)
 
 
-def load_and_preprocess_image(image_path: str, label: int, is_training: bool = False):
-    """Load and preprocess a single image with advanced augmentation"""
+def parallel_calls() -> int:
+    """Parallelism of the map stages (config.PIPELINE_NUM_PARALLEL_CALLS, default AUTOTUNE)"""
+    return config.PIPELINE_NUM_PARALLEL_CALLS or tf.data.AUTOTUNE
+
+
+def finalize_pipeline(dataset: tf.data.Dataset) -> tf.data.Dataset:
+    """Prefetch and apply the tuned tf.data options from config"""
+    dataset = dataset.prefetch(config.PREFETCH_BUFFER_SIZE or tf.data.AUTOTUNE)
+    
+    options = tf.data.Options()
+    options.deterministic = config.DETERMINISTIC_PIPELINE
+    if config.PRIVATE_THREADPOOL_SIZE:
+        options.threading.private_threadpool_size = config.PRIVATE_THREADPOOL_SIZE
+    
+    return dataset.with_options(options)
+
+
+def decode_and_resize(image_path: str, image_size: Tuple[int, int] = None):
+    """Read, decode and resize a single image (float32 in [0, 255])"""
     # Read image
-    image = tf.io.read_file(image_path)
+    return decode_image_bytes(tf.io.read_file(image_path), image_size)
+
+
+def decode_image_bytes(image, image_size: Tuple[int, int] = None):
+    """Decode and resize encoded image bytes (float32 in [0, 255])"""
+    image_size = image_size or config.IMAGE_SIZE
     
-    # Decode with error handling
-    try:
-        image = tf.image.decode_jpeg(image, channels=3)
-    except:
-        image = tf.image.decode_png(image, channels=3)
+    # One op for JPEG/PNG/GIF/BMP; animations yield their first frame so the rank is always 3
+    image = tf.io.decode_image(image, channels=3, expand_animations=False)
+    image.set_shape([None, None, 3])
     
     # Resize
-    image = tf.image.resize(image, config.IMAGE_SIZE)
+    return tf.image.resize(image, image_size)
+
+
+# Elements decoded and skipped by each pipeline, by name
+_DECODE_COUNTERS = {}
+
+
+def _decode_counters(name: str) -> Tuple[tf.Variable, tf.Variable]:
+    """Seen/skipped counters of one pipeline (created on first use)"""
+    if name not in _DECODE_COUNTERS:
+        _DECODE_COUNTERS[name] = (
+            tf.Variable(0, dtype=tf.int64, trainable=False, name=f'{name}_seen'),
+            tf.Variable(0, dtype=tf.int64, trainable=False, name=f'{name}_skipped')
+        )
+    return _DECODE_COUNTERS[name]
+
+
+def decode_error_counts() -> Dict[str, Dict[str, int]]:
+    """
+    Images skipped because they failed to decode, per pipeline
+    
+    Counts are cumulative since the pipeline was created.
+    
+    Returns:
+        {pipeline name: {'seen', 'decoded', 'skipped'}}
+    """
+    counts = {}
+    for name, (seen, skipped) in _DECODE_COUNTERS.items():
+        seen, skipped = int(seen.numpy()), int(skipped.numpy())
+        counts[name] = {'seen': seen, 'decoded': seen - skipped, 'skipped': skipped}
+    return counts
+
+
+def _decode_or_skip(decode_fn, image_size: Tuple[int, int], name: str):
+    """
+    Map function returning (ok, image, target) instead of failing on a bad image
+    
+    The decode runs in a one-element dataset with ignore_errors(), so a failure
+    leaves it empty; both outcomes are counted at this point of the pipeline.
+    """
+    seen, skipped = _decode_counters(name)
+    image_size = tuple(image_size or config.IMAGE_SIZE)
+    
+    def decode(x, y):
+        decoded = tf.data.Dataset.from_tensors(x).map(lambda item: decode_fn(item, image_size)).ignore_errors()
+        ok, image = decoded.reduce(
+            (tf.constant(False), tf.zeros([*image_size, 3], tf.float32)),
+            lambda state, image: (tf.constant(True), image)
+        )
+        seen.assign_add(1)
+        skipped.assign_add(tf.cast(tf.logical_not(ok), tf.int64))
+        return ok, image, y
+    return decode
+
+
+class DecodeErrorMonitor(tf.keras.callbacks.Callback):
+    """Reports images skipped by the input pipelines after every epoch"""
+    
+    def __init__(self):
+        super().__init__()
+        self.reported = {}
+    
+    def on_epoch_end(self, epoch, logs=None):
+        counts = decode_error_counts()
+        for name, count in counts.items():
+            new = count['skipped'] - self.reported.get(name, 0)
+            if new > 0:
+                print(f"\n⚠️  {new} undecodable images skipped in the '{name}' pipeline "
+                      f"({count['skipped']} in total)")
+            self.reported[name] = count['skipped']
+        
+        if logs is not None:
+            logs['skipped_images'] = sum(count['skipped'] for count in counts.values())
+
+
+def augment_image(image, image_size: Tuple[int, int] = None):
+    """Advanced data augmentation for a single float32 image in [0, 255]"""
+    image_size = image_size or config.IMAGE_SIZE
+    
+    # Random horizontal flip
+    image = tf.image.random_flip_left_right(image)
+    
+    # Random rotation (using rot90 for simplicity)
+    image = tf.image.rot90(image, k=tf.random.uniform(shape=[], minval=0, maxval=4, dtype=tf.int32))
+    
+    # Random brightness
+    image = tf.image.random_brightness(image, 0.2)
+    
+    # Random contrast
+    image = tf.image.random_contrast(image, 0.8, 1.2)
+    
+    # Random saturation
+    image = tf.image.random_saturation(image, 0.8, 1.2)
+    
+    # Random hue
+    image = tf.image.random_hue(image, 0.1)
+    
+    # Random zoom (via crop and resize)
+    if tf.random.uniform([]) > 0.5:
+        # Zoom in by cropping then resizing
+        crop_size = tf.random.uniform([], 0.8, 1.0)
+        crop_h = tf.cast(image_size[0] * crop_size, tf.int32)
+        crop_w = tf.cast(image_size[1] * crop_size, tf.int32)
+        image = tf.image.random_crop(
+            tf.cast(image, tf.uint8),
+            size=[crop_h, crop_w, 3]
+        )
+        image = tf.image.resize(image, image_size)
+    
+    # Ensure values are valid
+    return tf.clip_by_value(image, 0.0, 255.0)
+
+
+def load_and_preprocess_image(image_path: str, label: int, is_training: bool = False,
+                              image_size: Tuple[int, int] = None):
+    """Load and preprocess a single image with advanced augmentation"""
+    image = decode_and_resize(image_path, image_size)
     
     # Advanced data augmentation for training
     if is_training:
-        # Random horizontal flip
-        image = tf.image.random_flip_left_right(image)
-        
-        # Random rotation (using rot90 for simplicity)
-        image = tf.image.rot90(image, k=tf.random.uniform(shape=[], minval=0, maxval=4, dtype=tf.int32))
-        
-        # Random brightness
-        image = tf.image.random_brightness(image, 0.2)
-        
-        # Random contrast
-        image = tf.image.random_contrast(image, 0.8, 1.2)
-        
-        # Random saturation
-        image = tf.image.random_saturation(image, 0.8, 1.2)
-        
-        # Random hue
-        image = tf.image.random_hue(image, 0.1)
-        
-        # Random zoom (via crop and resize)
-        if tf.random.uniform([]) > 0.5:
-            # Zoom in by cropping then resizing
-            crop_size = tf.random.uniform([], 0.8, 1.0)
-            crop_h = tf.cast(config.IMAGE_SIZE[0] * crop_size, tf.int32)
-            crop_w = tf.cast(config.IMAGE_SIZE[1] * crop_size, tf.int32)
-            image = tf.image.random_crop(
-                tf.cast(image, tf.uint8),
-                size=[crop_h, crop_w, 3]
-            )
-            image = tf.image.resize(image, config.IMAGE_SIZE)
-        
-        # Ensure values are valid
-        image = tf.clip_by_value(image, 0.0, 255.0)
+        image = augment_image(image, image_size)
     
     # Normalize to [0, 1] for EfficientNet
     image = tf.cast(image, tf.float32) / 255.0
@@ -201,23 +315,282 @@ def load_and_preprocess_image(image_path: str, label: int, is_training: bool = F
     return image, label
 
 
-def create_tf_dataset(image_paths, labels, is_training: bool = False):
-    """Create a TensorFlow dataset from paths and labels"""
-    dataset = tf.data.Dataset.from_tensor_slices((image_paths, labels))
+def preprocess_cached_image(image, label, is_training: bool = False,
+                            image_size: Tuple[int, int] = None):
+    """Preprocess an already decoded and resized image (e.g. uint8 from the dataset cache)"""
+    image = tf.cast(image, tf.float32)
     
-    # Shuffle if training
     if is_training:
-        dataset = dataset.shuffle(buffer_size=1000, seed=config.RANDOM_SEED)
+        image = augment_image(image, image_size)
+    
+    # Normalize to [0, 1] for EfficientNet
+    image = image / 255.0
+    
+    return image, label
+
+
+def augment_and_normalize_batch(images, labels):
+    """Apply batched training augmentation to float32 images in [0, 255] and normalize"""
+    return augment_batch_compiled(images) / 255.0, labels
+
+
+def load_and_batch(dataset: tf.data.Dataset, is_training: bool = False,
+                   image_size: Tuple[int, int] = None, decode_fn=None,
+                   name: str = 'images', skip_errors: bool = None) -> tf.data.Dataset:
+    """
+    Decode, augment and batch a dataset of (image, target) pairs
+    
+    With config.BATCH_AUGMENTATION, training images are only decoded per
+    element and augmented a whole batch at a time after batching. When
+    skipping errors, images that fail to decode are dropped and counted under
+    `name` (see decode_error_counts) instead of ending the epoch.
+    
+    Args:
+        dataset: Dataset of (image_path, target) or (encoded bytes, target)
+        is_training: Whether to augment
+        image_size: Target image size
+        decode_fn: Maps an element and image_size to a float32 image
+                   (defaults to decode_and_resize for file paths)
+        name: Pipeline name for the skipped-image counters
+        skip_errors: Drop undecodable images (default: SKIP_CORRUPT_IMAGES);
+                     False keeps one output row per input element and fails on
+                     a bad image
+    """
+    decode_fn = decode_fn or decode_and_resize
+    skip_errors = config.SKIP_CORRUPT_IMAGES if skip_errors is None else skip_errors
+    
+    if skip_errors:
+        dataset = dataset.map(
+            _decode_or_skip(decode_fn, image_size, name),
+            num_parallel_calls=parallel_calls()
+        )
+        dataset = dataset.filter(lambda ok, image, y: ok)
+        dataset = dataset.map(lambda decoded, image, y: (image, y))
+    else:
+        dataset = dataset.map(
+            lambda x, y: (decode_fn(x, image_size), y),
+            num_parallel_calls=parallel_calls()
+        )
+    
+    if is_training and config.BATCH_AUGMENTATION:
+        dataset = dataset.batch(config.BATCH_SIZE)
+        return dataset.map(augment_and_normalize_batch, num_parallel_calls=parallel_calls())
     
-    # Load and preprocess images
     dataset = dataset.map(
-        lambda x, y: load_and_preprocess_image(x, y, is_training),
-        num_parallel_calls=tf.data.AUTOTUNE
+        lambda image, y: preprocess_cached_image(image, y, is_training, image_size),
+        num_parallel_calls=parallel_calls()
     )
+    return dataset.batch(config.BATCH_SIZE)
+
+
+def class_sampling_weights(labels, num_classes: int = None, power: float = None) -> np.ndarray:
+    """
+    Target class proportions of the balanced sampler
+    
+    Args:
+        labels: Integer class labels of the split
+        num_classes: Length of the result (default: largest label + 1)
+        power: A class is drawn in proportion to count**power, so 0 gives
+               equal shares and 1 keeps the data's proportions (default: SAMPLER_CLASS_POWER)
+    
+    Returns:
+        Probability of each class (0 for classes without images)
+    """
+    power = config.SAMPLER_CLASS_POWER if power is None else power
+    counts = np.bincount(labels, minlength=num_classes or 0).astype(np.float64)
+    weights = np.where(counts > 0, counts ** power, 0.0)
+    return weights / weights.sum()
+
+
+def balanced_steps_per_epoch(labels) -> int:
+    """
+    Steps per epoch of the balanced sampler
+    
+    SAMPLER_STEPS_PER_EPOCH if set; otherwise enough steps to draw the median
+    class size for every class (far fewer images than the whole split when
+    a few classes dominate).
+    """
+    if config.SAMPLER_STEPS_PER_EPOCH:
+        return config.SAMPLER_STEPS_PER_EPOCH
+    
+    counts = np.bincount(labels)
+    counts = counts[counts > 0]
+    return max(int(np.ceil(len(counts) * np.median(counts) / config.BATCH_SIZE)), 1)
+
+
+def balanced_stream(items, labels) -> tf.data.Dataset:
+    """
+    Endless stream of (item, label) drawing classes with the target proportions
     
-    # Batch and prefetch
+    Each class is its own shuffled, repeating stream, so minority images are
+    revisited more often instead of majority images being decoded and
+    down-weighted.
+    
+    Args:
+        items: Image paths or cache rows
+        labels: Integer class labels
+    """
+    items, labels = np.asarray(items), np.asarray(labels)
+    weights = class_sampling_weights(labels)
+    classes = np.flatnonzero(weights)
+    
+    streams = []
+    for class_idx in classes:
+        members = labels == class_idx
+        stream = tf.data.Dataset.from_tensor_slices((items[members], labels[members]))
+        stream = stream.shuffle(int(members.sum()), seed=config.RANDOM_SEED + int(class_idx),
+                                reshuffle_each_iteration=True)
+        streams.append(stream.repeat())
+    
+    return tf.data.Dataset.sample_from_datasets(
+        streams, weights=weights[classes].tolist(), seed=config.RANDOM_SEED
+    )
+
+
+def decode_to_uint8(image_path: str, image_size: Tuple[int, int] = None):
+    """Decode and resize an image into the uint8 form stored in the dataset cache"""
+    image = decode_and_resize(image_path, image_size)
+    return tf.cast(tf.round(tf.clip_by_value(image, 0.0, 255.0)), tf.uint8)
+
+
+def create_tf_dataset(image_paths, labels, is_training: bool = False,
+                      image_size: Tuple[int, int] = None, shuffle: bool = None,
+                      split: str = None, sampling: str = 'shuffle', skip_errors: bool = None):
+    """
+    Create a TensorFlow dataset from paths and labels
+    
+    When config.USE_DATASET_CACHE is on and a split name is given, images are
+    read from the preprocessed uint8 cache (built or refreshed on demand)
+    instead of being decoded from disk. Otherwise, with config.USE_SHARDS,
+    encoded images are streamed from sequential TFRecord shards.
+    
+    With sampling='balanced', classes are drawn with the proportions of
+    class_sampling_weights. The dataset then repeats forever, so fit() needs
+    steps_per_epoch (see balanced_steps_per_epoch).
+    
+    skip_errors=False keeps one batch row per path, in order, for callers that
+    line their results up with image_paths (see load_and_batch).
+    """
+    if config.USE_DATASET_CACHE and split is not None:
+        return create_cached_dataset(image_paths, labels, split, is_training, image_size, shuffle, sampling)
+    
+    if config.USE_SHARDS and split is not None:
+        from src.dataset_shards import create_sharded_dataset
+        return create_sharded_dataset(image_paths, labels, split, is_training, image_size, shuffle, sampling)
+    
+    if shuffle is None:
+        shuffle = is_training
+    
+    if sampling == 'balanced':
+        dataset = balanced_stream(image_paths, labels)
+    else:
+        dataset = tf.data.Dataset.from_tensor_slices((image_paths, labels))
+        
+        # Shuffle if training
+        if shuffle:
+            dataset = dataset.shuffle(buffer_size=config.SHUFFLE_BUFFER_SIZE, seed=config.RANDOM_SEED)
+    
+    # Load, preprocess and batch images
+    dataset = load_and_batch(dataset, is_training, image_size, name=split or 'images', skip_errors=skip_errors)
+    
+    # Prefetch
+    dataset = finalize_pipeline(dataset)
+    
+    return dataset
+
+
+def create_cached_dataset(image_paths, labels, split: str, is_training: bool = False,
+                          image_size: Tuple[int, int] = None, shuffle: bool = None,
+                          sampling: str = 'shuffle'):
+    """
+    Create a dataset that reads decoded, resized images from the uint8 cache
+    
+    Args:
+        image_paths: Image file paths (used to look up cache rows)
+        labels: Integer class labels
+        split: Cache split name ('train', 'val', 'test')
+        is_training: Whether to augment
+        image_size: Cached image size
+        shuffle: Whether to shuffle (defaults to is_training)
+        sampling: 'shuffle', or 'balanced' for endless class-balanced sampling
+    
+    Returns:
+        Batched dataset of normalized images and labels
+    """
+    image_size = tuple(image_size or config.IMAGE_SIZE)
+    
+    rows = update_dataset_cache(
+        image_paths, split, image_size,
+        decode_fn=lambda path: decode_to_uint8(path, image_size)
+    )
+    images = open_dataset_cache(split, image_size)
+    # Undecodable images have no row
+    decoded = rows >= 0
+    rows, labels = rows[decoded], np.asarray(labels)[decoded]
+    
+    if shuffle is None:
+        shuffle = is_training
+    
+    if sampling == 'balanced':
+        dataset = balanced_stream(rows, labels)
+    else:
+        dataset = tf.data.Dataset.from_tensor_slices((rows, labels))
+        if shuffle:
+            dataset = dataset.shuffle(buffer_size=len(rows), seed=config.RANDOM_SEED)
+    
+    # Gather whole batches of rows from the memmap in one call
     dataset = dataset.batch(config.BATCH_SIZE)
-    dataset = dataset.prefetch(tf.data.AUTOTUNE)
+    dataset = dataset.map(
+        lambda r, y: (tf.ensure_shape(tf.numpy_function(lambda idx: images[idx], [r], tf.uint8),
+                                      [None, *image_size, 3]), y),
+        num_parallel_calls=parallel_calls()
+    )
+    
+    # Augmentation runs after the cache, so every epoch still sees new views
+    if is_training and config.BATCH_AUGMENTATION:
+        dataset = dataset.map(
+            lambda x, y: augment_and_normalize_batch(tf.cast(x, tf.float32), y),
+            num_parallel_calls=parallel_calls()
+        )
+    else:
+        dataset = dataset.unbatch()
+        dataset = dataset.map(
+            lambda x, y: preprocess_cached_image(x, y, is_training, image_size),
+            num_parallel_calls=parallel_calls()
+        )
+        dataset = dataset.batch(config.BATCH_SIZE)
+    
+    dataset = finalize_pipeline(dataset)
+    
+    return dataset
+
+
+def create_distillation_dataset(image_paths, labels, teacher_logits, is_training: bool = False,
+                                image_size: Tuple[int, int] = None):
+    """
+    Create a dataset whose targets pack the hard label with cached teacher logits
+    
+    Args:
+        image_paths: Image file paths
+        labels: Integer class labels
+        teacher_logits: Cached teacher logits of shape (num_images, num_classes)
+        is_training: Whether to shuffle and augment
+        image_size: Student input size
+    
+    Returns:
+        Dataset of (image, [label, logit_0, ..., logit_n]) batches
+    """
+    targets = np.concatenate(
+        [np.asarray(labels, dtype=np.float32)[:, None], np.asarray(teacher_logits, dtype=np.float32)],
+        axis=1
+    )
+    dataset = tf.data.Dataset.from_tensor_slices((image_paths, targets))
+    
+    if is_training:
+        dataset = dataset.shuffle(buffer_size=config.SHUFFLE_BUFFER_SIZE, seed=config.RANDOM_SEED)
+    
+    dataset = load_and_batch(dataset, is_training, image_size, name='distill')
+    dataset = finalize_pipeline(dataset)
     
     return dataset
 
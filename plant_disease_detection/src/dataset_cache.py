@@ -0,0 +1,256 @@
+"""
+Preprocessed dataset cache
+Stores decoded, resized uint8 images in one memory-mapped array per split and
+image size, so JPEGs are decoded once instead of on every epoch. The cache is
+refreshed incrementally: only new or modified images are decoded. Images that
+fail to decode are left out, and the file is compacted once too many of its
+rows no longer belong to an image of the split.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+from typing import Callable, Tuple
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+
+
+def _cache_dir(split: str, image_size: Tuple[int, int]) -> Path:
+    """Directory holding the cache for one split at one image size"""
+    return config.DATASET_CACHE_DIR / f"{image_size[0]}x{image_size[1]}" / split
+
+
+def _load_index(cache_dir: Path) -> dict:
+    """Load the path -> row index of a cache directory"""
+    index_path = cache_dir / "index.json"
+    if not index_path.exists():
+        return {'num_rows': 0, 'entries': {}}
+    
+    with open(index_path, 'r') as f:
+        return json.load(f)
+
+
+def _save_index(cache_dir: Path, index: dict):
+    """Atomically write the index so an interrupted build never corrupts it"""
+    tmp_path = cache_dir / "index.json.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, cache_dir / "index.json")
+
+
+def _compact(cache_dir: Path, index: dict, rows: np.ndarray, image_paths,
+             image_size: Tuple[int, int]) -> np.ndarray:
+    """
+    Rewrite the cache with only the rows of the given images, in their order
+    
+    Returns:
+        New row numbers aligned with image_paths (-1 stays -1)
+    """
+    data_path = cache_dir / "images.u8"
+    tmp_path = cache_dir / "images.u8.tmp"
+    live = rows >= 0
+    new_rows = np.full(len(rows), -1, dtype=np.int64)
+    new_rows[live] = np.arange(live.sum())
+    
+    old_images = np.memmap(data_path, dtype=np.uint8, mode='r',
+                           shape=(index['num_rows'], image_size[0], image_size[1], 3))
+    # Copied in chunks so the cache never has to fit in memory
+    old_rows = rows[live]
+    with open(tmp_path, 'wb') as f:
+        for start in range(0, len(old_rows), 1024):
+            f.write(old_images[old_rows[start:start + 1024]].tobytes())
+    del old_images
+    
+    entries = {}
+    for path, row in zip(image_paths, new_rows.tolist()):
+        if row >= 0:
+            entries[str(path)] = {**index['entries'][str(path)], 'row': row}
+    
+    # An empty index first: a crash between the two replaces only loses the cache
+    _save_index(cache_dir, {'num_rows': 0, 'entries': {}})
+    os.replace(tmp_path, data_path)
+    _save_index(cache_dir, {'num_rows': int(live.sum()), 'entries': entries, 'image_size': list(image_size)})
+    
+    print(f"✓ Dataset cache compacted: {index['num_rows']} -> {int(live.sum())} rows")
+    return new_rows
+
+
+def update_dataset_cache(image_paths, split: str, image_size: Tuple[int, int],
+                         decode_fn: Callable) -> np.ndarray:
+    """
+    Make sure every image is in the cache and return its row numbers
+    
+    Images whose size and modification time match the index are reused;
+    new images are appended and modified ones are decoded into their old row.
+    Images that fail to decode get row -1 and are not indexed. When more than
+    DATASET_CACHE_COMPACT_FRACTION of the rows belong to no image of the split
+    (removed, moved or undecodable files), the cache is rewritten without them.
+    
+    Args:
+        image_paths: Image file paths
+        split: Split name ('train', 'val', 'test')
+        image_size: Target (height, width)
+        decode_fn: TensorFlow function mapping a path to a uint8 (H, W, 3) image
+    
+    Returns:
+        Array of cache row numbers aligned with image_paths (-1 for undecodable images)
+    """
+    cache_dir = _cache_dir(split, image_size)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    index = _load_index(cache_dir)
+    entries = index['entries']
+    
+    rows = np.empty(len(image_paths), dtype=np.int64)
+    pending_positions, pending_paths, pending_rows, pending_stats = [], [], [], []
+    num_rows = index['num_rows']
+    
+    for i, path in enumerate(image_paths):
+        path = str(path)
+        stat = os.stat(path)
+        entry = entries.get(path)
+        
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            rows[i] = entry['row']
+            continue
+        
+        # Modified images reuse their row, new images are appended once decoded
+        row = entry['row'] if entry else -1
+        num_rows += not entry
+        
+        rows[i] = row
+        pending_positions.append(i)
+        pending_paths.append(path)
+        pending_rows.append(row)
+        pending_stats.append(stat)
+    
+    if pending_paths:
+        print(f"\n🗜️  Caching {len(pending_paths)} {split} images at {image_size[0]}x{image_size[1]} "
+              f"({len(image_paths) - len(pending_paths)} already cached)...")
+        
+        # Grow the backing file to fit the new rows
+        data_path = cache_dir / "images.u8"
+        row_bytes = image_size[0] * image_size[1] * 3
+        with open(data_path, 'ab') as f:
+            f.truncate(num_rows * row_bytes)
+        
+        images = np.memmap(data_path, dtype=np.uint8, mode='r+',
+                           shape=(num_rows, image_size[0], image_size[1], 3))
+        
+        # Undecodable images drop out of the stream; the position tells which ones made it
+        pending_rows = np.array(pending_rows, dtype=np.int64)
+        dataset = tf.data.Dataset.from_tensor_slices((np.arange(len(pending_paths)), pending_paths))
+        dataset = dataset.map(lambda i, path: (i, decode_fn(path)), num_parallel_calls=tf.data.AUTOTUNE)
+        dataset = dataset.ignore_errors().batch(256).prefetch(tf.data.AUTOTUNE)
+        
+        decoded = np.zeros(len(pending_paths), dtype=bool)
+        next_row = index['num_rows']
+        for positions, batch in dataset:
+            positions = positions.numpy()
+            new = pending_rows[positions] < 0
+            pending_rows[positions[new]] = np.arange(next_row, next_row + new.sum())
+            next_row += int(new.sum())
+            images[pending_rows[positions]] = batch.numpy()
+            decoded[positions] = True
+        
+        images.flush()
+        del images
+        
+        # Drop the space reserved for new images that failed
+        num_rows = next_row
+        with open(data_path, 'ab') as f:
+            f.truncate(num_rows * row_bytes)
+        
+        # Only record the new rows once their pixels are on disk; failed images leave the index
+        for path, row, stat, ok in zip(pending_paths, pending_rows.tolist(), pending_stats, decoded):
+            if ok:
+                entries[path] = {'row': row, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            else:
+                entries.pop(path, None)
+        rows[pending_positions] = np.where(decoded, pending_rows, -1)
+        index['num_rows'] = num_rows
+        index['image_size'] = list(image_size)
+        _save_index(cache_dir, index)
+        
+        print(f"✓ Dataset cache updated: {cache_dir} ({num_rows} rows)")
+        if not decoded.all():
+            print(f"⚠️  {int((~decoded).sum())} {split} images could not be decoded and are left out")
+    
+    # Rows of removed, moved or undecodable images
+    orphaned = index['num_rows'] - int((rows >= 0).sum())
+    if orphaned > config.DATASET_CACHE_COMPACT_FRACTION * index['num_rows']:
+        rows = _compact(cache_dir, index, rows, image_paths, image_size)
+    
+    return rows
+
+
+def open_dataset_cache(split: str, image_size: Tuple[int, int]) -> np.ndarray:
+    """
+    Open the cached images of a split read-only
+    
+    Returns:
+        Memory-mapped uint8 array of shape (num_rows, H, W, 3)
+    """
+    cache_dir = _cache_dir(split, image_size)
+    index = _load_index(cache_dir)
+    
+    if index['num_rows'] == 0:
+        return np.zeros((0, image_size[0], image_size[1], 3), dtype=np.uint8)
+    
+    return np.memmap(cache_dir / "images.u8", dtype=np.uint8, mode='r',
+                     shape=(index['num_rows'], image_size[0], image_size[1], 3))
+
+
+def measure_throughput(dataset: tf.data.Dataset, max_batches: int = 100) -> float:
+    """Iterate a dataset and return images per second (first batch excluded)"""
+    iterator = iter(dataset)
+    next(iterator)
+    
+    images = 0
+    start = time.perf_counter()
+    for _ in range(max_batches):
+        try:
+            batch_images, _ = next(iterator)
+        except StopIteration:
+            break
+        images += int(batch_images.shape[0])
+    
+    elapsed = time.perf_counter() - start
+    return images / elapsed if elapsed > 0 else 0.0
+
+
+if __name__ == "__main__":
+    from src.data_preprocessing import setup_gpu, create_datasets
+    
+    parser = argparse.ArgumentParser(description='Build the preprocessed dataset cache')
+    parser.add_argument('--benchmark', action='store_true',
+                       help='Compare input-pipeline throughput with and without the cache')
+    parser.add_argument('--batches', type=int, default=100,
+                       help='Batches to time per pipeline in the benchmark')
+    
+    args = parser.parse_args()
+    
+    setup_gpu()
+    
+    # Building the datasets with the cache enabled decodes any missing images
+    config.USE_DATASET_CACHE = True
+    cached_train_ds, _, _, _ = create_datasets(config.DATA_DIR)
+    print("\n✓ Dataset cache is up to date")
+    
+    if args.benchmark:
+        config.USE_DATASET_CACHE = False
+        file_train_ds, _, _, _ = create_datasets(config.DATA_DIR)
+        
+        print("\n⏱️  Measuring input-pipeline throughput (training split, with augmentation)...")
+        file_rate = measure_throughput(file_train_ds, args.batches)
+        cached_rate = measure_throughput(cached_train_ds, args.batches)
+        
+        print(f"  - JPEG decode pipeline: {file_rate:,.0f} images/sec")
+        print(f"  - Cached uint8 pipeline: {cached_rate:,.0f} images/sec")
+        if file_rate > 0:
+            print(f"  - Speedup: {cached_rate / file_rate:.2f}x")
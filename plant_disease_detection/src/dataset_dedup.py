@@ -0,0 +1,367 @@
+"""
+Dataset deduplication
+Finds exact duplicates (same SHA-1 in the split manifest) and near-duplicates
+(perceptual dHash within a small Hamming distance of a cluster's seed hash)
+and keeps one image per duplicate cluster. Perceptual hashes are computed in a process pool and cached
+per content hash, and near-duplicates are found with a multi-index over hash
+bands instead of comparing every pair. The filtered manifest is cached until the
+split manifest or the hash cache changes.
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from PIL import Image
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+from src.dataset_index import load_dataset_index
+from src.dataset_split import update_split_manifest, get_split, SPLITS
+
+
+# Number of set bits for every byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def dhash(path: str) -> Optional[int]:
+    """
+    64-bit difference hash of an image
+    
+    Returns:
+        Hash as an unsigned integer, or None if the image cannot be read
+    """
+    try:
+        with Image.open(path) as img:
+            # Let the JPEG decoder downscale while decoding
+            img.draft('L', (64, 64))
+            pixels = np.asarray(img.convert('L').resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    except (OSError, ValueError):
+        return None
+    
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming_distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Element-wise Hamming distance between two uint64 arrays"""
+    xor = np.ascontiguousarray(np.bitwise_xor(a, b))
+    return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _load_hash_cache() -> dict:
+    """Cached perceptual hashes keyed by content SHA-1 (None for unreadable images)"""
+    cache_path = config.DEDUP_DIR / "dhash_cache.npz"
+    if not cache_path.exists():
+        return {}
+    
+    cache = np.load(cache_path)
+    # Caches written before the readable mask used -1 for unreadable images
+    readable = cache['readable'] if 'readable' in cache else cache['dhash'] != -1
+    return {sha1: value if ok else None
+            for sha1, value, ok in zip(cache['sha1'].tolist(), cache['dhash'].tolist(), readable.tolist())}
+
+
+def _save_hash_cache(hashes: dict):
+    """Store perceptual hashes as compact arrays"""
+    # Per-process temporary file: several trainings may hash at the same time
+    tmp_path = config.DEDUP_DIR / f"dhash_cache.{os.getpid()}.tmp.npz"
+    values = list(hashes.values())
+    np.savez(tmp_path,
+             sha1=np.array(list(hashes.keys()), dtype='U40'),
+             dhash=np.array([0 if v is None else v for v in values], dtype=np.int64),
+             readable=np.array([v is not None for v in values], dtype=bool))
+    os.replace(tmp_path, config.DEDUP_DIR / "dhash_cache.npz")
+
+
+def _save_json(data, path: Path, **kwargs):
+    """Atomically write a JSON file"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp_path, path)
+
+
+def _filter_key(files: dict) -> str:
+    """
+    Identity of a deduplication result
+    
+    Changes with the split manifest entries, the hash cache and the settings.
+    """
+    cache_path = config.DEDUP_DIR / "dhash_cache.npz"
+    cache_stat = cache_path.stat() if cache_path.exists() else None
+    state = {
+        'files': files,
+        'hash_cache': [cache_stat.st_size, cache_stat.st_mtime_ns] if cache_stat else None,
+        'threshold': config.DEDUP_HAMMING_THRESHOLD,
+        'drop_conflicts': config.DEDUP_DROP_CONFLICTS
+    }
+    return hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+
+def _load_filtered_manifest() -> dict:
+    """Last filtered manifest ({'key', 'files'}, empty if there is none)"""
+    path = config.DEDUP_DIR / "filtered_manifest.json"
+    if not path.exists():
+        return {'key': None, 'files': {}}
+    
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compute_perceptual_hashes(data_dir: str, files: dict) -> dict:
+    """
+    dHash of every distinct image content, computing only uncached ones
+    
+    Args:
+        data_dir: Dataset directory
+        files: Split manifest entries keyed by relative path
+    
+    Returns:
+        Dictionary SHA-1 -> dHash (as signed int64, None for unreadable images)
+    """
+    config.DEDUP_DIR.mkdir(exist_ok=True)
+    cached = _load_hash_cache()
+    
+    # One representative path per content hash that is not cached yet
+    todo = {}
+    for rel_path, entry in files.items():
+        if entry['sha1'] not in cached:
+            todo.setdefault(entry['sha1'], os.path.join(data_dir, rel_path))
+    
+    if todo:
+        print(f"\n🧬 Computing perceptual hashes for {len(todo)} images...")
+        # Spawned workers never inherit TensorFlow state from the parent
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=config.DEDUP_WORKERS, mp_context=context) as pool:
+            hashes = pool.map(dhash, todo.values(), chunksize=256)
+            for sha1, value in zip(todo.keys(), hashes):
+                # Stored as int64 bit pattern so the cache stays a plain array
+                cached[sha1] = None if value is None else int(np.array(value, dtype=np.uint64).view(np.int64))
+        
+        _save_hash_cache(cached)
+    
+    return cached
+
+
+def find_near_duplicates(hashes: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Pairs of hashes within the Hamming threshold
+    
+    Each hash is cut into threshold + 1 bands. Two hashes that differ in at most
+    `threshold` bits agree exactly on at least one band, so only hashes that
+    share a band value are compared. The work is proportional to the number of
+    such candidate pairs, not to the number of hashes times the largest bucket
+    (a band value shared by a large share of the images is still compared pairwise).
+    
+    Args:
+        hashes: Distinct uint64 hashes
+        threshold: Maximum number of differing bits
+    
+    Returns:
+        Array of index pairs (k, 2) into hashes
+    """
+    num_bands = threshold + 1
+    band_bits = 64 // num_bands
+    mask = np.uint64((1 << band_bits) - 1)
+    pairs = []
+    
+    for band in range(num_bands):
+        keys = (hashes >> np.uint64(band * band_bits)) & mask
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        
+        # End (in sorted order) of the bucket every element belongs to
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, len(order)])
+        bucket_end = np.repeat(starts + sizes, sizes)
+        
+        # Compare every element with the one `offset` places later in its bucket;
+        # elements whose bucket has run out drop out of the active set
+        offset = 1
+        active = np.flatnonzero(bucket_end > np.arange(len(order)) + offset)
+        while len(active):
+            left = order[active]
+            right = order[active + offset]
+            close = hamming_distance(hashes[left], hashes[right]) <= threshold
+            pairs.append(np.stack([left[close], right[close]], axis=1))
+            offset += 1
+            active = active[bucket_end[active] > active + offset]
+    
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def cluster_near_duplicates(num_hashes: int, pairs: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Group hashes around seed hashes
+    
+    Hashes are visited from the most common one; an unassigned hash becomes a
+    seed and takes every unassigned hash within the threshold (a pair) of it.
+    Every member is therefore close to its seed, and chains of near-duplicates
+    (A ~ B ~ C) do not join hashes that are far apart.
+    
+    Args:
+        num_hashes: Number of distinct hashes
+        pairs: Near-duplicate index pairs from find_near_duplicates
+        counts: Files per hash (more common hashes become seeds first)
+    
+    Returns:
+        Index of the seed hash of every hash
+    """
+    seeds = np.arange(num_hashes)
+    if not len(pairs):
+        return seeds
+    
+    # Neighbours of every hash as a CSR-style index
+    rows = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    cols = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    order = np.argsort(rows, kind='stable')
+    rows, cols = rows[order], cols[order]
+    indptr = np.searchsorted(rows, np.arange(num_hashes + 1))
+    
+    assigned = np.zeros(num_hashes, dtype=bool)
+    candidates = np.unique(rows)
+    for seed in candidates[np.lexsort((candidates, -counts[candidates]))]:
+        if assigned[seed]:
+            continue
+        assigned[seed] = True
+        neighbours = cols[indptr[seed]:indptr[seed + 1]]
+        neighbours = neighbours[~assigned[neighbours]]
+        seeds[neighbours] = seed
+        assigned[neighbours] = True
+    
+    return seeds
+
+
+def deduplicate(index: dict, manifest: dict) -> dict:
+    """
+    Cluster exact and near-duplicate images and keep one image per cluster
+    
+    Writes models/dedup/dedup_report.json and models/dedup/filtered_manifest.json,
+    and returns the cached filtered manifest while the split manifest and the
+    hash cache are unchanged. Within a cluster, an image kept last time stays
+    kept; otherwise the image from the earliest split (train, val, test) is kept,
+    so retraining never moves the kept image to another split.
+    
+    Args:
+        index: Dataset index
+        manifest: Split manifest from update_split_manifest
+    
+    Returns:
+        Filtered split manifest with the same structure as the input
+    """
+    # Quarantined images are never trained on, so they take no part in clustering
+    files = {p: entry for p, entry in manifest['files'].items() if 'quarantined' not in entry}
+    config.DEDUP_DIR.mkdir(exist_ok=True)
+    previous = _load_filtered_manifest()
+    if previous['key'] == _filter_key(files):
+        return {'files': previous['files']}
+    
+    rel_paths = sorted(files)
+    entries = [files[p] for p in rel_paths]
+    num_files = len(rel_paths)
+    
+    sha1_hashes = compute_perceptual_hashes(index['data_dir'], files)
+    
+    # Exact duplicates share a content id and therefore a dHash
+    content_ids = np.unique([e['sha1'] for e in entries], return_inverse=True)[1].reshape(-1)
+    readable = np.array([sha1_hashes[e['sha1']] is not None for e in entries], dtype=bool)
+    perceptual = np.array([sha1_hashes[e['sha1']] or 0 for e in entries], dtype=np.int64)
+    
+    distinct, dhash_ids = np.unique(perceptual[readable].view(np.uint64), return_inverse=True)
+    dhash_ids = dhash_ids.reshape(-1)
+    near_pairs = find_near_duplicates(distinct, config.DEDUP_HAMMING_THRESHOLD)
+    seeds = cluster_near_duplicates(len(distinct), near_pairs, np.bincount(dhash_ids, minlength=len(distinct)))
+    
+    # Readable files cluster by seed dHash, unreadable ones only with exact copies
+    clusters = len(distinct) + content_ids
+    clusters[readable] = seeds[dhash_ids]
+    is_seed = np.zeros(num_files, dtype=bool)
+    is_seed[readable] = seeds[dhash_ids] == dhash_ids
+    
+    # Keep the file kept last time, else the earliest split, then the seed hash, then the first path
+    was_kept = np.array([p in previous['files'] for p in rel_paths], dtype=bool)
+    split_rank = np.array([SPLITS.index(e['split']) for e in entries])
+    order = np.lexsort((np.arange(num_files), ~is_seed, split_rank, ~was_kept, clusters))
+    first = np.ones(num_files, dtype=bool)
+    first[1:] = clusters[order][1:] != clusters[order][:-1]
+    keep = np.zeros(num_files, dtype=bool)
+    keep[order[first]] = True
+    
+    # Group the files of every cluster with more than one member
+    duplicate_clusters = []
+    boundaries = np.flatnonzero(first).tolist() + [num_files]
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        if end - start < 2:
+            continue
+        members = order[start:end]
+        labels = sorted({entries[i]['label'] for i in members})
+        conflict = len(labels) > 1
+        if conflict and config.DEDUP_DROP_CONFLICTS:
+            keep[members] = False
+        duplicate_clusters.append({
+            'kept': rel_paths[members[0]] if keep[members[0]] else None,
+            'members': [rel_paths[i] for i in members],
+            'labels': labels,
+            'splits': sorted({entries[i]['split'] for i in members}),
+            'exact': len({entries[i]['sha1'] for i in members}) == 1
+        })
+    
+    filtered = {'files': {rel_paths[i]: entries[i] for i in np.flatnonzero(keep)}}
+    # Hashing may have updated the cache, so the key is taken afterwards
+    key = _filter_key(files)
+    
+    report = {
+        'total_images': num_files,
+        'kept_images': int(keep.sum()),
+        'removed_images': int(num_files - keep.sum()),
+        'duplicate_clusters': len(duplicate_clusters),
+        'exact_clusters': sum(c['exact'] for c in duplicate_clusters),
+        'conflicting_label_clusters': sum(len(c['labels']) > 1 for c in duplicate_clusters),
+        'cross_split_clusters': sum(len(c['splits']) > 1 for c in duplicate_clusters),
+        'unreadable_images': [rel_paths[i] for i in np.flatnonzero(~readable)],
+        'hamming_threshold': config.DEDUP_HAMMING_THRESHOLD,
+        'timestamp': datetime.now().isoformat(),
+        'clusters': duplicate_clusters
+    }
+    
+    _save_json(report, config.DEDUP_DIR / "dedup_report.json", indent=4)
+    _save_json({'key': key, **filtered}, config.DEDUP_DIR / "filtered_manifest.json")
+    
+    print(f"✓ Deduplication: kept {report['kept_images']} of {num_files} images "
+          f"({report['duplicate_clusters']} duplicate clusters, "
+          f"{report['cross_split_clusters']} spanning splits)")
+    
+    return filtered
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Find exact and near-duplicate images')
+    parser.add_argument('--data-dir', type=Path, default=None,
+                       help='Dataset directory (defaults to config.DATA_DIR)')
+    parser.add_argument('--threshold', type=int, default=None,
+                       help='Max differing dHash bits for near-duplicates')
+    
+    args = parser.parse_args()
+    
+    if args.threshold is not None:
+        config.DEDUP_HAMMING_THRESHOLD = args.threshold
+    
+    index = load_dataset_index(args.data_dir)
+    manifest = update_split_manifest(index)
+    filtered = deduplicate(index, manifest)
+    
+    print(f"\n📦 Dataset Split after deduplication:")
+    for split in SPLITS:
+        _, labels = get_split(index, filtered, split)
+        print(f"  - {split}: {len(labels)} images")
+    print(f"\n✓ Report saved to {config.DEDUP_DIR / 'dedup_report.json'}")
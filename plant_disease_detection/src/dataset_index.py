@@ -0,0 +1,146 @@
+"""
+Dataset index
+Scans the dataset directory once with os.scandir and keeps a persisted
+manifest (path, size, mtime and label of every image). Later runs only
+rescan class directories whose modification time changed, i.e. where files
+were added, removed or renamed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Dict, Tuple
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+
+
+def _is_image(name: str) -> bool:
+    """Check the file extension case-insensitively"""
+    return os.path.splitext(name)[1].lower() in config.IMAGE_EXTENSIONS
+
+
+def _scan_class_dir(class_path: str) -> Dict[str, list]:
+    """List the images of one class directory as {file name: [size, mtime_ns]}"""
+    files = {}
+    with os.scandir(class_path) as entries:
+        for entry in entries:
+            if entry.is_file() and _is_image(entry.name):
+                stat = entry.stat()
+                files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return files
+
+
+def _save_index(index: dict):
+    """Atomically write the manifest so an interrupted scan never corrupts it"""
+    index_path = config.DATASET_INDEX_PATH
+    tmp_path = index_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+
+def load_dataset_index(data_dir: Path = None, refresh: bool = True) -> dict:
+    """
+    Load the dataset manifest, refreshing changed class directories
+    
+    Args:
+        data_dir: Dataset directory with one sub-directory per class
+        refresh: Whether to check the directory modification times
+    
+    Returns:
+        Manifest with 'data_dir', 'class_names' and per-class 'classes' entries
+        ({'mtime_ns': ..., 'files': {file name: [size, mtime_ns]}})
+    """
+    data_dir = Path(data_dir or config.DATA_DIR)
+    index = {'data_dir': str(data_dir), 'class_names': [], 'classes': {}}
+    
+    if config.DATASET_INDEX_PATH.exists():
+        with open(config.DATASET_INDEX_PATH, 'r') as f:
+            cached = json.load(f)
+        if cached.get('data_dir') == str(data_dir):
+            index = cached
+            if not refresh:
+                return index
+    
+    start = time.perf_counter()
+    old_classes = index['classes']
+    classes = {}
+    rescanned = 0
+    
+    with os.scandir(data_dir) as entries:
+        class_dirs = sorted((entry.name, entry.path, entry.stat().st_mtime_ns)
+                            for entry in entries if entry.is_dir())
+    
+    for class_name, class_path, mtime_ns in class_dirs:
+        old = old_classes.get(class_name)
+        if old and old['mtime_ns'] == mtime_ns:
+            classes[class_name] = old
+            continue
+        
+        classes[class_name] = {'mtime_ns': mtime_ns, 'files': _scan_class_dir(class_path)}
+        rescanned += 1
+    
+    if rescanned or classes.keys() != old_classes.keys():
+        index = {
+            'data_dir': str(data_dir),
+            'class_names': [name for name, _, _ in class_dirs],
+            'classes': classes
+        }
+        _save_index(index)
+        print(f"✓ Dataset index updated: {rescanned}/{len(class_dirs)} class directories rescanned "
+              f"in {time.perf_counter() - start:.2f}s")
+    
+    return index
+
+
+def class_counts(index: dict) -> Dict[str, int]:
+    """Number of images per class"""
+    return {name: len(index['classes'][name]['files']) for name in index['class_names']}
+
+
+def list_images(index: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Image paths and integer labels of every indexed image
+    
+    Labels are positions in index['class_names']; images are listed in a
+    deterministic order (class, then file name).
+    
+    Returns:
+        image_paths, labels
+    """
+    data_dir = index['data_dir']
+    image_paths, labels = [], []
+    
+    for class_idx, class_name in enumerate(index['class_names']):
+        files = sorted(index['classes'][class_name]['files'])
+        image_paths.extend(os.path.join(data_dir, class_name, name) for name in files)
+        labels.extend([class_idx] * len(files))
+    
+    return np.array(image_paths), np.array(labels)
+
+
+def list_class_images(index: dict, class_name: str) -> list:
+    """Paths of the indexed images of one class"""
+    class_path = os.path.join(index['data_dir'], class_name)
+    return [os.path.join(class_path, name) for name in sorted(index['classes'][class_name]['files'])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or refresh the dataset index')
+    parser.add_argument('--data-dir', type=Path, default=None,
+                       help='Dataset directory (defaults to config.DATA_DIR)')
+    
+    args = parser.parse_args()
+    
+    index = load_dataset_index(args.data_dir)
+    counts = class_counts(index)
+    
+    print(f"\n📊 Indexed {sum(counts.values()):,} images in {len(counts)} classes")
+    for class_name, count in counts.items():
+        print(f"  - {class_name}: {count} images")
+    print(f"\n✓ Manifest: {config.DATASET_INDEX_PATH}")
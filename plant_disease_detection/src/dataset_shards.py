@@ -0,0 +1,220 @@
+"""
+Sequential TFRecord shards
+Packs the encoded images of each split into a few large TFRecord files, so
+training reads big sequential files instead of opening hundreds of thousands
+of small JPEGs. Shards are read with parallel interleave, shuffled at shard
+and buffer level, and decoded in parallel.
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import numpy as np
+import tensorflow as tf
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Tuple
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+from src.data_preprocessing import (
+    decode_image_bytes, load_and_batch, parallel_calls, finalize_pipeline, class_sampling_weights
+)
+from src.dataset_split import load_split_manifest
+
+
+def _read_bytes(path: str) -> bytes:
+    """Read a whole file"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _serialize_example(image_bytes: bytes, label: int) -> bytes:
+    """Encode one image and its label as a tf.train.Example"""
+    return tf.train.Example(features=tf.train.Features(feature={
+        'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[image_bytes])),
+        'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[int(label)]))
+    })).SerializeToString()
+
+
+def _parse_example(record):
+    """Decode a serialized example back into (encoded image, label)"""
+    example = tf.io.parse_single_example(record, {
+        'image': tf.io.FixedLenFeature([], tf.string),
+        'label': tf.io.FixedLenFeature([], tf.int64)
+    })
+    return example['image'], example['label']
+
+
+def _shard_key(image_paths, labels) -> str:
+    """Key covering the image list, labels and file contents (from the split manifest)"""
+    files = load_split_manifest()['files']
+    digest = hashlib.sha1()
+    for path, label in zip(image_paths, labels):
+        rel_path = os.path.relpath(str(path), config.DATA_DIR).replace(os.sep, '/')
+        entry = files.get(rel_path, {})
+        digest.update(f"{path}:{label}:{entry.get('sha1', '')}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def write_shards(image_paths, labels, split: str) -> list:
+    """
+    Pack a split into TFRecord shards, reusing existing shards when up to date
+    
+    Examples are written in a fixed random order so every shard mixes classes.
+    
+    Args:
+        image_paths: Image file paths
+        labels: Integer class labels
+        split: Split name ('train', 'val', 'test')
+    
+    Returns:
+        List of shard file paths
+    """
+    split_dir = config.SHARD_DIR / split
+    index_path = split_dir / "index.json"
+    key = _shard_key(image_paths, labels)
+    
+    if index_path.exists():
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+        if index['key'] == key:
+            return [str(split_dir / name) for name in index['shards']]
+    
+    if split_dir.exists():
+        shutil.rmtree(split_dir)
+    split_dir.mkdir(parents=True)
+    
+    order = np.random.RandomState(config.RANDOM_SEED).permutation(len(image_paths))
+    paths = [str(image_paths[i]) for i in order]
+    shard_labels = [int(labels[i]) for i in order]
+    max_bytes = config.SHARD_SIZE_MB * 1024 * 1024
+    
+    print(f"\n📦 Writing {len(paths)} {split} images to TFRecord shards in {split_dir}...")
+    
+    shards = []
+    writer, shard_bytes = None, 0
+    chunk = 1024
+    # Reads are issued in parallel (a chunk at a time to bound memory),
+    # writes stay sequential and in order
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        for start in range(0, len(paths), chunk):
+            chunk_bytes = pool.map(_read_bytes, paths[start:start + chunk])
+            for image_bytes, label in zip(chunk_bytes, shard_labels[start:start + chunk]):
+                if writer is None or shard_bytes >= max_bytes:
+                    if writer is not None:
+                        writer.close()
+                    name = f"{split}-{len(shards):05d}.tfrecord"
+                    shards.append(name)
+                    writer = tf.io.TFRecordWriter(str(split_dir / name))
+                    shard_bytes = 0
+                
+                writer.write(_serialize_example(image_bytes, label))
+                shard_bytes += len(image_bytes)
+    
+    if writer is not None:
+        writer.close()
+    
+    with open(index_path, 'w') as f:
+        json.dump({'key': key, 'num_examples': len(paths), 'shards': shards}, f, indent=4)
+    
+    print(f"✓ {len(shards)} shards written")
+    
+    return [str(split_dir / name) for name in shards]
+
+
+def create_sharded_dataset(image_paths, labels, split: str, is_training: bool = False,
+                           image_size: Tuple[int, int] = None, shuffle: bool = None,
+                           sampling: str = 'shuffle') -> tf.data.Dataset:
+    """
+    Create a dataset that streams encoded images from TFRecord shards
+    
+    Args:
+        image_paths: Image file paths of the split (used to build the shards)
+        labels: Integer class labels
+        split: Split name
+        is_training: Whether to augment
+        image_size: Target image size
+        shuffle: Whether to shuffle (defaults to is_training)
+        sampling: 'shuffle', or 'balanced' for endless class-balanced sampling
+    
+    Returns:
+        Batched dataset of normalized images and labels
+    """
+    shards = write_shards(image_paths, labels, split)
+    
+    if shuffle is None:
+        shuffle = is_training
+    
+    dataset = tf.data.Dataset.from_tensor_slices(shards)
+    
+    # Shard-level shuffle
+    if shuffle:
+        dataset = dataset.shuffle(len(shards), seed=config.RANDOM_SEED, reshuffle_each_iteration=True)
+    
+    # Read several shards concurrently, each sequentially
+    dataset = dataset.interleave(
+        lambda f: tf.data.TFRecordDataset(f, buffer_size=8 * 1024 * 1024),
+        cycle_length=max(1, min(config.SHARD_CYCLE_LENGTH, len(shards))),
+        num_parallel_calls=parallel_calls(),
+        deterministic=not shuffle
+    )
+    
+    # Shards mix classes, so balancing rejects examples before they are decoded
+    if sampling == 'balanced':
+        dataset = dataset.repeat()
+    
+    # Example-level shuffle
+    if shuffle:
+        dataset = dataset.shuffle(config.SHARD_SHUFFLE_BUFFER, seed=config.RANDOM_SEED)
+    
+    dataset = dataset.map(_parse_example, num_parallel_calls=parallel_calls())
+    
+    if sampling == 'balanced':
+        initial_dist = np.bincount(labels).astype(np.float64)
+        initial_dist = np.maximum(initial_dist / initial_dist.sum(), 1e-9)
+        dataset = dataset.rejection_resample(
+            lambda x, y: tf.cast(y, tf.int32),
+            target_dist=class_sampling_weights(labels).astype(np.float32),
+            initial_dist=initial_dist.astype(np.float32),
+            seed=config.RANDOM_SEED
+        ).map(lambda class_idx, example: example)
+    dataset = load_and_batch(dataset, is_training, image_size, decode_fn=decode_image_bytes, name=split)
+    dataset = finalize_pipeline(dataset)
+    
+    return dataset
+
+
+if __name__ == "__main__":
+    from src.data_preprocessing import create_datasets
+    from src.dataset_cache import measure_throughput
+    
+    parser = argparse.ArgumentParser(description='Pack the dataset splits into TFRecord shards')
+    parser.add_argument('--benchmark', action='store_true',
+                       help='Compare input-pipeline throughput of shards and individual files')
+    parser.add_argument('--batches', type=int, default=100,
+                       help='Batches to time per pipeline in the benchmark')
+    
+    args = parser.parse_args()
+    
+    # Building the datasets with shards enabled writes any missing shards
+    config.USE_DATASET_CACHE = False
+    config.USE_SHARDS = True
+    sharded_train_ds, _, _, _ = create_datasets(config.DATA_DIR)
+    print("\n✓ Shards are up to date")
+    
+    if args.benchmark:
+        config.USE_SHARDS = False
+        file_train_ds, _, _, _ = create_datasets(config.DATA_DIR)
+        
+        print("\n⏱️  Measuring input-pipeline throughput (training split, with augmentation)...")
+        file_rate = measure_throughput(file_train_ds, args.batches)
+        shard_rate = measure_throughput(sharded_train_ds, args.batches)
+        
+        print(f"  - Individual files: {file_rate:,.0f} images/sec")
+        print(f"  - TFRecord shards: {shard_rate:,.0f} images/sec")
+        if file_rate > 0:
+            print(f"  - Speedup: {shard_rate / file_rate:.2f}x")
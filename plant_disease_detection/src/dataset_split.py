@@ -0,0 +1,302 @@
+"""
+Persisted train/val/test split
+Every image is identified by the SHA-1 of its content and assigned to a split
+once; the assignment is stored in a manifest and never changes afterwards.
+New images are distributed per class so that each class keeps the configured
+validation/test fractions, without moving any previously assigned image.
+New and modified images are also test-decoded; files that cannot be decoded
+are quarantined in the manifest and left out of every split.
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from PIL import Image
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+from src.dataset_index import load_dataset_index
+
+
+SPLITS = ('train', 'val', 'test')
+
+# Formats tf.io.decode_image can read
+DECODABLE_FORMATS = ('JPEG', 'PNG', 'GIF', 'BMP')
+
+
+def file_sha1(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-1 of a file's content"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def validate_image(path: str) -> Optional[str]:
+    """
+    Check that an image can be decoded by the training pipeline
+    
+    JPEGs are decoded at reduced scale, which still reads the whole file, so
+    truncated and corrupt files are caught at a fraction of the full cost.
+    
+    Returns:
+        None if the image is fine, otherwise the reason it is rejected
+    """
+    try:
+        with Image.open(path) as img:
+            if img.format not in DECODABLE_FORMATS:
+                return f"unsupported format {img.format}"
+            img.draft('RGB', (64, 64))
+            img.load()
+    except (OSError, ValueError, SyntaxError) as e:
+        return f"{type(e).__name__}: {e}"
+    
+    return None
+
+
+def _inspect_file(path: str) -> Tuple[str, Optional[str]]:
+    """Content hash and validation result of one file"""
+    return file_sha1(path), validate_image(path) if config.VALIDATE_IMAGES else None
+
+
+def _split_fractions() -> Dict[str, float]:
+    """Target fraction of each split"""
+    return {
+        'train': 1.0 - config.VALIDATION_SPLIT - config.TEST_SPLIT,
+        'val': config.VALIDATION_SPLIT,
+        'test': config.TEST_SPLIT
+    }
+
+
+def _assign_new_files(new_hashes: list, counts: Dict[str, int]) -> list:
+    """
+    Distribute new files of one class over the splits
+    
+    Files are taken in hash order and each goes to the split furthest below
+    its target share, so the class stays stratified however it grows.
+    
+    Args:
+        new_hashes: Content hashes of the new files
+        counts: Current number of files per split for this class (updated in place)
+    
+    Returns:
+        Split name for each entry of new_hashes
+    """
+    fractions = _split_fractions()
+    assigned = {}
+    
+    for file_hash in sorted(set(new_hashes)):
+        total = sum(counts.values()) + 1
+        split = max(SPLITS, key=lambda s: fractions[s] * total - counts[s])
+        counts[split] += 1
+        assigned[file_hash] = split
+    
+    return [assigned[file_hash] for file_hash in new_hashes]
+
+
+def load_split_manifest() -> dict:
+    """Load the split manifest (empty if it does not exist yet)"""
+    if not config.SPLIT_MANIFEST_PATH.exists():
+        return {'files': {}}
+    
+    with open(config.SPLIT_MANIFEST_PATH, 'r') as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest: dict):
+    """Atomically write the split manifest"""
+    tmp_path = config.SPLIT_MANIFEST_PATH.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, config.SPLIT_MANIFEST_PATH)
+
+
+def update_split_manifest(index: dict) -> dict:
+    """
+    Bring the split manifest in line with the dataset index
+    
+    Known files keep their split. Files whose size or mtime changed are
+    re-hashed but stay where they are; removed files are dropped. New files
+    whose content is already in a split join that split (duplicates never
+    straddle train and test); the rest are assigned per class. New or
+    modified files that fail validation get a 'quarantined' reason and are
+    left out of their split until they change again.
+    
+    Args:
+        index: Dataset index from load_dataset_index
+    
+    Returns:
+        Manifest {'files': {relative path: {'sha1', 'size', 'mtime_ns', 'label', 'split'
+                                            [, 'quarantined']}}}
+    """
+    data_dir = index['data_dir']
+    old_files = load_split_manifest()['files']
+    files = {}
+    to_hash = []
+    
+    for class_name in index['class_names']:
+        for name, (size, mtime_ns) in index['classes'][class_name]['files'].items():
+            rel_path = f"{class_name}/{name}"
+            entry = old_files.get(rel_path)
+            
+            if entry and entry['label'] == class_name:
+                files[rel_path] = entry
+                if entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+                    continue
+            else:
+                files[rel_path] = {'label': class_name, 'split': None}
+            
+            files[rel_path].update({'size': size, 'mtime_ns': mtime_ns})
+            to_hash.append(rel_path)
+    
+    if not to_hash and files.keys() == old_files.keys():
+        return {'files': files}
+    
+    if to_hash:
+        print(f"\n🔑 Hashing and validating {len(to_hash)} new or modified images...")
+        with ThreadPoolExecutor(max_workers=config.SPLIT_HASH_WORKERS) as pool:
+            results = pool.map(lambda p: _inspect_file(os.path.join(data_dir, p)), to_hash)
+            for rel_path, (file_hash, error) in zip(to_hash, results):
+                entry = files[rel_path]
+                entry['sha1'] = file_hash
+                entry.pop('quarantined', None)
+                if error:
+                    entry['quarantined'] = error
+    
+    # Existing assignments per class, and where each content hash already lives
+    counts = {}
+    hash_splits = {}
+    for entry in files.values():
+        if entry['split'] is not None:
+            class_counts = counts.setdefault(entry['label'], dict.fromkeys(SPLITS, 0))
+            class_counts[entry['split']] += 1
+            hash_splits.setdefault(entry['sha1'], entry['split'])
+    
+    pending = {}
+    for rel_path, entry in files.items():
+        if entry['split'] is None and 'quarantined' not in entry:
+            if entry['sha1'] in hash_splits:
+                entry['split'] = hash_splits[entry['sha1']]
+            else:
+                pending.setdefault(entry['label'], []).append(rel_path)
+    
+    for class_name, rel_paths in pending.items():
+        class_counts = counts.setdefault(class_name, dict.fromkeys(SPLITS, 0))
+        splits = _assign_new_files([files[p]['sha1'] for p in rel_paths], class_counts)
+        for rel_path, split in zip(rel_paths, splits):
+            files[rel_path]['split'] = split
+    
+    manifest = {'files': files}
+    _save_manifest(manifest)
+    
+    num_new = sum(len(p) for p in pending.values())
+    print(f"✓ Split manifest updated: {num_new} new images assigned, "
+          f"{len(old_files.keys() - files.keys())} removed")
+    
+    quarantined = quarantined_files(manifest)
+    if quarantined:
+        print(f"⚠️  {len(quarantined)} images quarantined (cannot be decoded), "
+              f"see 'quarantined' entries in {config.SPLIT_MANIFEST_PATH}")
+    
+    return manifest
+
+
+def quarantined_files(manifest: dict) -> Dict[str, str]:
+    """Quarantined images as {relative path: reason}"""
+    return {p: entry['quarantined'] for p, entry in manifest['files'].items() if 'quarantined' in entry}
+
+
+def validate_manifest(index: dict, manifest: dict) -> dict:
+    """
+    Validate every image in the manifest, not only new or modified ones
+    
+    Useful once for manifests created before validation existed, or after
+    the files may have been damaged in place without changing size or mtime.
+    
+    Returns:
+        The manifest with up-to-date 'quarantined' entries
+    """
+    rel_paths = sorted(manifest['files'])
+    
+    print(f"\n🔍 Validating {len(rel_paths)} images...")
+    with ThreadPoolExecutor(max_workers=config.SPLIT_HASH_WORKERS) as pool:
+        errors = pool.map(lambda p: validate_image(os.path.join(index['data_dir'], p)), rel_paths)
+        for rel_path, error in zip(rel_paths, errors):
+            entry = manifest['files'][rel_path]
+            entry.pop('quarantined', None)
+            if error:
+                entry['quarantined'] = error
+    
+    _save_manifest(manifest)
+    print(f"✓ {len(quarantined_files(manifest))} images quarantined")
+    
+    return manifest
+
+
+def get_split(index: dict, manifest: dict, split: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Image paths and integer labels of one split, sorted by path
+    
+    Labels are positions in index['class_names'].
+    """
+    class_to_idx = {name: i for i, name in enumerate(index['class_names'])}
+    rel_paths = sorted(p for p, entry in manifest['files'].items()
+                       if entry['split'] == split and 'quarantined' not in entry)
+    
+    paths = np.array([os.path.join(index['data_dir'], p) for p in rel_paths])
+    labels = np.array([class_to_idx[manifest['files'][p]['label']] for p in rel_paths], dtype=np.int64)
+    
+    return paths, labels
+
+
+def load_split(data_dir: Path, split: str) -> Tuple[np.ndarray, np.ndarray, list]:
+    """
+    Load one split from the persisted manifest, updating it first
+    
+    With config.USE_DEDUP, duplicate images are filtered out as in training.
+    
+    Returns:
+        paths, labels, class_names
+    """
+    index = load_dataset_index(data_dir)
+    manifest = update_split_manifest(index)
+    
+    if config.USE_DEDUP:
+        from src.dataset_dedup import deduplicate
+        manifest = deduplicate(index, manifest)
+    
+    paths, labels = get_split(index, manifest, split)
+    return paths, labels, index['class_names']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or update the persisted train/val/test split')
+    parser.add_argument('--data-dir', type=Path, default=None,
+                       help='Dataset directory (defaults to config.DATA_DIR)')
+    parser.add_argument('--validate-all', action='store_true',
+                       help='Re-validate every image, not only new or modified ones')
+    
+    args = parser.parse_args()
+    
+    index = load_dataset_index(args.data_dir)
+    manifest = update_split_manifest(index)
+    if args.validate_all:
+        manifest = validate_manifest(index, manifest)
+    
+    print(f"\n📦 Dataset Split ({config.SPLIT_MANIFEST_PATH}):")
+    for split in SPLITS:
+        _, labels = get_split(index, manifest, split)
+        print(f"  - {split}: {len(labels)} images")
+    
+    quarantined = quarantined_files(manifest)
+    if quarantined:
+        print(f"\n⚠️  Quarantined images ({len(quarantined)}):")
+        for rel_path, reason in sorted(quarantined.items()):
+            print(f"  - {rel_path}: {reason}")
@@ -0,0 +1,325 @@
+"""
+Knowledge distillation for Plant Disease Detection
+Trains a small CPU-friendly student on soft targets from the trained
+EfficientNetB0 teacher. Teacher logits are computed once and cached to disk.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+from src.data_preprocessing import (
+    setup_gpu,
+    create_datasets,
+    create_tf_dataset,
+    create_distillation_dataset
+)
+from src.model_training_optimized import save_final_model
+
+
+STUDENT_ARCHITECTURES = {
+    'MobileNetV3Small': keras.applications.MobileNetV3Small,
+    'MobileNetV3Large': keras.applications.MobileNetV3Large,
+}
+
+
+class DistillationLoss(keras.losses.Loss):
+    """
+    Weighted sum of the soft-target loss and the hard-label loss
+    
+    y_true packs the integer label in column 0 followed by the teacher logits.
+    """
+    
+    def __init__(self, temperature: float = None, alpha: float = None, name: str = 'distillation_loss'):
+        super().__init__(name=name)
+        self.temperature = temperature or config.DISTILL_TEMPERATURE
+        self.alpha = alpha if alpha is not None else config.DISTILL_ALPHA
+    
+    def call(self, y_true, y_pred):
+        labels = tf.cast(y_true[:, 0], tf.int32)
+        teacher_logits = y_true[:, 1:]
+        student_logits = tf.cast(y_pred, tf.float32)
+        
+        # Soft targets, scaled by T^2 to keep gradient magnitudes comparable
+        soft_targets = tf.nn.softmax(teacher_logits / self.temperature)
+        soft_loss = keras.losses.categorical_crossentropy(
+            soft_targets, student_logits / self.temperature, from_logits=True
+        ) * (self.temperature ** 2)
+        
+        hard_loss = keras.losses.sparse_categorical_crossentropy(
+            labels, student_logits, from_logits=True
+        )
+        
+        return self.alpha * soft_loss + (1 - self.alpha) * hard_loss
+    
+    def get_config(self):
+        return {'temperature': self.temperature, 'alpha': self.alpha, 'name': self.name}
+
+
+def distillation_accuracy(y_true, y_pred):
+    """Accuracy against the hard label packed in column 0 of y_true"""
+    labels = tf.cast(y_true[:, 0], tf.int64)
+    return tf.cast(tf.equal(tf.argmax(y_pred, axis=1), labels), tf.float32)
+
+
+def build_student_model(num_classes: int) -> keras.Model:
+    """
+    Build the student network that outputs logits
+    
+    Args:
+        num_classes: Number of output classes
+    
+    Returns:
+        Uncompiled student model
+    """
+    print(f"\n🏗️  Building {config.STUDENT_ARCHITECTURE} student at {config.STUDENT_IMAGE_SIZE}...")
+    
+    base_model = STUDENT_ARCHITECTURES[config.STUDENT_ARCHITECTURE](
+        include_top=False,
+        weights='imagenet',
+        input_shape=(*config.STUDENT_IMAGE_SIZE, 3),
+        pooling='avg',
+        include_preprocessing=False
+    )
+    
+    inputs = keras.Input(shape=(*config.STUDENT_IMAGE_SIZE, 3))
+    # Data pipeline produces [0, 1], MobileNetV3 expects [-1, 1]
+    x = layers.Rescaling(2.0, offset=-1.0)(inputs)
+    x = base_model(x)
+    x = layers.Dropout(0.2)(x)
+    outputs = layers.Dense(num_classes, dtype='float32', name='logits')(x)
+    
+    model = keras.Model(inputs, outputs, name=f'plant_disease_{config.STUDENT_ARCHITECTURE.lower()}')
+    
+    print(f"✓ Student built")
+    print(f"  - Total parameters: {model.count_params():,}")
+    
+    return model
+
+
+def _teacher_cache_key(paths: np.ndarray) -> str:
+    """Cache key covering the teacher weights file and the image list"""
+    digest = hashlib.sha1()
+    stat = os.stat(config.MODEL_H5_PATH)
+    digest.update(f"{config.MODEL_H5_PATH}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    for path in paths:
+        digest.update(str(path).encode())
+    return digest.hexdigest()[:16]
+
+
+def cache_teacher_logits(teacher: keras.Model, paths: np.ndarray, labels: np.ndarray,
+                         split: str) -> np.ndarray:
+    """
+    Run the teacher once over a split and cache its logits to disk
+    
+    The teacher ends in a softmax, so logits are recovered as log-probabilities
+    (equal to the true logits up to a per-image constant, which softmax ignores).
+    
+    Args:
+        teacher: Trained teacher model
+        paths: Image paths of the split
+        labels: Labels of the split
+        split: Split name used in the cache filename
+    
+    Returns:
+        Teacher logits of shape (num_images, num_classes)
+    """
+    config.DISTILL_CACHE_DIR.mkdir(exist_ok=True)
+    cache_path = config.DISTILL_CACHE_DIR / f"teacher_logits_{split}_{_teacher_cache_key(paths)}.npy"
+    
+    if cache_path.exists():
+        print(f"✓ Using cached teacher logits: {cache_path.name}")
+        return np.load(cache_path).astype(np.float32)
+    
+    print(f"\n🧑‍🏫 Running teacher over {len(paths)} {split} images...")
+    # Logits are matched to paths by position, so a bad image must fail instead of being skipped
+    dataset = create_tf_dataset(paths, labels, is_training=False, skip_errors=False)
+    probabilities = teacher.predict(dataset, verbose=1)
+    logits = np.log(np.clip(probabilities, 1e-7, 1.0)).astype(np.float16)
+    
+    np.save(cache_path, logits)
+    print(f"✓ Teacher logits cached to {cache_path}")
+    
+    return logits.astype(np.float32)
+
+
+def measure_cpu_latency(model: keras.Model, image_size, runs: int = 50) -> dict:
+    """
+    Measure single-image CPU latency of a model
+    
+    Returns:
+        Dictionary with mean and p95 latency in milliseconds
+    """
+    image = np.random.rand(1, *image_size, 3).astype(np.float32)
+    
+    with tf.device('/CPU:0'):
+        model.predict_on_batch(image)  # Warm-up
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            model.predict_on_batch(image)
+            timings.append((time.perf_counter() - start) * 1000)
+    
+    return {
+        'mean_ms': float(np.mean(timings)),
+        'p95_ms': float(np.percentile(timings, 95))
+    }
+
+
+def train_distilled_student():
+    """
+    Distill the trained EfficientNetB0 into a small student model
+    
+    Returns:
+        Serving student model and the distillation report
+    """
+    print("=" * 80)
+    print("🌱 AgriSense AI - Knowledge Distillation")
+    print("=" * 80)
+    
+    setup_gpu()
+    
+    if not config.MODEL_H5_PATH.exists():
+        raise FileNotFoundError(
+            f"Teacher model not found at {config.MODEL_H5_PATH}. Train it first."
+        )
+    
+    print(f"\n📦 Loading teacher from {config.MODEL_H5_PATH}")
+    teacher = keras.models.load_model(config.MODEL_H5_PATH)
+    
+    print("\n📂 Loading datasets...")
+    _, _, teacher_test_ds, dataset_info = create_datasets(config.DATA_DIR)
+    splits = dataset_info['splits']
+    
+    train_logits = cache_teacher_logits(teacher, splits['train']['paths'], splits['train']['labels'], 'train')
+    val_logits = cache_teacher_logits(teacher, splits['val']['paths'], splits['val']['labels'], 'val')
+    
+    train_ds = create_distillation_dataset(
+        splits['train']['paths'], splits['train']['labels'], train_logits,
+        is_training=True, image_size=config.STUDENT_IMAGE_SIZE
+    )
+    val_ds = create_distillation_dataset(
+        splits['val']['paths'], splits['val']['labels'], val_logits,
+        is_training=False, image_size=config.STUDENT_IMAGE_SIZE
+    )
+    
+    student = build_student_model(dataset_info['num_classes'])
+    student.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=config.DISTILL_LEARNING_RATE),
+        loss=DistillationLoss(),
+        metrics=[distillation_accuracy]
+    )
+    
+    print("\n" + "="*80)
+    print("📚 Training student on teacher soft targets")
+    print("="*80)
+    print(f"  - Epochs: {config.DISTILL_EPOCHS}")
+    print(f"  - Temperature: {config.DISTILL_TEMPERATURE}")
+    print(f"  - Alpha (soft weight): {config.DISTILL_ALPHA}")
+    
+    start_time = time.time()
+    
+    history = student.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=config.DISTILL_EPOCHS,
+        callbacks=[
+            EarlyStopping(
+                monitor='val_distillation_accuracy',
+                mode='max',
+                patience=config.EARLY_STOPPING_PATIENCE,
+                restore_best_weights=True,
+                verbose=1
+            ),
+            ReduceLROnPlateau(
+                monitor='val_loss',
+                factor=0.5,
+                patience=config.REDUCE_LR_PATIENCE,
+                min_lr=config.MIN_LEARNING_RATE,
+                verbose=1
+            )
+        ],
+        verbose=1
+    )
+    
+    training_time = time.time() - start_time
+    
+    # Serving model outputs probabilities like the teacher
+    outputs = layers.Activation('softmax', dtype='float32', name='predictions')(student.output)
+    serving_model = keras.Model(student.input, outputs, name=student.name)
+    serving_model.compile(
+        loss='sparse_categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    
+    save_final_model(serving_model, config.STUDENT_MODEL_H5_PATH)
+    
+    # Compare teacher and student on the held-out test set
+    print("\n📊 Evaluating teacher and student on test set...")
+    student_test_ds = create_tf_dataset(
+        splits['test']['paths'], splits['test']['labels'],
+        is_training=False, image_size=config.STUDENT_IMAGE_SIZE
+    )
+    teacher_accuracy = teacher.evaluate(teacher_test_ds, verbose=1, return_dict=True)['accuracy']
+    student_accuracy = serving_model.evaluate(student_test_ds, verbose=1, return_dict=True)['accuracy']
+    
+    print("\n⏱️  Measuring CPU latency...")
+    teacher_latency = measure_cpu_latency(teacher, config.IMAGE_SIZE)
+    student_latency = measure_cpu_latency(serving_model, config.STUDENT_IMAGE_SIZE)
+    
+    report = {
+        'teacher': {
+            'model': 'EfficientNetB0',
+            'image_size': config.IMAGE_SIZE,
+            'parameters': int(teacher.count_params()),
+            'size_mb': os.path.getsize(config.MODEL_H5_PATH) / (1024*1024),
+            'test_accuracy': float(teacher_accuracy),
+            'cpu_latency': teacher_latency
+        },
+        'student': {
+            'model': config.STUDENT_ARCHITECTURE,
+            'image_size': config.STUDENT_IMAGE_SIZE,
+            'parameters': int(serving_model.count_params()),
+            'size_mb': os.path.getsize(config.STUDENT_MODEL_H5_PATH) / (1024*1024),
+            'test_accuracy': float(student_accuracy),
+            'cpu_latency': student_latency
+        },
+        'speedup': teacher_latency['mean_ms'] / student_latency['mean_ms'],
+        'accuracy_drop': float(teacher_accuracy - student_accuracy),
+        'epochs': len(history.history['loss']),
+        'temperature': config.DISTILL_TEMPERATURE,
+        'alpha': config.DISTILL_ALPHA,
+        'training_time_minutes': training_time / 60,
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    with open(config.DISTILLATION_REPORT_PATH, 'w') as f:
+        json.dump(report, f, indent=4)
+    
+    print("\n" + "="*80)
+    print("✅ DISTILLATION COMPLETED")
+    print("="*80)
+    print(f"\n{'Model':<22} {'Accuracy':<12} {'CPU latency':<16} {'Params'}")
+    print("-" * 64)
+    for role in ('teacher', 'student'):
+        entry = report[role]
+        accuracy = f"{entry['test_accuracy']*100:.2f}%"
+        latency = f"{entry['cpu_latency']['mean_ms']:.2f} ms"
+        print(f"{entry['model']:<22} {accuracy:<12} {latency:<16} {entry['parameters']:,}")
+    print("-" * 64)
+    print(f"  - Speedup: {report['speedup']:.2f}x")
+    print(f"  - Accuracy drop: {report['accuracy_drop']*100:.2f} points")
+    print(f"\n✓ Report saved to {config.DISTILLATION_REPORT_PATH}")
+    
+    return serving_model, report
@@ -0,0 +1,445 @@
+"""
+Multi-worker data-parallel training
+Trains synchronously on several CPU nodes with MultiWorkerMirroredStrategy.
+The cluster is described by the TF_CONFIG environment variable; for testing,
+--workers N starts N local processes as stand-in nodes. Every worker reads
+its own shard of the training files, metrics are all-reduced by Keras, and
+only the chief keeps checkpoints, logs and the final model.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from datetime import datetime
+from pathlib import Path
+from typing import Tuple
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+from src.data_preprocessing import setup_gpu, create_tf_dataset, save_class_mapping, balanced_steps_per_epoch
+from src.dataset_index import load_dataset_index
+from src.dataset_split import update_split_manifest, get_split
+from src.dataset_dedup import deduplicate
+from src.output_paths import redirect_outputs
+
+
+def cluster_info() -> Tuple[int, int, bool]:
+    """
+    Read the cluster layout from TF_CONFIG
+    
+    Returns:
+        num_workers, task_index, is_chief (task 'chief', or worker 0 when the
+        cluster has no dedicated chief)
+    """
+    tf_config = json.loads(os.environ.get('TF_CONFIG', '{}'))
+    cluster = tf_config.get('cluster', {})
+    task = tf_config.get('task', {'type': 'worker', 'index': 0})
+    
+    num_workers = len(cluster.get('chief', [])) + len(cluster.get('worker', []))
+    is_chief = task['type'] == 'chief' or (task['type'] == 'worker' and task['index'] == 0
+                                          and 'chief' not in cluster)
+    
+    return max(num_workers, 1), task['index'], is_chief
+
+
+class _MultiWorkerStrategy(tf.distribute.MultiWorkerMirroredStrategy):
+    """
+    MultiWorkerMirroredStrategy with a reduce() that fits how Keras calls it
+    
+    Keras reduces a whole (images, labels) batch at once when model.fit first
+    builds the model, and reduces the scalar step logs along axis 0. The base
+    class only accepts single tensors and needs a batch axis to reduce along.
+    """
+    
+    def reduce(self, reduce_op, value, axis=None):
+        base_reduce = super().reduce
+        
+        def reduce_one(v):
+            rank = self.experimental_local_results(v)[0].shape.rank
+            return base_reduce(reduce_op, v, axis if rank else None)
+        
+        return tf.nest.map_structure(reduce_one, value)
+
+
+def create_strategy() -> tf.distribute.Strategy:
+    """MultiWorkerMirroredStrategy for a multi-worker TF_CONFIG, else the default strategy"""
+    num_workers, _, _ = cluster_info()
+    if num_workers == 1:
+        return tf.distribute.get_strategy()
+    
+    return _MultiWorkerStrategy(
+        communication_options=tf.distribute.experimental.CommunicationOptions(
+            implementation=tf.distribute.experimental.CommunicationImplementation.RING
+        )
+    )
+
+
+def create_worker_dataset(image_paths, labels, is_training: bool = False,
+                          class_weights: dict = None) -> Tuple[tf.data.Dataset, int]:
+    """
+    Build this worker's input pipeline over its own shard of the files
+    
+    Files are sharded before decoding, so no image is read twice per epoch.
+    The pipeline is batched with the global batch size (config.BATCH_SIZE at
+    this point, see train_distributed) and the strategy splits every batch
+    into per-replica batches. Datasets repeat so that all workers run the same
+    number of steps.
+    
+    Args:
+        image_paths: Image file paths of the whole split
+        labels: Integer class labels
+        is_training: Whether to shuffle and augment
+        class_weights: Optional {class: weight}, applied as sample weights
+    
+    Returns:
+        Dataset, steps per epoch
+    """
+    num_workers, task_index, _ = cluster_info()
+    steps = max(len(image_paths) // config.BATCH_SIZE, 1)
+    
+    # Class-balanced sampling replaces class weights for training
+    sampling = config.TRAIN_SAMPLING if is_training else 'shuffle'
+    if sampling == 'balanced':
+        steps = balanced_steps_per_epoch(labels)
+        class_weights = None
+    
+    dataset = create_tf_dataset(image_paths[task_index::num_workers], labels[task_index::num_workers],
+                                is_training=is_training, sampling=sampling)
+    
+    if class_weights:
+        weights = tf.constant([class_weights[i] for i in range(len(class_weights))], dtype=tf.float32)
+        dataset = dataset.map(lambda x, y: (x, y, tf.gather(weights, y)))
+    
+    # Sharded by hand above, so the strategy must not shard again
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+    
+    return dataset.with_options(options).repeat(), steps
+
+
+def load_splits(data_dir: Path) -> Tuple[dict, list]:
+    """
+    Paths and labels of every split from the persisted manifest
+    
+    Returns:
+        {split: (paths, labels)}, class_names
+    """
+    index = load_dataset_index(data_dir)
+    manifest = update_split_manifest(index)
+    if config.USE_DEDUP:
+        manifest = deduplicate(index, manifest)
+    
+    splits = {split: get_split(index, manifest, split) for split in ('train', 'val', 'test')}
+    return splits, index['class_names']
+
+
+class _StepTimer(keras.callbacks.Callback):
+    """Times training steps after a warm-up"""
+    
+    def __init__(self, warmup_steps: int):
+        super().__init__()
+        self.warmup_steps = warmup_steps
+        self.start = None
+        self.timed_steps = 0
+    
+    def on_train_batch_end(self, batch, logs=None):
+        if batch + 1 == self.warmup_steps:
+            self.start = time.perf_counter()
+        elif batch + 1 > self.warmup_steps:
+            self.timed_steps += 1
+    
+    def on_train_end(self, logs=None):
+        self.elapsed = time.perf_counter() - self.start if self.start else 0.0
+
+
+def train_distributed(fine_tune: bool = False, benchmark_steps: int = None, result_path: Path = None):
+    """
+    Train on every worker of the cluster described by TF_CONFIG
+    
+    Must be called at program start: the strategy is created before any other
+    TensorFlow work. All workers run this function; the chief writes the
+    results.
+    
+    Args:
+        fine_tune: If True, performs two-stage fine-tuning
+        benchmark_steps: Instead of training, time this many stage 1 steps
+                         (after 3 warm-up steps) and write images/sec to result_path
+        result_path: Output of the benchmark (chief only)
+    """
+    from src.model_training_optimized import (
+        build_optimized_model,
+        compute_class_weights,
+        get_callbacks,
+        unfreeze_model,
+        save_final_model
+    )
+    
+    strategy = create_strategy()
+    num_workers, task_index, is_chief = cluster_info()
+    
+    # config.BATCH_SIZE is the per-replica batch; from here on it holds the global
+    # batch, which the pipelines and the learning rate scaling work with
+    config.BATCH_SIZE *= strategy.num_replicas_in_sync
+    
+    # Keras cannot all-reduce inside the optimizer's accumulation branch, so
+    # multi-worker runs grow the batch through the workers instead
+    if num_workers > 1:
+        config.ACCUMULATION_STEPS = config.FINE_TUNE_ACCUMULATION_STEPS = 1
+    
+    if is_chief:
+        print("=" * 80)
+        print("🌱 AgriSense AI - Multi-Worker Training")
+        print("=" * 80)
+        print(f"  - Workers: {num_workers}")
+        print(f"  - Replicas in sync: {strategy.num_replicas_in_sync}")
+        print(f"  - Global batch size: {config.BATCH_SIZE}")
+    
+    setup_gpu()
+    
+    # Non-chief workers write their checkpoints, logs and model files to a scratch directory
+    scratch = None if is_chief else redirect_outputs(tempfile.mkdtemp(prefix='agrisense_worker_'))
+    
+    splits, class_names = load_splits(config.DATA_DIR)
+    train_paths, train_labels = splits['train']
+    
+    class_weights = None
+    if config.USE_CLASS_WEIGHTS:
+        class_weights = compute_class_weights(train_labels, len(class_names))
+    
+    train_ds, train_steps = create_worker_dataset(
+        train_paths, train_labels, is_training=True, class_weights=class_weights
+    )
+    val_ds, val_steps = create_worker_dataset(*splits['val'])
+    test_ds, test_steps = create_worker_dataset(*splits['test'])
+    
+    # Model and optimizer variables are mirrored on every replica
+    with strategy.scope():
+        model, base_model = build_optimized_model(len(class_names))
+    
+    if benchmark_steps:
+        warmup_steps = 3
+        timer = _StepTimer(warmup_steps)
+        model.fit(train_ds, steps_per_epoch=warmup_steps + benchmark_steps, epochs=1,
+                  callbacks=[timer], verbose=2 if is_chief else 0)
+        
+        images_per_sec = timer.timed_steps * config.BATCH_SIZE / timer.elapsed
+        if is_chief and result_path:
+            with open(result_path, 'w') as f:
+                json.dump({'workers': num_workers, 'images_per_sec': images_per_sec,
+                           'step_ms': timer.elapsed * 1000 / timer.timed_steps}, f)
+        
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+        return model, None
+    
+    # Checkpoints and TensorBoard logs are written by every worker (saving
+    # reads mirrored variables collectively), but only the chief's are kept
+    start_time = time.time()
+    history_stage1 = model.fit(
+        train_ds,
+        validation_data=val_ds,
+        steps_per_epoch=train_steps,
+        validation_steps=val_steps,
+        epochs=config.EPOCHS,
+        callbacks=get_callbacks('stage1'),
+        verbose=1 if is_chief else 0
+    )
+    stage1_time = time.time() - start_time
+    
+    stage2_time = 0.0
+    if fine_tune:
+        with strategy.scope():
+            unfreeze_model(model, base_model, num_layers=config.FINE_TUNE_LAYERS)
+        
+        start_time = time.time()
+        model.fit(
+            train_ds,
+            validation_data=val_ds,
+            steps_per_epoch=train_steps,
+            validation_steps=val_steps,
+            epochs=config.FINE_TUNE_EPOCHS,
+            callbacks=get_callbacks('stage2'),
+            verbose=1 if is_chief else 0
+        )
+        stage2_time = time.time() - start_time
+    
+    test_results = model.evaluate(test_ds, steps=test_steps, verbose=1 if is_chief else 0)
+    
+    save_final_model(model, config.MODEL_H5_PATH)
+    
+    if is_chief:
+        save_class_mapping(class_names)
+        
+        training_info = {
+            'model_name': 'EfficientNetB0',
+            'num_classes': len(class_names),
+            'class_names': class_names,
+            'image_size': config.IMAGE_SIZE,
+            'num_workers': num_workers,
+            'replicas_in_sync': strategy.num_replicas_in_sync,
+            'batch_size_per_replica': config.BATCH_SIZE // strategy.num_replicas_in_sync,
+            'global_batch_size': config.BATCH_SIZE,
+            'stage1_epochs': len(history_stage1.history['loss']),
+            'final_val_accuracy': float(history_stage1.history['val_accuracy'][-1]),
+            'test_accuracy': float(test_results[1]),
+            'fine_tuned': fine_tune,
+            'training_time_stage1_minutes': stage1_time / 60,
+            'total_training_time_minutes': (stage1_time + stage2_time) / 60,
+            'timestamp': datetime.now().isoformat()
+        }
+        with open(config.MODELS_DIR / "training_info.json", 'w') as f:
+            json.dump(training_info, f, indent=4)
+        
+        print(f"\n✓ Distributed training complete: test accuracy {test_results[1]*100:.2f}%")
+    
+    if scratch:
+        shutil.rmtree(scratch, ignore_errors=True)
+    
+    return model, class_names
+
+
+def _free_port() -> int:
+    """A currently unused local TCP port"""
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def launch_local_workers(num_workers: int, worker_args: list) -> int:
+    """
+    Run this script as num_workers local processes forming one cluster
+    
+    Each process gets its own TF_CONFIG and an equal share of the CPU cores.
+    The chief prints to the console; the other workers log to
+    LOGS_DIR/worker_<i>.log.
+    
+    Returns:
+        Highest exit code of the workers
+    """
+    # Prepare the index, split manifest and dedup cache once, so workers only read them
+    load_splits(config.DATA_DIR)
+    
+    workers = [f"localhost:{_free_port()}" for _ in range(num_workers)]
+    threads = max(os.cpu_count() // num_workers, 1)
+    config.LOGS_DIR.mkdir(parents=True, exist_ok=True)
+    
+    processes, log_files = [], []
+    for index in range(num_workers):
+        env = dict(os.environ)
+        env['TF_CONFIG'] = json.dumps({'cluster': {'worker': workers},
+                                       'task': {'type': 'worker', 'index': index}})
+        env['TF_NUM_INTRAOP_THREADS'] = str(threads)
+        env['TF_NUM_INTEROP_THREADS'] = str(min(threads, 2))
+        
+        output = None
+        if index > 0:
+            output = open(config.LOGS_DIR / f"worker_{index}.log", 'w')
+            log_files.append(output)
+        
+        processes.append(subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), *worker_args],
+            env=env, stdout=output, stderr=subprocess.STDOUT if output else None
+        ))
+    
+    return_codes = [process.wait() for process in processes]
+    for log_file in log_files:
+        log_file.close()
+    
+    return max(return_codes)
+
+
+def scaling_report(worker_counts: list, steps: int = 20) -> dict:
+    """
+    Measure training throughput for several numbers of local workers
+    
+    Writes models/scaling_report.json. Efficiency is the throughput relative
+    to perfect linear scaling from the smallest worker count.
+    
+    Args:
+        worker_counts: Numbers of workers to try
+        steps: Timed stage 1 steps per run
+    
+    Returns:
+        Scaling report
+    """
+    results = []
+    
+    for num_workers in sorted(worker_counts):
+        print(f"\n⏱️  Benchmarking {num_workers} worker(s)...")
+        with tempfile.TemporaryDirectory() as tmp:
+            result_path = Path(tmp) / "result.json"
+            args = ['--benchmark-steps', str(steps), '--result-path', str(result_path)]
+            
+            if launch_local_workers(num_workers, args) != 0 or not result_path.exists():
+                print(f"  ⚠️  Run with {num_workers} worker(s) failed")
+                continue
+            
+            with open(result_path, 'r') as f:
+                results.append(json.load(f))
+        print(f"  - {results[-1]['images_per_sec']:,.1f} images/sec")
+    
+    if results:
+        base = results[0]
+        for result in results:
+            ideal = base['images_per_sec'] * result['workers'] / base['workers']
+            result['speedup'] = result['images_per_sec'] / base['images_per_sec']
+            result['efficiency'] = result['images_per_sec'] / ideal
+    
+    report = {
+        'batch_size_per_worker': config.BATCH_SIZE,
+        'steps': steps,
+        'cpu_count': os.cpu_count(),
+        'results': results,
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    with open(config.MODELS_DIR / "scaling_report.json", 'w') as f:
+        json.dump(report, f, indent=4)
+    
+    print("\n📊 Scaling:")
+    for result in results:
+        print(f"  - {result['workers']} worker(s): {result['images_per_sec']:,.1f} images/sec, "
+              f"speedup {result['speedup']:.2f}x, efficiency {result['efficiency']*100:.0f}%")
+    print(f"\n✓ Report saved to {config.MODELS_DIR / 'scaling_report.json'}")
+    
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Multi-worker training with MultiWorkerMirroredStrategy')
+    parser.add_argument('--workers', type=int, default=0,
+                       help='Start this many local worker processes (testing without real nodes)')
+    parser.add_argument('--fine-tune', action='store_true',
+                       help='Enable two-stage fine-tuning')
+    parser.add_argument('--epochs', type=int, default=None,
+                       help='Override number of epochs')
+    parser.add_argument('--scaling', type=str, default=None,
+                       help='Comma-separated worker counts for the scaling report, e.g. 1,2,4')
+    parser.add_argument('--steps', type=int, default=20,
+                       help='Timed steps per run of the scaling report')
+    parser.add_argument('--benchmark-steps', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--result-path', type=Path, default=None, help=argparse.SUPPRESS)
+    
+    args = parser.parse_args()
+    
+    if args.epochs:
+        config.EPOCHS = args.epochs
+    
+    if args.scaling:
+        scaling_report([int(n) for n in args.scaling.split(',')], args.steps)
+    elif args.workers and 'TF_CONFIG' not in os.environ:
+        worker_args = ['--fine-tune'] if args.fine_tune else []
+        if args.epochs:
+            worker_args += ['--epochs', str(args.epochs)]
+        sys.exit(launch_local_workers(args.workers, worker_args))
+    else:
+        train_distributed(args.fine_tune, args.benchmark_steps, args.result_path)
@@ -0,0 +1,150 @@
+"""
+Backbone feature cache for frozen-base training
+Runs the frozen EfficientNetB0 once (optionally over several augmented views)
+and stores the pooled embeddings in memory-mapped float16 arrays, so the
+classification head can be trained directly on features
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+from typing import Tuple
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+from src.data_preprocessing import create_tf_dataset, parallel_calls, finalize_pipeline
+
+
+def weights_fingerprint(model: tf.keras.Model) -> str:
+    """Hash of a model's weight values"""
+    digest = hashlib.sha1()
+    for weight in model.weights:
+        digest.update(np.ascontiguousarray(weight.numpy()).tobytes())
+    return digest.hexdigest()
+
+
+def dataset_fingerprint(paths: np.ndarray) -> str:
+    """Hash of the image list including each file's size and modification time"""
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _cache_key(base_model, paths, views: int, augment: bool) -> str:
+    """Key that changes whenever the images, base weights or view settings change"""
+    digest = hashlib.sha1()
+    digest.update(dataset_fingerprint(paths).encode())
+    digest.update(weights_fingerprint(base_model).encode())
+    digest.update(f"{config.IMAGE_SIZE}:{views}:{augment}".encode())
+    return digest.hexdigest()[:16]
+
+
+def build_feature_cache(base_model: tf.keras.Model, paths: np.ndarray, labels: np.ndarray,
+                        split: str, views: int = 1, augment: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Extract pooled backbone features for a split, reusing a valid cache
+    
+    Args:
+        base_model: Frozen backbone with pooled output
+        paths: Image paths of the split
+        labels: Labels of the split
+        split: Split name ('train', 'val', ...)
+        views: Number of augmented views per image
+        augment: Whether to apply training augmentation before extraction
+    
+    Returns:
+        Memory-mapped float16 features of shape (views * N, dim) and matching labels
+    """
+    key = _cache_key(base_model, paths, views, augment)
+    split_dir = config.FEATURE_CACHE_DIR / split
+    cache_dir = split_dir / key
+    meta_path = cache_dir / "meta.json"
+    
+    if meta_path.exists():
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta.get('complete'):
+            print(f"✓ Using cached {split} features ({meta['num_features']} x {meta['dim']})")
+            features = np.memmap(cache_dir / "features.f16", dtype=np.float16, mode='r',
+                                 shape=(meta['num_features'], meta['dim']))
+            return features, np.load(cache_dir / "labels.npy")
+    
+    # Invalidate caches built from other images or base weights
+    if split_dir.exists():
+        shutil.rmtree(split_dir)
+    cache_dir.mkdir(parents=True)
+    
+    num_images = len(paths)
+    dim = int(base_model.output_shape[-1])
+    features = np.memmap(cache_dir / "features.f16", dtype=np.float16, mode='w+',
+                         shape=(views * num_images, dim))
+    
+    extract = tf.function(lambda images: base_model(images, training=False))
+    
+    print(f"\n🧊 Extracting {split} features: {num_images} images x {views} view(s)...")
+    for view in range(views):
+        # Rows are written by position, so a bad image must fail instead of being skipped
+        dataset = create_tf_dataset(paths, labels, is_training=augment, shuffle=False, skip_errors=False)
+        offset = view * num_images
+        for images, _ in dataset:
+            batch_features = extract(images).numpy()
+            features[offset:offset + len(batch_features)] = batch_features
+            offset += len(batch_features)
+        print(f"  - View {view + 1}/{views} done")
+    
+    features.flush()
+    cached_labels = np.tile(np.asarray(labels), views)
+    np.save(cache_dir / "labels.npy", cached_labels)
+    
+    with open(meta_path, 'w') as f:
+        json.dump({
+            'split': split,
+            'num_images': num_images,
+            'num_features': views * num_images,
+            'dim': dim,
+            'views': views,
+            'augment': augment,
+            'complete': True
+        }, f, indent=4)
+    
+    print(f"✓ Features cached to {cache_dir}")
+    
+    return np.memmap(cache_dir / "features.f16", dtype=np.float16, mode='r',
+                     shape=(views * num_images, dim)), cached_labels
+
+
+def create_feature_dataset(features: np.ndarray, labels: np.ndarray,
+                           is_training: bool = False) -> tf.data.Dataset:
+    """
+    Create a batched dataset that reads feature rows from the memory-mapped cache
+    
+    Only the rows of the current batch are read, so memory use does not grow
+    with the size of the cache.
+    """
+    dim = features.shape[1]
+    
+    def read_rows(indices):
+        indices = np.sort(indices)
+        return np.asarray(features[indices], dtype=np.float32), labels[indices]
+    
+    dataset = tf.data.Dataset.range(len(features))
+    
+    if is_training:
+        dataset = dataset.shuffle(buffer_size=len(features), seed=config.RANDOM_SEED)
+    
+    dataset = dataset.batch(config.BATCH_SIZE)
+    dataset = dataset.map(
+        lambda idx: tf.numpy_function(read_rows, [idx], (tf.float32, tf.as_dtype(labels.dtype))),
+        num_parallel_calls=parallel_calls()
+    )
+    dataset = dataset.map(lambda x, y: (tf.ensure_shape(x, [None, dim]), tf.ensure_shape(y, [None])))
+    dataset = finalize_pipeline(dataset)
+    
+    return dataset
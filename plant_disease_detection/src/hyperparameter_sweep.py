@@ -0,0 +1,446 @@
+"""
+Hyperparameter sweep
+Trains configurations sampled from config.SWEEP_SPACE as separate processes,
+a few at a time, each limited to its share of the CPU threads and stopped if
+it exceeds a memory limit. Trials report their validation accuracy after
+every epoch; at the pruning rungs (SWEEP_MIN_EPOCHS * SWEEP_REDUCTION_FACTOR^k
+epochs) a trial only continues if it is in the top 1/SWEEP_REDUCTION_FACTOR
+of the trials that reached that rung (asynchronous successive halving).
+Everything is stored in a SQLite study database, and the report ranks the
+configurations by accuracy and by training cost.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import itertools
+import resource
+import subprocess
+import numpy as np
+import tensorflow as tf
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+from src.output_paths import redirect_outputs
+
+
+STATUS_ICONS = {'complete': '✓', 'pruned': '✂️ ', 'failed': '⚠️ '}
+
+
+class TrialPruned(Exception):
+    """Raised inside a trial when it falls behind at a pruning rung"""
+
+
+def connect(db_path: Path = None) -> sqlite3.Connection:
+    """Open the study database, creating the tables if needed"""
+    db_path = Path(db_path or config.SWEEP_DB_PATH)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.row_factory = sqlite3.Row
+    # Trials write from several processes at once
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS studies (
+            name TEXT PRIMARY KEY, space TEXT, settings TEXT, created TEXT
+        );
+        CREATE TABLE IF NOT EXISTS trials (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, study TEXT, params TEXT, status TEXT,
+            best_val_accuracy REAL, test_accuracy REAL, epochs INTEGER, train_minutes REAL,
+            peak_rss_mb REAL, error TEXT, started TEXT, finished TEXT
+        );
+        CREATE TABLE IF NOT EXISTS trial_epochs (
+            trial_id INTEGER, epoch INTEGER, val_accuracy REAL, val_loss REAL, elapsed_seconds REAL,
+            PRIMARY KEY (trial_id, epoch)
+        );
+    """)
+    return conn
+
+
+def pruning_rungs(max_epochs: int) -> list:
+    """Epochs at which trials are compared (the last epoch is never a rung)"""
+    rungs = []
+    epoch = config.SWEEP_MIN_EPOCHS
+    while epoch < max_epochs:
+        rungs.append(epoch)
+        epoch *= config.SWEEP_REDUCTION_FACTOR
+    return rungs
+
+
+def should_prune(conn: sqlite3.Connection, study: str, trial_id: int, rung: int) -> bool:
+    """
+    Whether a trial that just reached a rung falls outside the top 1/reduction factor
+    
+    Trials are compared on their best validation accuracy up to the rung. Until
+    a rung has seen at least reduction-factor trials, every trial continues.
+    """
+    rows = conn.execute("""
+        SELECT e.trial_id, MAX(e.val_accuracy) AS best FROM trial_epochs e
+        JOIN trials t ON t.id = e.trial_id
+        WHERE t.study = ? AND e.epoch <= ?
+          AND e.trial_id IN (SELECT trial_id FROM trial_epochs WHERE epoch = ?)
+        GROUP BY e.trial_id
+    """, (study, rung, rung)).fetchall()
+    
+    eta = config.SWEEP_REDUCTION_FACTOR
+    if len(rows) < eta:
+        return False
+    
+    scores = sorted((row['best'] for row in rows), reverse=True)
+    own = next(row['best'] for row in rows if row['trial_id'] == trial_id)
+    return own < scores[len(rows) // eta - 1]
+
+
+class TrialReporter(tf.keras.callbacks.Callback):
+    """Record validation metrics of a trial after every epoch and prune at the rungs"""
+    
+    def __init__(self, db_path: Path, study: str, trial_id: int, max_epochs: int):
+        super().__init__()
+        self.db_path = db_path
+        self.study = study
+        self.trial_id = trial_id
+        self.rungs = pruning_rungs(max_epochs)
+        self.epochs = 0
+        self.start = time.time()
+        self.conn = connect(db_path)
+    
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        # Counted across both stages
+        self.epochs += 1
+        
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO trial_epochs VALUES (?, ?, ?, ?, ?)", (
+                self.trial_id, self.epochs, float(logs.get('val_accuracy', 0.0)),
+                float(logs.get('val_loss', 0.0)), time.time() - self.start
+            ))
+        prune = self.epochs in self.rungs and should_prune(self.conn, self.study, self.trial_id, self.epochs)
+        
+        if prune:
+            raise TrialPruned(f"pruned at epoch {self.epochs}")
+
+
+def run_trial(db_path: Path, trial_id: int, fine_tune: bool, threads: int, gpu_memory: Optional[int]):
+    """
+    Train one trial (runs in its own process, see run_sweep)
+    
+    Args:
+        db_path: Study database
+        trial_id: Trial to run
+        fine_tune: Whether to run stage 2
+        threads: CPU threads for this trial
+        gpu_memory: GPU memory limit in MB (None keeps GPU_MEMORY_LIMIT)
+    """
+    from src.model_training_optimized import train_optimized_model
+    
+    conn = connect(db_path)
+    with conn:
+        trial = conn.execute("SELECT * FROM trials WHERE id = ?", (trial_id,)).fetchone()
+        conn.execute("UPDATE trials SET status = 'running', started = ? WHERE id = ?",
+                     (datetime.now().isoformat(), trial_id))
+    
+    for name, value in json.loads(trial['params']).items():
+        setattr(config, name, value)
+    
+    config.PRIVATE_THREADPOOL_SIZE = threads
+    if gpu_memory:
+        config.GPU_MEMORY_LIMIT = gpu_memory
+    redirect_outputs(config.SWEEP_DIR / trial['study'] / f"trial_{trial_id:04d}")
+    # Serving exports are not part of a trial's cost and must not reach the API
+    config.EXPORT_INFERENCE_MODEL = False
+    config.EXPORT_IMAGE_SIZES = []
+    
+    max_epochs = config.EPOCHS + (config.FINE_TUNE_EPOCHS if fine_tune else 0)
+    reporter = TrialReporter(db_path, trial['study'], trial_id, max_epochs)
+    
+    status, error, test_accuracy = 'complete', None, None
+    try:
+        train_optimized_model(fine_tune=fine_tune, extra_callbacks=[reporter])
+        with open(config.MODELS_DIR / "training_info.json", 'r') as f:
+            test_accuracy = json.load(f)['test_accuracy']
+    except TrialPruned as e:
+        status, error = 'pruned', str(e)
+    except Exception as e:
+        status, error = 'failed', f"{type(e).__name__}: {e}"
+    
+    reporter.conn.close()
+    with conn:
+        best = conn.execute("SELECT MAX(val_accuracy) FROM trial_epochs WHERE trial_id = ?",
+                            (trial_id,)).fetchone()[0]
+        conn.execute("""
+            UPDATE trials SET status = ?, best_val_accuracy = ?, test_accuracy = ?, epochs = ?,
+                              train_minutes = ?, peak_rss_mb = ?, error = ?, finished = ?
+            WHERE id = ?
+        """, (status, best, test_accuracy, reporter.epochs, (time.time() - reporter.start) / 60,
+              resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, error,
+              datetime.now().isoformat(), trial_id))
+    conn.close()
+    
+    print(f"\n✓ Trial {trial_id} {status}" + (f" ({error})" if error else ""))
+    if status == 'failed':
+        sys.exit(1)
+
+
+def sample_configs(space: dict, num_trials: int, exclude: list = ()) -> list:
+    """
+    Distinct configurations drawn at random from the grid of values
+    
+    Args:
+        space: {setting: [values]}
+        num_trials: Number of configurations wanted
+        exclude: Configurations that were already tried
+    
+    Returns:
+        List of {setting: value}
+    """
+    names = sorted(space)
+    grid = list(itertools.product(*(space[name] for name in names)))
+    order = np.random.RandomState(config.RANDOM_SEED).permutation(len(grid))
+    
+    tried = {json.dumps(params, sort_keys=True) for params in exclude}
+    configs = []
+    for i in order:
+        params = dict(zip(names, grid[i]))
+        if json.dumps(params, sort_keys=True) not in tried:
+            configs.append(params)
+        if len(configs) == num_trials:
+            break
+    
+    return configs
+
+
+def _rss_mb(pid: int) -> float:
+    """Resident memory of a process in MB (0 where /proc is not available)"""
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def run_sweep(study: str = 'default', space: dict = None, num_trials: int = None, workers: int = None,
+              fine_tune: bool = False, threads: int = None, memory_mb: int = None) -> dict:
+    """
+    Run a study: sample configurations and train them in parallel processes
+    
+    Configurations already tried in the same study are not sampled again, so
+    running the same study twice adds new trials to it.
+    
+    Args:
+        study: Study name
+        space: {setting: [values]} (defaults to config.SWEEP_SPACE)
+        num_trials: Trials to add (defaults to config.SWEEP_TRIALS)
+        workers: Trials trained at the same time (defaults to config.SWEEP_WORKERS)
+        fine_tune: Whether trials also run stage 2
+        threads: CPU threads per trial (defaults to cores / workers)
+        memory_mb: Resident memory limit per trial (defaults to config.SWEEP_MEMORY_LIMIT_MB)
+    
+    Returns:
+        Sweep report (see sweep_report)
+    """
+    from src.dataset_split import load_split
+    
+    space = space or config.SWEEP_SPACE
+    num_trials = num_trials or config.SWEEP_TRIALS
+    workers = workers or config.SWEEP_WORKERS
+    threads = threads or config.SWEEP_THREADS_PER_TRIAL or max(os.cpu_count() // workers, 1)
+    memory_mb = memory_mb or config.SWEEP_MEMORY_LIMIT_MB
+    gpu_memory = config.GPU_MEMORY_LIMIT // workers if tf.config.list_physical_devices('GPU') else None
+    
+    print("=" * 80)
+    print(f"🔎 AgriSense AI - Hyperparameter Sweep ({study})")
+    print("=" * 80)
+    
+    # Prepare the index, split manifest and dedup cache once, so trials only read them
+    load_split(config.DATA_DIR, 'train')
+    
+    conn = connect()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO studies VALUES (?, ?, ?, ?)", (
+            study, json.dumps(space), json.dumps({'fine_tune': fine_tune, 'epochs': config.EPOCHS}),
+            datetime.now().isoformat()
+        ))
+        tried = [json.loads(row['params']) for row in
+                 conn.execute("SELECT params FROM trials WHERE study = ?", (study,))]
+        queue = []
+        for params in sample_configs(space, num_trials, tried):
+            cursor = conn.execute("INSERT INTO trials (study, params, status) VALUES (?, ?, 'queued')",
+                                  (study, json.dumps(params)))
+            queue.append((cursor.lastrowid, params))
+    
+    print(f"\n🧪 {len(queue)} trials, {workers} at a time, {threads} thread(s) and "
+          f"{memory_mb} MB each")
+    print(f"  - Pruning rungs: {pruning_rungs(config.EPOCHS + (config.FINE_TUNE_EPOCHS if fine_tune else 0))} "
+          f"(keep top 1/{config.SWEEP_REDUCTION_FACTOR})")
+    
+    running = {}
+    while queue or running:
+        while queue and len(running) < workers:
+            trial_id, params = queue.pop(0)
+            trial_dir = config.SWEEP_DIR / study / f"trial_{trial_id:04d}"
+            trial_dir.mkdir(parents=True, exist_ok=True)
+            
+            env = dict(os.environ)
+            env['TF_NUM_INTRAOP_THREADS'] = str(threads)
+            env['TF_NUM_INTEROP_THREADS'] = str(min(threads, 2))
+            env['OMP_NUM_THREADS'] = str(threads)
+            
+            args = ['--run-trial', str(trial_id), '--threads', str(threads)]
+            if fine_tune:
+                args.append('--fine-tune')
+            if gpu_memory:
+                args += ['--gpu-memory', str(gpu_memory)]
+            args += ['--epochs', str(config.EPOCHS)]
+            
+            log_file = open(trial_dir / "trial.log", 'w')
+            process = subprocess.Popen([sys.executable, str(Path(__file__).resolve()), *args],
+                                       env=env, stdout=log_file, stderr=subprocess.STDOUT)
+            running[trial_id] = (process, log_file)
+            print(f"  ▶️  Trial {trial_id}: {params}")
+        
+        time.sleep(1)
+        
+        for trial_id, (process, log_file) in list(running.items()):
+            if process.poll() is None:
+                if _rss_mb(process.pid) > memory_mb:
+                    process.kill()
+                    process.wait()
+                    with conn:
+                        conn.execute("UPDATE trials SET status = 'failed', error = ?, finished = ? "
+                                     "WHERE id = ?", (f"memory limit ({memory_mb} MB) exceeded",
+                                                      datetime.now().isoformat(), trial_id))
+                else:
+                    continue
+            
+            log_file.close()
+            del running[trial_id]
+            
+            with conn:
+                row = conn.execute("SELECT * FROM trials WHERE id = ?", (trial_id,)).fetchone()
+                if row['status'] in ('queued', 'running'):
+                    conn.execute("UPDATE trials SET status = 'failed', error = ?, finished = ? WHERE id = ?",
+                                 (f"exit code {process.returncode}", datetime.now().isoformat(), trial_id))
+                    row = conn.execute("SELECT * FROM trials WHERE id = ?", (trial_id,)).fetchone()
+            
+            accuracy = f"val {row['best_val_accuracy']:.4f}" if row['best_val_accuracy'] is not None else ""
+            print(f"  {STATUS_ICONS[row['status']]} Trial {trial_id} {row['status']} after {row['epochs'] or 0} epoch(s) {accuracy}"
+                  + (f" - {row['error']}" if row['status'] == 'failed' else ""))
+    
+    conn.close()
+    return sweep_report(study)
+
+
+def sweep_report(study: str = 'default') -> dict:
+    """
+    Rank the trials of a study by accuracy and by training cost
+    
+    Trials are ranked on their best validation accuracy (test accuracy is
+    reported but not used for selection). The cost ranking and the
+    accuracy/cost frontier only include completed trials.
+    
+    Returns:
+        Report, also written to SWEEP_DIR/<study>_report.json
+    """
+    conn = connect()
+    trials = [dict(row) for row in conn.execute(
+        "SELECT * FROM trials WHERE study = ? AND status IN ('complete', 'pruned')", (study,))]
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM trials WHERE study = ? GROUP BY status",
+                               (study,)).fetchall())
+    conn.close()
+    
+    for trial in trials:
+        trial['params'] = json.loads(trial['params'])
+    
+    by_accuracy = sorted(trials, key=lambda t: -(t['best_val_accuracy'] or 0))
+    complete = [t for t in trials if t['status'] == 'complete']
+    by_cost = sorted(complete, key=lambda t: t['train_minutes'])
+    
+    # Completed trials that no other trial matches or beats on both accuracy and cost
+    def dominates(o, t):
+        return (o['best_val_accuracy'] >= t['best_val_accuracy'] and o['train_minutes'] <= t['train_minutes']
+                and (o['best_val_accuracy'] > t['best_val_accuracy'] or o['train_minutes'] < t['train_minutes']))
+    
+    frontier = [t for t in by_cost if not any(dominates(o, t) for o in complete)]
+    
+    report = {
+        'study': study,
+        'trial_counts': counts,
+        'pruned_minutes': sum(t['train_minutes'] or 0 for t in trials if t['status'] == 'pruned'),
+        'by_accuracy': [t['id'] for t in by_accuracy],
+        'by_cost': [t['id'] for t in by_cost],
+        'frontier': [t['id'] for t in frontier],
+        'trials': {t['id']: t for t in trials},
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    config.SWEEP_DIR.mkdir(parents=True, exist_ok=True)
+    report_path = config.SWEEP_DIR / f"{study}_report.json"
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    
+    def describe(t):
+        test = f", test {t['test_accuracy']:.4f}" if t['test_accuracy'] is not None else ""
+        return (f"#{t['id']:<4} val {t['best_val_accuracy'] or 0:.4f}{test}, {t['train_minutes']:.1f} min, "
+                f"{t['epochs']} epoch(s), {t['status']}  {t['params']}")
+    
+    print(f"\n📊 Study '{study}': {counts}")
+    print("\n🏆 By validation accuracy:")
+    for t in by_accuracy[:10]:
+        print(f"  {describe(t)}")
+    print("\n⏱️  By training cost (completed):")
+    for t in by_cost[:10]:
+        print(f"  {describe(t)}")
+    print("\n⚖️  Accuracy/cost frontier:")
+    for t in frontier:
+        print(f"  {describe(t)}")
+    print(f"\n✓ Report saved to {report_path}")
+    
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter sweep with early pruning')
+    parser.add_argument('--study', type=str, default='default',
+                       help='Study name (trials accumulate per study)')
+    parser.add_argument('--trials', type=int, default=None,
+                       help='Number of configurations to try')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Trials trained in parallel')
+    parser.add_argument('--threads', type=int, default=None,
+                       help='CPU threads per trial')
+    parser.add_argument('--memory-mb', type=int, default=None,
+                       help='Stop trials whose resident memory exceeds this')
+    parser.add_argument('--epochs', type=int, default=None,
+                       help='Stage 1 epochs per trial')
+    parser.add_argument('--fine-tune', action='store_true',
+                       help='Also run stage 2 in every trial')
+    parser.add_argument('--space', type=str, default=None,
+                       help='Search space as JSON (or a path to a JSON file) instead of SWEEP_SPACE')
+    parser.add_argument('--report', action='store_true',
+                       help='Only print the report of an existing study')
+    parser.add_argument('--run-trial', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--gpu-memory', type=int, default=None, help=argparse.SUPPRESS)
+    
+    args = parser.parse_args()
+    
+    if args.epochs:
+        config.EPOCHS = args.epochs
+    
+    if args.run_trial is not None:
+        run_trial(config.SWEEP_DB_PATH, args.run_trial, args.fine_tune, args.threads, args.gpu_memory)
+    elif args.report:
+        sweep_report(args.study)
+    else:
+        space = None
+        if args.space:
+            space = json.loads(Path(args.space).read_text() if os.path.exists(args.space) else args.space)
+        run_sweep(args.study, space, args.trials, args.workers, args.fine_tune, args.threads, args.memory_mb)
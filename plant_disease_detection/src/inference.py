@@ -1,6 +1,7 @@
 """
 Inference utilities for Plant Disease Detection
 """
+import io
 import json
 import numpy as np
 import tensorflow as tf
@@ -15,26 +16,73 @@ sys.path.append(str(Path(__file__).parent.parent))
 import config
 
 
+def resize_batch_for_model(model, image_batch: np.ndarray) -> np.ndarray:
+    """
+    Resize a preprocessed batch to a model's input size if it differs
+    
+    Args:
+        model: Keras model with a fixed spatial input shape
+        image_batch: Array of shape (batch, height, width, 3)
+    """
+    target_size = tuple(model.input_shape[1:3])
+    if None in target_size or target_size == tuple(image_batch.shape[1:3]):
+        return image_batch
+    return tf.image.resize(image_batch, target_size).numpy()
+
+
+def model_path_for_size(image_size: Tuple[int, int] = None) -> Path:
+    """
+    Path of the serving model exported at an image size
+    
+    Args:
+        image_size: (height, width); None or IMAGE_SIZE gives INFERENCE_MODEL_H5_PATH
+            when it has been exported, MODEL_H5_PATH otherwise
+    """
+    if image_size is None or tuple(image_size) == tuple(config.IMAGE_SIZE):
+        # The inference-only export is the same model with BatchNorm folded
+        # (ignored when older than the trained model it came from)
+        inference_path, model_path = config.INFERENCE_MODEL_H5_PATH, config.MODEL_H5_PATH
+        if inference_path.exists() and (not model_path.exists()
+                                        or inference_path.stat().st_mtime >= model_path.stat().st_mtime):
+            return config.INFERENCE_MODEL_H5_PATH
+        return config.MODEL_H5_PATH
+    return config.MODEL_H5_PATH.with_name(
+        f"{config.MODEL_H5_PATH.stem}_{image_size[0]}x{image_size[1]}{config.MODEL_H5_PATH.suffix}"
+    )
+
+
 class DiseasePredictor:
     """Plant disease prediction class"""
     
-    def __init__(self, model_path: Path = None, class_mapping_path: Path = None):
+    def __init__(self, model_path: Path = None, class_mapping_path: Path = None,
+                 fast_model_path: Path = None, cascade_threshold: float = None,
+                 image_size: Tuple[int, int] = None):
         """
         Initialize the predictor
         
         Args:
             model_path: Path to the trained model (.h5 file)
             class_mapping_path: Path to class mapping JSON
+            fast_model_path: Path to the small first-tier model for the cascade
+            cascade_threshold: Confidence above which the fast model answers alone
+            image_size: Resolution of the exported model to load when model_path
+                is not given (e.g. (160, 160)); defaults to IMAGE_SIZE
         """
-        self.model_path = model_path or config.MODEL_H5_PATH
+        self.model_path = model_path or model_path_for_size(image_size)
         self.class_mapping_path = class_mapping_path or config.CLASS_MAPPING_PATH
+        self.fast_model_path = fast_model_path or config.FAST_MODEL_H5_PATH
+        self.cascade_threshold = cascade_threshold
         
         # Load model and class mapping
         self.model = None
+        self.fast_model = None
         self.class_mapping = None
         self.class_names = []
+        self.image_size = None
+        self.cascade_stats = {'fast': 0, 'escalated': 0}
         
         self._load_model()
+        self._load_fast_model()
         self._load_class_mapping()
     
     def _load_model(self):
@@ -43,8 +91,30 @@ class DiseasePredictor:
             raise FileNotFoundError(f"Model not found at {self.model_path}")
         
         print(f"Loading model from {self.model_path}...")
-        self.model = tf.keras.models.load_model(self.model_path)
-        print("✓ Model loaded successfully")
+        self.model = tf.keras.models.load_model(self.model_path, compile=False)
+        
+        # Input size comes from the model (IMAGE_SIZE if it accepts any size)
+        self.image_size = tuple(self.model.input_shape[1:3])
+        if None in self.image_size:
+            self.image_size = tuple(config.IMAGE_SIZE)
+        print(f"✓ Model loaded successfully (input {self.image_size[0]}x{self.image_size[1]})")
+    
+    def _load_fast_model(self):
+        """Load the first-tier cascade model if one is available"""
+        if not config.USE_CASCADE or not self.fast_model_path.exists():
+            return
+        
+        print(f"Loading fast cascade model from {self.fast_model_path}...")
+        self.fast_model = tf.keras.models.load_model(self.fast_model_path, compile=False)
+        
+        # Threshold comes from calibration unless given explicitly
+        if self.cascade_threshold is None:
+            self.cascade_threshold = config.CASCADE_DEFAULT_THRESHOLD
+            if config.CASCADE_CONFIG_PATH.exists():
+                with open(config.CASCADE_CONFIG_PATH, 'r') as f:
+                    self.cascade_threshold = json.load(f)['threshold']
+        
+        print(f"✓ Cascade enabled (threshold: {self.cascade_threshold:.4f})")
     
     def _load_class_mapping(self):
         """Load class mapping"""
@@ -57,57 +127,106 @@ class DiseasePredictor:
         self.class_names = self.class_mapping['class_names']
         print(f"✓ Loaded {len(self.class_names)} disease classes")
     
-    def preprocess_image(self, image_input) -> np.ndarray:
+    def load_image_array(self, image_input) -> np.ndarray:
         """
-        Preprocess image for model prediction
+        Load an image and resize it to the model input size
         
         Args:
-            image_input: Can be PIL Image, numpy array, or file path
+            image_input: Can be PIL Image, numpy array, raw encoded bytes, or file path
             
         Returns:
-            Preprocessed image array
+            Normalized image array of shape (height, width, 3)
         """
         # Convert to PIL Image if needed
         if isinstance(image_input, (str, Path)):
             image = Image.open(image_input).convert('RGB')
+        elif isinstance(image_input, (bytes, bytearray)):
+            image = Image.open(io.BytesIO(image_input)).convert('RGB')
         elif isinstance(image_input, np.ndarray):
             image = Image.fromarray(image_input).convert('RGB')
         elif isinstance(image_input, Image.Image):
-            image = image.convert('RGB')
+            image = image_input.convert('RGB')
         else:
             raise ValueError("Unsupported image input type")
         
-        # Resize to model input size
-        image = image.resize(config.IMAGE_SIZE)
+        # Resize to model input size (PIL takes width, height)
+        image = image.resize((self.image_size[1], self.image_size[0]))
         
         # Convert to array and normalize
         image_array = np.array(image, dtype=np.float32)
-        image_array = image_array / 255.0
+        return image_array / 255.0
+    
+    def preprocess_image(self, image_input) -> np.ndarray:
+        """
+        Preprocess image for model prediction
         
+        Args:
+            image_input: Can be PIL Image, numpy array, or file path
+            
+        Returns:
+            Preprocessed image array
+        """
         # Add batch dimension
-        image_array = np.expand_dims(image_array, axis=0)
+        return np.expand_dims(self.load_image_array(image_input), axis=0)
+    
+    def predict_proba(self, image_batch: np.ndarray) -> np.ndarray:
+        """
+        Run the model on a batch of preprocessed images
         
-        return image_array
+        Args:
+            image_batch: Array of shape (batch, height, width, 3) in [0, 1]
+            
+        Returns:
+            Class probabilities of shape (batch, num_classes)
+        """
+        probabilities, _ = self.predict_proba_with_tier(image_batch)
+        return probabilities
     
-    def predict(self, image_input, top_k: int = 3) -> Dict:
+    def predict_proba_with_tier(self, image_batch: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Predict disease from image
+        Run the cascade on a batch of preprocessed images
+        
+        The fast model scores the whole batch; images whose top probability is
+        below the cascade threshold are gathered into a separate batch for the
+        full model.
         
         Args:
-            image_input: Image to predict (file path, PIL Image, or numpy array)
-            top_k: Number of top predictions to return
+            image_batch: Array of shape (batch, height, width, 3) in [0, 1]
             
         Returns:
-            Dictionary with prediction results
+            Class probabilities and a boolean mask of escalated images
         """
-        # Preprocess image
-        processed_image = self.preprocess_image(image_input)
+        if self.fast_model is None:
+            probabilities = np.asarray(self.model.predict_on_batch(image_batch))
+            return probabilities, np.ones(len(probabilities), dtype=bool)
         
-        # Get prediction
-        predictions = self.model.predict(processed_image, verbose=0)[0]
+        probabilities = np.array(
+            self.fast_model.predict_on_batch(resize_batch_for_model(self.fast_model, image_batch)),
+            dtype=np.float32
+        )
+        escalated = probabilities.max(axis=1) < self.cascade_threshold
+        
+        if escalated.any():
+            probabilities[escalated] = self.model.predict_on_batch(image_batch[escalated])
+        
+        self.cascade_stats['escalated'] += int(escalated.sum())
+        self.cascade_stats['fast'] += int((~escalated).sum())
+        
+        return probabilities, escalated
+    
+    def format_prediction(self, probabilities: np.ndarray, top_k: int = 3) -> Dict:
+        """
+        Build the prediction response from a probability vector
         
+        Args:
+            probabilities: Class probabilities for a single image
+            top_k: Number of top predictions to return
+            
+        Returns:
+            Dictionary with prediction results
+        """
         # Get top-k predictions
-        top_indices = np.argsort(predictions)[-top_k:][::-1]
+        top_indices = np.argsort(probabilities)[-top_k:][::-1]
         
         results = {
             'predictions': [],
@@ -116,7 +235,7 @@ class DiseasePredictor:
         
         for idx in top_indices:
             class_name = self.class_names[idx]
-            confidence = float(predictions[idx])
+            confidence = float(probabilities[idx])
             
             prediction_info = {
                 'disease': class_name,
@@ -134,6 +253,28 @@ class DiseasePredictor:
         
         return results
     
+    def predict(self, image_input, top_k: int = 3) -> Dict:
+        """
+        Predict disease from image
+        
+        Args:
+            image_input: Image to predict (file path, PIL Image, or numpy array)
+            top_k: Number of top predictions to return
+            
+        Returns:
+            Dictionary with prediction results
+        """
+        # Preprocess image
+        processed_image = self.preprocess_image(image_input)
+        
+        # Get prediction
+        predictions, escalated = self.predict_proba_with_tier(processed_image)
+        
+        results = self.format_prediction(predictions[0], top_k=top_k)
+        results['model_tier'] = 'full' if escalated[0] else 'fast'
+        
+        return results
+    
     def _get_disease_info(self, disease_name: str) -> Dict:
         """
         Get information about the disease
@@ -380,8 +521,11 @@ if __name__ == "__main__":
     predictor = DiseasePredictor()
     
     # Test with a sample image from dataset
-    test_image_path = config.DATA_DIR / "Tomato_healthy"
-    test_images = list(test_image_path.glob("*.jpg"))[:1]
+    from src.dataset_index import load_dataset_index, list_class_images
+    index = load_dataset_index(config.DATA_DIR)
+    test_images = []
+    if "Tomato_healthy" in index['classes']:
+        test_images = [Path(p) for p in list_class_images(index, "Tomato_healthy")[:1]]
     
     if test_images:
         print(f"\nTesting with image: {test_images[0].name}")
@@ -0,0 +1,280 @@
+"""
+Inference-only model export
+Rewrites the trained model for serving:
+- BatchNormalization is folded into the Conv/Dense weights before it (backbone)
+  or, when an activation sits in between, into the Dense layer after it (head)
+- Dropout and the folded BatchNormalization layers become Identity
+- weight regularizers are dropped
+- layers compute in float32, also when the model was trained in mixed precision
+The result is saved without optimizer state, checked against a float32 copy of
+the original model and compared with it on load time and CPU latency.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+
+
+FOLDABLE_LAYERS = (layers.Conv2D, layers.DepthwiseConv2D, layers.Dense)
+
+
+def _producer(layer):
+    """Layer whose output feeds a single-input layer"""
+    return layer._inbound_nodes[0].input_tensors[0]._keras_history.operation
+
+
+def _consumers(layer) -> list:
+    return [node.operation for node in layer._outbound_nodes]
+
+
+def _batch_norm_affine(bn: layers.BatchNormalization):
+    """BatchNormalization at inference as x * scale + shift"""
+    channels = bn.moving_mean.shape[0]
+    gamma = bn.gamma.numpy() if bn.scale else np.ones(channels, np.float32)
+    beta = bn.beta.numpy() if bn.center else np.zeros(channels, np.float32)
+    scale = gamma / np.sqrt(bn.moving_variance.numpy() + bn.epsilon)
+    return scale, beta - bn.moving_mean.numpy() * scale
+
+
+def _fold_plan(model: keras.Model):
+    """
+    Folded weights of one (sub)model
+    
+    Returns:
+        {layer name: [kernel, bias]} of the rewritten Conv/Dense layers and the
+        names of the BatchNormalization layers folded into them
+    """
+    new_weights, folded = {}, set()
+    
+    def weights_of(layer):
+        if layer.name not in new_weights:
+            kernel = layer.get_weights()[0]
+            channels = kernel.shape[2] * kernel.shape[3] if isinstance(layer, layers.DepthwiseConv2D) else kernel.shape[-1]
+            bias = layer.bias.numpy() if layer.use_bias else np.zeros(channels, np.float32)
+            new_weights[layer.name] = [kernel, bias]
+        return new_weights[layer.name]
+    
+    for bn in model.layers:
+        if not isinstance(bn, layers.BatchNormalization) or len(bn._inbound_nodes) != 1:
+            continue
+        # Only channels-last normalisation maps onto output channels
+        rank = len(bn.input.shape)
+        if bn.axis % rank != rank - 1:
+            continue
+        scale, shift = _batch_norm_affine(bn)
+        producer = _producer(bn)
+        
+        # Conv/Dense -> BN: scale the output channels
+        if (isinstance(producer, FOLDABLE_LAYERS) and len(producer._outbound_nodes) == 1
+                and producer.get_config().get('activation', 'linear') == 'linear'):
+            kernel, bias = weights_of(producer)
+            if isinstance(producer, layers.DepthwiseConv2D):
+                kernel = kernel * scale.reshape(kernel.shape[2], kernel.shape[3])
+            else:
+                kernel = kernel * scale
+            new_weights[producer.name] = [kernel, bias * scale + shift]
+            folded.add(bn.name)
+            continue
+        
+        # BN -> (Dropout) -> Dense: scale the Dense inputs
+        consumer = bn
+        while len(_consumers(consumer)) == 1 and isinstance(_consumers(consumer)[0], layers.Dropout):
+            consumer = _consumers(consumer)[0]
+        consumers = _consumers(consumer)
+        if len(consumers) == 1 and isinstance(consumers[0], layers.Dense) and len(consumers[0]._inbound_nodes) == 1:
+            kernel, bias = weights_of(consumers[0])
+            new_weights[consumers[0].name] = [kernel * scale[:, None], bias + shift @ kernel]
+            folded.add(bn.name)
+    
+    return new_weights, folded
+
+
+def fold_model(model: keras.Model, fold_batch_norm: bool = True) -> keras.Model:
+    """
+    Inference-only float32 copy of a model (BatchNorm folded, Dropout and regularizers removed)
+    
+    Nested models (the EfficientNetB0 backbone) are rewritten the same way.
+    
+    Args:
+        model: Trained functional model
+        fold_batch_norm: False only converts the model to float32 (the parity reference)
+    
+    Returns:
+        Uncompiled model with the same outputs at inference
+    """
+    new_weights, folded = _fold_plan(model) if fold_batch_norm else ({}, set())
+    
+    def clone_layer(layer):
+        if isinstance(layer, keras.Model):
+            return fold_model(layer, fold_batch_norm)
+        if isinstance(layer, layers.Dropout) or layer.name in folded:
+            return layers.Identity(name=layer.name, dtype='float32')
+        
+        # Mixed precision policies would round the folded weights' activations
+        layer_config = layer.get_config()
+        layer_config['dtype'] = 'float32'
+        if layer.name in new_weights:
+            layer_config['use_bias'] = True
+        for key in ('kernel_regularizer', 'bias_regularizer', 'depthwise_regularizer', 'activity_regularizer'):
+            if key in layer_config:
+                layer_config[key] = None
+        return layer.__class__.from_config(layer_config)
+    
+    def call_layer(layer, *args, **kwargs):
+        # Identity takes no mask/training arguments recorded for BN and Dropout
+        if isinstance(layer, layers.Identity):
+            return layer(args[0])
+        return layer(*args, **kwargs)
+    
+    inference_model = keras.models.clone_model(model, clone_function=clone_layer, call_function=call_layer)
+    
+    for layer in inference_model.layers:
+        if isinstance(layer, (keras.Model, layers.Identity, layers.InputLayer)):
+            continue
+        layer.set_weights(new_weights.get(layer.name) or model.get_layer(layer.name).get_weights())
+    
+    return inference_model
+
+
+def count_layers(model: keras.Model, layer_type) -> int:
+    """Layers of a type, including those of nested models"""
+    return sum(count_layers(layer, layer_type) if isinstance(layer, keras.Model) else isinstance(layer, layer_type)
+               for layer in model.layers)
+
+
+def check_parity(original: keras.Model, inference_model: keras.Model, images: np.ndarray) -> Dict:
+    """
+    Compare the predictions of both models
+    
+    Both models should compute in float32: a mixed precision model differs from
+    its own float32 copy by far more than the folding error.
+    
+    Raises:
+        ValueError: If the probabilities differ by more than INFERENCE_PARITY_TOLERANCE
+    """
+    expected = np.asarray(original.predict_on_batch(images), dtype=np.float32)
+    actual = np.asarray(inference_model.predict_on_batch(images), dtype=np.float32)
+    
+    parity = {
+        'images': int(len(images)),
+        'max_abs_diff': float(np.abs(expected - actual).max()),
+        'top1_agreement': float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1)))
+    }
+    if parity['max_abs_diff'] > config.INFERENCE_PARITY_TOLERANCE:
+        raise ValueError(
+            f"Inference model differs from the original by {parity['max_abs_diff']:.2e} "
+            f"(tolerance {config.INFERENCE_PARITY_TOLERANCE:.0e})"
+        )
+    return parity
+
+
+def _load_seconds(model_path: Path, **kwargs) -> float:
+    start = time.perf_counter()
+    keras.models.load_model(model_path, **kwargs)
+    return time.perf_counter() - start
+
+
+def export_inference_model(model_path: Path = None, output_path: Path = None,
+                           test_ds: Optional[tf.data.Dataset] = None) -> Dict:
+    """
+    Export the inference-only model and compare it with the original
+    
+    Args:
+        model_path: Trained model (default: MODEL_H5_PATH)
+        output_path: Where to save it (default: INFERENCE_MODEL_H5_PATH)
+        test_ds: Batches of (images, labels) for the parity check
+                 (random images when not given)
+    
+    Returns:
+        Export report
+    """
+    from src.distillation import measure_cpu_latency
+    
+    model_path = Path(model_path or config.MODEL_H5_PATH)
+    output_path = Path(output_path or config.INFERENCE_MODEL_H5_PATH)
+    
+    print(f"\n🧩 Exporting inference-only model from {model_path}...")
+    original = keras.models.load_model(model_path, compile=False)
+    inference_model = fold_model(original)
+    unfolded = [layer.name for layer in inference_model._flatten_layers()
+                if isinstance(layer, layers.BatchNormalization)]
+    
+    # Parity on real test images when available
+    image_size = tuple(original.input_shape[1:3])
+    if None in image_size:
+        image_size = tuple(config.IMAGE_SIZE)
+    if test_ds is not None:
+        images = np.concatenate([x.numpy() for x, _ in test_ds.take(config.INFERENCE_PARITY_BATCHES)])
+    else:
+        images = np.random.default_rng(config.RANDOM_SEED).random((config.BATCH_SIZE, *image_size, 3), dtype=np.float32)
+    parity = check_parity(fold_model(original, fold_batch_norm=False), inference_model, images)
+    
+    inference_model.save(output_path, include_optimizer=False)
+    
+    report = {
+        'original': {
+            'path': str(model_path),
+            'compute_dtype': original.dtype_policy.compute_dtype,
+            'batch_norm_layers': count_layers(original, layers.BatchNormalization),
+            'dropout_layers': count_layers(original, layers.Dropout),
+            'size_mb': os.path.getsize(model_path) / (1024*1024),
+            'load_seconds': _load_seconds(model_path),
+            'cpu_latency': measure_cpu_latency(original, image_size)
+        },
+        'inference': {
+            'path': str(output_path),
+            'batch_norm_layers': count_layers(inference_model, layers.BatchNormalization),
+            'unfolded_batch_norm': unfolded,
+            'dropout_layers': count_layers(inference_model, layers.Dropout),
+            'size_mb': os.path.getsize(output_path) / (1024*1024),
+            'load_seconds': _load_seconds(output_path, compile=False),
+            'cpu_latency': measure_cpu_latency(inference_model, image_size)
+        },
+        'parity': parity,
+        'timestamp': datetime.now().isoformat()
+    }
+    report['speedup'] = report['original']['cpu_latency']['mean_ms'] / report['inference']['cpu_latency']['mean_ms']
+    
+    with open(config.INFERENCE_EXPORT_REPORT_PATH, 'w') as f:
+        json.dump(report, f, indent=4)
+    
+    print(f"✓ Inference model saved: {output_path}")
+    print(f"  - BatchNorm folded: {report['original']['batch_norm_layers'] - report['inference']['batch_norm_layers']}"
+          f" of {report['original']['batch_norm_layers']}, Dropout removed: {report['original']['dropout_layers']}")
+    if unfolded:
+        print(f"⚠️  BatchNorm kept (no linear layer to fold into): {', '.join(unfolded)}")
+    print(f"  - Parity: max |Δp| {parity['max_abs_diff']:.2e}, top-1 agreement {parity['top1_agreement']*100:.1f}%")
+    print(f"  - Load time: {report['original']['load_seconds']:.2f} s -> {report['inference']['load_seconds']:.2f} s")
+    print(f"  - CPU latency: {report['original']['cpu_latency']['mean_ms']:.2f} ms -> "
+          f"{report['inference']['cpu_latency']['mean_ms']:.2f} ms ({report['speedup']:.2f}x)")
+    print(f"✓ Report saved to {config.INFERENCE_EXPORT_REPORT_PATH}")
+    
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export the inference-only serving model')
+    parser.add_argument('--model', type=str, default=None,
+                       help='Model to export (default: the trained model)')
+    parser.add_argument('--output', type=str, default=None,
+                       help='Output path (default: models/plant_disease_efficientnet_inference.h5)')
+    
+    args = parser.parse_args()
+    
+    from src.data_preprocessing import setup_gpu, create_datasets
+    setup_gpu()
+    _, _, test_ds, _ = create_datasets(config.DATA_DIR)
+    
+    export_inference_model(args.model, args.output, test_ds)
@@ -10,17 +10,12 @@ import tensorflow as tf
 from pathlib import Path
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.metrics import (
-    classification_report, 
-    confusion_matrix, 
-    accuracy_score,
-    precision_recall_fscore_support
-)
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 import config
-from src.data_preprocessing import setup_gpu, create_datasets, load_class_mapping
+from src.data_preprocessing import setup_gpu, create_tf_dataset, load_class_mapping
+from src.dataset_split import load_split
 
 
 def load_trained_model():
@@ -34,64 +29,106 @@ def load_trained_model():
     return model
 
 
-def evaluate_model(model, test_ds, class_names):
+def classification_metrics(cm: np.ndarray, class_names) -> dict:
+    """
+    Per-class and averaged metrics from a confusion matrix
+    
+    Args:
+        cm: Confusion matrix (rows: true class, columns: predicted class)
+        class_names: List of class names
+    
+    Returns:
+        Report in the format of sklearn's classification_report(output_dict=True)
+        (classes without predictions or samples score 0)
+    """
+    true_positives = np.diag(cm).astype(np.float64)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    
+    precision = np.divide(true_positives, predicted, out=np.zeros_like(true_positives), where=predicted > 0)
+    recall = np.divide(true_positives, support, out=np.zeros_like(true_positives), where=support > 0)
+    denominator = precision + recall
+    f1 = np.divide(2 * precision * recall, denominator, out=np.zeros_like(true_positives), where=denominator > 0)
+    
+    total = int(support.sum())
+    weights = support / max(total, 1)
+    
+    class_report = {
+        name: {
+            'precision': float(precision[i]),
+            'recall': float(recall[i]),
+            'f1-score': float(f1[i]),
+            'support': int(support[i])
+        }
+        for i, name in enumerate(class_names)
+    }
+    class_report['accuracy'] = float(true_positives.sum() / max(total, 1))
+    class_report['macro avg'] = {
+        'precision': float(precision.mean()),
+        'recall': float(recall.mean()),
+        'f1-score': float(f1.mean()),
+        'support': total
+    }
+    class_report['weighted avg'] = {
+        'precision': float(precision @ weights),
+        'recall': float(recall @ weights),
+        'f1-score': float(f1 @ weights),
+        'support': total
+    }
+    return class_report
+
+
+def evaluate_model(model, test_ds, class_names, top_k: int = 3):
     """
     Comprehensive model evaluation
     
+    Predictions are streamed batch by batch; only the confusion matrix and the
+    per-class top-k hits are kept, so memory does not grow with the test set.
+    
     Args:
         model: Trained Keras model
         test_ds: Test dataset
         class_names: List of class names
-        
+        top_k: k of the top-k accuracy
+    
     Returns:
-        Dictionary with evaluation metrics
+        Dictionary with evaluation metrics and the confusion matrix
     """
     print("\n" + "="*80)
     print("📊 Evaluating Model Performance")
     print("="*80)
     
-    # Get predictions and true labels
-    print("\n🔄 Generating predictions on test set...")
-    y_true = []
-    y_pred = []
-    y_pred_probs = []
+    num_classes = len(class_names)
+    k = min(top_k, num_classes)
+    cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+    top_k_hits = np.zeros(num_classes, dtype=np.int64)
     
+    # Single prediction pass, accumulating counts per batch
+    print("\n🔄 Generating predictions on test set...")
     for images, labels in test_ds:
-        predictions = model.predict(images, verbose=0)
-        y_pred_probs.extend(predictions)
-        y_pred.extend(np.argmax(predictions, axis=1))
-        y_true.extend(labels.numpy())
-    
-    y_true = np.array(y_true)
-    y_pred = np.array(y_pred)
-    y_pred_probs = np.array(y_pred_probs)
+        probs = np.asarray(model.predict_on_batch(images))
+        labels = labels.numpy().astype(np.int64)
+        
+        predicted = probs.argmax(axis=1)
+        cm += np.bincount(labels * num_classes + predicted, minlength=num_classes * num_classes).reshape(cm.shape)
+        
+        # Unordered k best classes per image
+        top = np.argpartition(probs, num_classes - k, axis=1)[:, num_classes - k:]
+        hit = (top == labels[:, None]).any(axis=1)
+        top_k_hits += np.bincount(labels[hit], minlength=num_classes)
     
     # Calculate metrics
     print("\n📈 Calculating metrics...")
+    class_report = classification_metrics(cm, class_names)
     
-    # Overall accuracy
-    accuracy = accuracy_score(y_true, y_pred)
-    
-    # Top-3 accuracy
-    top3_accuracy = np.mean([
-        1 if true_label in np.argsort(probs)[-3:] else 0
-        for true_label, probs in zip(y_true, y_pred_probs)
-    ])
+    total = int(cm.sum())
+    accuracy = class_report['accuracy']
+    top_k_accuracy = top_k_hits.sum() / max(total, 1)
     
     # Precision, Recall, F1-Score
-    precision, recall, f1, support = precision_recall_fscore_support(
-        y_true, y_pred, average='weighted'
-    )
-    
-    # Per-class metrics
-    class_report = classification_report(
-        y_true, y_pred, 
-        target_names=class_names,
-        output_dict=True
-    )
-    
-    # Confusion matrix
-    cm = confusion_matrix(y_true, y_pred)
+    precision = class_report['weighted avg']['precision']
+    recall = class_report['weighted avg']['recall']
+    f1 = class_report['weighted avg']['f1-score']
     
     # Print results
     print("\n" + "="*80)
@@ -99,7 +136,7 @@ def evaluate_model(model, test_ds, class_names):
     print("="*80)
     print(f"\n🎯 Overall Metrics:")
     print(f"  - Test Accuracy: {accuracy*100:.2f}%")
-    print(f"  - Top-3 Accuracy: {top3_accuracy*100:.2f}%")
+    print(f"  - Top-{k} Accuracy: {top_k_accuracy*100:.2f}%")
     print(f"  - Precision (weighted): {precision:.4f}")
     print(f"  - Recall (weighted): {recall:.4f}")
     print(f"  - F1-Score (weighted): {f1:.4f}")
@@ -127,7 +164,7 @@ def evaluate_model(model, test_ds, class_names):
     # Save results
     results = {
         'accuracy': float(accuracy),
-        'top3_accuracy': float(top3_accuracy),
+        f'top{top_k}_accuracy': float(top_k_accuracy),
         'precision_weighted': float(precision),
         'recall_weighted': float(recall),
         'f1_weighted': float(f1),
@@ -135,10 +172,11 @@ def evaluate_model(model, test_ds, class_names):
         'confusion_matrix': cm.tolist(),
         'best_class': best_class,
         'worst_class': worst_class,
-        'total_test_samples': len(y_true)
+        'per_class_top_k_hits': {name: int(top_k_hits[i]) for i, name in enumerate(class_names)},
+        'total_test_samples': total
     }
     
-    return results, cm, y_true, y_pred
+    return results, cm
 
 
 def plot_confusion_matrix(cm, class_names, save_path):
@@ -257,13 +295,14 @@ def main():
     print(f"  - Output shape: {model.output_shape}")
     print(f"  - Total parameters: {model.count_params():,}")
     
-    # Load test dataset
+    # Load only the persisted test split
     print("\n📂 Loading test dataset...")
-    _, _, test_ds, dataset_info = create_datasets(config.DATA_DIR)
-    print(f"  - Test samples: {dataset_info['test_size']}")
+    test_paths, test_labels, _ = load_split(config.DATA_DIR, 'test')
+    test_ds = create_tf_dataset(test_paths, test_labels, is_training=False, split='test')
+    print(f"  - Test samples: {len(test_paths)}")
     
     # Evaluate model
-    results, cm, y_true, y_pred = evaluate_model(model, test_ds, class_names)
+    results, cm = evaluate_model(model, test_ds, class_names)
     
     # Generate visualizations
     print("\n🎨 Generating visualizations...")
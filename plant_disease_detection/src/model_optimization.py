@@ -0,0 +1,395 @@
+"""
+Pruning and weight clustering for Plant Disease Detection
+Shrinks the trained model after fine-tuning:
+- structured pruning removes the weakest units of the dense head
+- magnitude pruning zeroes the smallest conv/dense weights, ramped up during
+  a short recovery fine-tune
+- weight clustering shares a few values per kernel, with a short fine-tune
+  of the cluster centroids
+The masks and clusters are applied by callbacks rather than layer wrappers,
+so the exported model is a plain Keras model that needs no stripping.
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import shutil
+import tempfile
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+from src.data_preprocessing import setup_gpu, create_datasets
+from src.model_training_optimized import compute_class_weights, unfreeze_model
+from src.distillation import measure_cpu_latency
+
+
+def find_base_model(model: keras.Model) -> keras.Model:
+    """The EfficientNetB0 backbone nested in the full model"""
+    return next(layer for layer in model.layers if isinstance(layer, keras.Model))
+
+
+def prune_head_units(model: keras.Model, keep_fraction: float = None) -> keras.Model:
+    """
+    Structured pruning of the classification head
+    
+    Every hidden Dense layer keeps the units with the largest incoming weight
+    norms; the BatchNormalization and Dense layers after it lose the matching
+    inputs. The backbone layer is shared with the given model.
+    
+    Args:
+        model: Trained full model (backbone followed by a sequential head)
+        keep_fraction: Share of units kept per hidden layer (default: HEAD_KEEP_FRACTION)
+    
+    Returns:
+        Model with a smaller head (not compiled)
+    """
+    keep_fraction = config.HEAD_KEEP_FRACTION if keep_fraction is None else keep_fraction
+    base_model = find_base_model(model)
+    head = model.layers[model.layers.index(base_model) + 1:]
+    last_dense = [layer for layer in head if isinstance(layer, layers.Dense)][-1]
+    
+    inputs = keras.Input(shape=model.input_shape[1:])
+    x = base_model(inputs, training=False)
+    kept = None  # Indices of the previous layer's outputs still present
+    
+    for layer in head:
+        layer_config = layer.get_config()
+        weights = layer.get_weights()
+        
+        if isinstance(layer, layers.Dense):
+            kernel, bias = weights
+            if kept is not None:
+                kernel = kernel[kept]
+            kept = None
+            if layer is not last_dense:
+                units = max(int(round(kernel.shape[1] * keep_fraction)), 1)
+                kept = np.sort(np.argsort(-np.linalg.norm(kernel, axis=0))[:units])
+                kernel, bias = kernel[:, kept], bias[kept]
+                print(f"  - {layer.name}: {layer_config['units']} -> {units} units")
+                layer_config['units'] = units
+            weights = [kernel, bias]
+        elif isinstance(layer, layers.BatchNormalization) and kept is not None:
+            weights = [weight[kept] for weight in weights]
+        
+        new_layer = layer.__class__.from_config(layer_config)
+        x = new_layer(x)
+        new_layer.set_weights(weights)
+    
+    return keras.Model(inputs, x, name=model.name)
+
+
+def prunable_kernels(model: keras.Model) -> List[tf.Variable]:
+    """
+    Trainable conv and dense kernels large enough to prune and cluster
+    
+    Frozen layers are left untouched: without gradients they could not
+    recover from pruning or move their cluster centroids.
+    """
+    trainable = {id(weight) for weight in model.trainable_weights}
+    kernels = []
+    for layer in model._flatten_layers(include_self=False):
+        if isinstance(layer, (layers.Conv2D, layers.Dense)) and not isinstance(layer, layers.DepthwiseConv2D):
+            if id(layer.kernel) in trainable and np.prod(layer.kernel.shape) >= config.PRUNE_MIN_WEIGHTS:
+                kernels.append(layer.kernel)
+    return kernels
+
+
+def sparsity(model: keras.Model) -> float:
+    """Share of zero weights in the prunable kernels"""
+    kernels = prunable_kernels(model)
+    zeros = sum(int(tf.reduce_sum(tf.cast(kernel == 0, tf.int32))) for kernel in kernels)
+    return zeros / max(sum(int(np.prod(kernel.shape)) for kernel in kernels), 1)
+
+
+class MagnitudePruning(keras.callbacks.Callback):
+    """
+    Zero the smallest weights of every prunable kernel after each step
+    
+    Sparsity ramps up along a cubic schedule over the first ramp_steps steps
+    (as in tfmot's PolynomialDecay) and is then held. A weight that has been
+    pruned stays zero, since the mask only ever grows.
+    """
+    
+    def __init__(self, target_sparsity: float, ramp_steps: int, prune_every: int = 10):
+        super().__init__()
+        self.target_sparsity = target_sparsity
+        self.ramp_steps = max(ramp_steps, 1)
+        self.prune_every = prune_every
+        self.step = 0
+    
+    def on_train_begin(self, logs=None):
+        self.kernels = prunable_kernels(self.model)
+        self.masks = [tf.ones_like(kernel) for kernel in self.kernels]
+    
+    def current_sparsity(self) -> float:
+        progress = min(self.step / self.ramp_steps, 1.0)
+        return self.target_sparsity * (1 - (1 - progress) ** 3)
+    
+    def on_train_batch_end(self, batch, logs=None):
+        self.step += 1
+        update = self.step % self.prune_every == 0 or self.step == self.ramp_steps
+        
+        for i, kernel in enumerate(self.kernels):
+            if update and self.step <= self.ramp_steps:
+                magnitudes = tf.reshape(tf.abs(kernel * self.masks[i]), [-1])
+                num_pruned = int(self.current_sparsity() * int(magnitudes.shape[0]))
+                if num_pruned:
+                    threshold = tf.sort(magnitudes)[num_pruned - 1]
+                    self.masks[i] = self.masks[i] * tf.cast(tf.abs(kernel) > threshold, kernel.dtype)
+            kernel.assign(kernel * self.masks[i])
+
+
+def cluster_kernel(values: np.ndarray, clusters: int, iterations: int = 10) -> np.ndarray:
+    """
+    1-D k-means of a kernel's non-zero weights
+    
+    Centroids start evenly spaced between the smallest and largest weight
+    (tfmot's linear initialisation). Zero weights keep index `clusters`.
+    
+    Returns:
+        Cluster index of every weight
+    """
+    flat = values.ravel()
+    nonzero = flat != 0
+    assignments = np.full(flat.shape, clusters, dtype=np.int32)
+    if not nonzero.any():
+        return assignments.reshape(values.shape)
+    
+    weights = flat[nonzero]
+    centroids = np.linspace(weights.min(), weights.max(), clusters)
+    for _ in range(iterations):
+        # Centroids stay sorted, so the nearest one is found between midpoints
+        labels = np.searchsorted((centroids[1:] + centroids[:-1]) / 2, weights).astype(np.int32)
+        for c in range(clusters):
+            members = labels == c
+            if members.any():
+                centroids[c] = weights[members].mean()
+    
+    assignments[nonzero] = labels
+    return assignments.reshape(values.shape)
+
+
+class WeightClustering(keras.callbacks.Callback):
+    """
+    Keep every prunable kernel clustered while fine-tuning
+    
+    The weights are clustered once at the start of training. After each step,
+    every weight is replaced by the mean of its cluster, so gradient updates
+    move the centroids and not the individual weights. Pruned (zero) weights
+    form their own cluster and stay zero.
+    """
+    
+    def __init__(self, clusters: int):
+        super().__init__()
+        self.clusters = clusters
+    
+    def on_train_begin(self, logs=None):
+        self.kernels = prunable_kernels(self.model)
+        self.assignments = [
+            tf.constant(cluster_kernel(kernel.numpy(), self.clusters).ravel())
+            for kernel in self.kernels
+        ]
+        self.snap()
+    
+    def snap(self):
+        for kernel, assignment in zip(self.kernels, self.assignments):
+            flat = tf.reshape(kernel, [-1])
+            centroids = tf.math.unsorted_segment_mean(flat, assignment, self.clusters + 1)
+            centroids = tf.concat([centroids[:-1], tf.zeros([1], kernel.dtype)], axis=0)
+            kernel.assign(tf.reshape(tf.gather(centroids, assignment), kernel.shape))
+    
+    def on_train_batch_end(self, batch, logs=None):
+        self.snap()
+
+
+def model_footprint(model_path: Path) -> Dict:
+    """Size on disk, gzip-compressed size and load time of a saved model"""
+    with tempfile.NamedTemporaryFile(suffix='.gz') as compressed:
+        with open(model_path, 'rb') as source, gzip.open(compressed.name, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        gzip_mb = os.path.getsize(compressed.name) / (1024*1024)
+    
+    start = time.perf_counter()
+    keras.models.load_model(model_path)
+    load_seconds = time.perf_counter() - start
+    
+    return {
+        'size_mb': os.path.getsize(model_path) / (1024*1024),
+        'gzip_size_mb': gzip_mb,
+        'load_seconds': load_seconds
+    }
+
+
+def optimize_model(model_path: Path = None) -> Dict:
+    """
+    Prune and cluster the trained model, fine-tune it back and compare it to the original
+    
+    Args:
+        model_path: Trained model (default: MODEL_H5_PATH)
+    
+    Returns:
+        Optimization report
+    """
+    model_path = Path(model_path or config.MODEL_H5_PATH)
+    
+    print("=" * 80)
+    print("🌱 AgriSense AI - Pruning and Weight Clustering")
+    print("=" * 80)
+    
+    setup_gpu()
+    
+    if not model_path.exists():
+        raise FileNotFoundError(f"Model not found at {model_path}. Train it first.")
+    
+    print("\n📂 Loading datasets...")
+    train_ds, val_ds, test_ds, dataset_info = create_datasets(config.DATA_DIR)
+    class_weights = None
+    if config.USE_CLASS_WEIGHTS and dataset_info['sampling'] != 'balanced':
+        class_weights = compute_class_weights(
+            dataset_info['splits']['train']['labels'], dataset_info['num_classes']
+        )
+    steps_per_epoch = dataset_info['steps_per_epoch']
+    if steps_per_epoch is None and train_ds.cardinality() > 0:
+        steps_per_epoch = int(train_ds.cardinality())
+    
+    # Baseline
+    print(f"\n📦 Loading baseline from {model_path}")
+    baseline = keras.models.load_model(model_path)
+    print("\n📊 Evaluating baseline...")
+    baseline_report = {
+        'parameters': int(baseline.count_params()),
+        'test_accuracy': float(baseline.evaluate(test_ds, verbose=1, return_dict=True)['accuracy']),
+        'cpu_latency': measure_cpu_latency(baseline, config.IMAGE_SIZE),
+        **model_footprint(model_path)
+    }
+    
+    # Structured pruning of the head, then the same layers as stage 2 are trained
+    print("\n✂️  Pruning head units...")
+    model = prune_head_units(baseline)
+    base_model = find_base_model(model)
+    unfreeze_model(model, base_model, num_layers=config.FINE_TUNE_LAYERS)
+    
+    start_time = time.time()
+    
+    print("\n" + "="*80)
+    print(f"📚 Recovery fine-tune with magnitude pruning to {config.PRUNE_SPARSITY*100:.0f}% sparsity")
+    print("="*80)
+    ramp_steps = max((steps_per_epoch or 1) * config.OPTIMIZE_RECOVERY_EPOCHS // 2, 1)
+    pruning = MagnitudePruning(config.PRUNE_SPARSITY, ramp_steps)
+    model.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=config.OPTIMIZE_RECOVERY_EPOCHS,
+        steps_per_epoch=steps_per_epoch,
+        class_weight=class_weights,
+        callbacks=[pruning],
+        verbose=1
+    )
+    
+    print("\n" + "="*80)
+    print(f"📚 Fine-tuning {config.WEIGHT_CLUSTERS} weight clusters per kernel")
+    print("="*80)
+    clustering = WeightClustering(config.WEIGHT_CLUSTERS)
+    model.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=config.OPTIMIZE_CLUSTER_EPOCHS,
+        steps_per_epoch=steps_per_epoch,
+        class_weight=class_weights,
+        callbacks=[clustering],
+        verbose=1
+    )
+    
+    training_time = time.time() - start_time
+    
+    # Plain Keras model: nothing to strip, and the optimizer state is not exported
+    print("\n💾 Saving optimized model...")
+    model.save(config.OPTIMIZED_MODEL_H5_PATH, include_optimizer=False)
+    print(f"✓ Optimized model saved: {config.OPTIMIZED_MODEL_H5_PATH}")
+    
+    print("\n📊 Evaluating optimized model...")
+    optimized = keras.models.load_model(config.OPTIMIZED_MODEL_H5_PATH, compile=False)
+    optimized.compile(loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    optimized_report = {
+        'parameters': int(optimized.count_params()),
+        'pruned_kernels': len(prunable_kernels(optimized)),
+        'sparsity': sparsity(optimized),
+        'clusters_per_kernel': config.WEIGHT_CLUSTERS,
+        'test_accuracy': float(optimized.evaluate(test_ds, verbose=1, return_dict=True)['accuracy']),
+        'cpu_latency': measure_cpu_latency(optimized, config.IMAGE_SIZE),
+        **model_footprint(config.OPTIMIZED_MODEL_H5_PATH)
+    }
+    
+    report = {
+        'baseline': baseline_report,
+        'optimized': optimized_report,
+        'speedup': baseline_report['cpu_latency']['mean_ms'] / optimized_report['cpu_latency']['mean_ms'],
+        'compression': baseline_report['gzip_size_mb'] / optimized_report['gzip_size_mb'],
+        'accuracy_drop': baseline_report['test_accuracy'] - optimized_report['test_accuracy'],
+        'head_keep_fraction': config.HEAD_KEEP_FRACTION,
+        'recovery_epochs': config.OPTIMIZE_RECOVERY_EPOCHS,
+        'cluster_epochs': config.OPTIMIZE_CLUSTER_EPOCHS,
+        'training_time_minutes': training_time / 60,
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    with open(config.OPTIMIZATION_REPORT_PATH, 'w') as f:
+        json.dump(report, f, indent=4)
+    
+    print("\n" + "="*80)
+    print("✅ OPTIMIZATION COMPLETED")
+    print("="*80)
+    print(f"\n{'Model':<12} {'Accuracy':<12} {'CPU latency':<14} {'Load':<10} {'Size':<12} {'Gzipped'}")
+    print("-" * 72)
+    for role in ('baseline', 'optimized'):
+        entry = report[role]
+        print(f"{role:<12} {entry['test_accuracy']*100:>7.2f}%    {entry['cpu_latency']['mean_ms']:>7.2f} ms    "
+              f"{entry['load_seconds']:>5.2f} s   {entry['size_mb']:>7.2f} MB  {entry['gzip_size_mb']:>7.2f} MB")
+    print("-" * 72)
+    print(f"  - Sparsity: {optimized_report['sparsity']*100:.1f}%")
+    print(f"  - Speedup: {report['speedup']:.2f}x")
+    print(f"  - Compression (gzipped): {report['compression']:.2f}x")
+    print(f"  - Accuracy drop: {report['accuracy_drop']*100:.2f} points")
+    print(f"\n✓ Report saved to {config.OPTIMIZATION_REPORT_PATH}")
+    
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Prune and cluster the trained model')
+    parser.add_argument('--model', type=str, default=None,
+                       help='Model to optimize (default: the trained model)')
+    parser.add_argument('--sparsity', type=float, default=None,
+                       help='Share of conv/dense weights to prune (e.g. 0.5)')
+    parser.add_argument('--head-keep', type=float, default=None,
+                       help='Share of head units kept by structured pruning')
+    parser.add_argument('--clusters', type=int, default=None,
+                       help='Weight clusters per kernel')
+    parser.add_argument('--epochs', type=int, default=None,
+                       help='Recovery fine-tune epochs')
+    
+    args = parser.parse_args()
+    
+    if args.sparsity is not None:
+        config.PRUNE_SPARSITY = args.sparsity
+    
+    if args.head_keep is not None:
+        config.HEAD_KEEP_FRACTION = args.head_keep
+    
+    if args.clusters:
+        config.WEIGHT_CLUSTERS = args.clusters
+    
+    if args.epochs:
+        config.OPTIMIZE_RECOVERY_EPOCHS = args.epochs
+    
+    optimize_model(args.model)
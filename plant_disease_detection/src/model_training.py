@@ -262,6 +262,7 @@ def train_model(fine_tune: bool = False):
         train_ds,
         validation_data=val_ds,
         epochs=config.EPOCHS,
+        steps_per_epoch=dataset_info['steps_per_epoch'],
         callbacks=get_callbacks(initial_training=True),
         verbose=1
     )
@@ -302,6 +303,7 @@ def train_model(fine_tune: bool = False):
             train_ds,
             validation_data=val_ds,
             epochs=config.EPOCHS // 2,  # Fewer epochs for fine-tuning
+            steps_per_epoch=dataset_info['steps_per_epoch'],
             callbacks=get_callbacks(initial_training=False),
             verbose=1
         )
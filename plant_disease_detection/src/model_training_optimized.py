@@ -17,7 +17,6 @@ from tensorflow import keras
 from tensorflow.keras import layers, models
 from tensorflow.keras.applications import EfficientNetB0
 from tensorflow.keras.callbacks import (
-    ModelCheckpoint, 
     EarlyStopping, 
     ReduceLROnPlateau,
     TensorBoard,
@@ -25,45 +24,60 @@ from tensorflow.keras.callbacks import (
 )
 from datetime import datetime
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 import matplotlib.pyplot as plt
 import sys
-from sklearn.utils.class_weight import compute_class_weight
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 import config
-from src.data_preprocessing import setup_gpu, create_datasets
+from src.data_preprocessing import setup_gpu, create_datasets, DecodeErrorMonitor, decode_error_counts
+from src.feature_cache import build_feature_cache, create_feature_dataset
+from src.training_monitor import ThroughputMonitor, instrument_dataset
+from src.training_budget import TrainingBudget, BudgetStop
+from src.progressive_resizing import ProgressiveResizing
+from src.inference_export import export_inference_model
+from src.checkpointing import (
+    AsyncCheckpoint,
+    fit_resumable,
+    latest_checkpoint,
+    completed_stage,
+    save_stage_checkpoint,
+    clear_checkpoints,
+    restore_checkpoint
+)
 
 
-def compute_class_weights(train_labels: np.ndarray) -> dict:
+def compute_class_weights(train_labels: np.ndarray, num_classes: int = None) -> dict:
     """
     Compute class weights to handle imbalanced dataset
     
+    Uses the 'balanced' heuristic, n_samples / (n_classes * class_count),
+    computed from per-class counts in one pass over the labels.
+    
     Args:
         train_labels: Array of training labels
-        
+        num_classes: Total number of classes (classes without samples get weight 1.0)
+    
     Returns:
         Dictionary of class weights
     """
     print("\n⚖️  Computing class weights for imbalanced dataset...")
     
-    # Get unique classes
-    classes = np.unique(train_labels)
+    # Count samples per class
+    class_counts = np.bincount(train_labels, minlength=num_classes or 0)
+    present = class_counts > 0
     
     # Compute weights
-    class_weights = compute_class_weight(
-        class_weight='balanced',
-        classes=classes,
-        y=train_labels
-    )
+    class_weights = np.ones(len(class_counts))
+    class_weights[present] = len(train_labels) / (present.sum() * class_counts[present])
     
     # Convert to dictionary
-    class_weight_dict = {i: weight for i, weight in enumerate(class_weights)}
+    class_weight_dict = {i: float(weight) for i, weight in enumerate(class_weights)}
     
     print("Class weights:")
     for class_idx, weight in class_weight_dict.items():
-        class_count = np.sum(train_labels == class_idx)
-        print(f"  - Class {class_idx}: {weight:.3f} (samples: {class_count})")
+        print(f"  - Class {class_idx}: {weight:.3f} (samples: {class_counts[class_idx]})")
     
     return class_weight_dict
 
@@ -79,24 +93,76 @@ def cosine_decay_with_warmup(epoch, total_epochs, warmup_epochs, initial_lr, min
         initial_lr: Initial learning rate
         min_lr: Minimum learning rate
     """
+    # A schedule shortened by the time budget keeps at least one decay epoch
+    warmup_epochs = min(warmup_epochs, total_epochs - 1)
+    
     if epoch < warmup_epochs:
         # Linear warmup
         return initial_lr * (epoch + 1) / warmup_epochs
     else:
         # Cosine decay
-        progress = (epoch - warmup_epochs) / (total_epochs - warmup_epochs)
+        progress = min((epoch - warmup_epochs) / max(total_epochs - warmup_epochs, 1), 1.0)
         return min_lr + (initial_lr - min_lr) * 0.5 * (1 + np.cos(np.pi * progress))
 
 
-def build_optimized_model(num_classes: int) -> keras.Model:
+def scale_learning_rate(learning_rate: float, accumulation_steps: int = 1) -> float:
+    """
+    Linearly scale a learning rate to the effective batch size
     
-    print("\n🏗️  Building optimized EfficientNetB0 model...")
+    Args:
+        learning_rate: Learning rate for a batch of LR_REFERENCE_BATCH_SIZE
+        accumulation_steps: Micro-batches of BATCH_SIZE per optimizer update
+    """
+    if not config.SCALE_LR_WITH_BATCH:
+        return learning_rate
+    return learning_rate * config.BATCH_SIZE * accumulation_steps / config.LR_REFERENCE_BATCH_SIZE
+
+
+def compile_model(model: keras.Model, learning_rate: float, accumulation_steps: int = 1):
+    """
+    Compile with Adam, label-smoothed loss and the standard metrics
+    
+    With accumulation_steps > 1 the optimizer sums the gradients of that many
+    micro-batches and applies their average once, so the effective batch
+    grows while peak activation memory stays that of one micro-batch. Loss,
+    class weights, metrics and callbacks work per micro-batch as before.
     
-    # Load pre-trained EfficientNetB0
+    Args:
+        model: Model to compile
+        learning_rate: Learning rate before scaling to the effective batch size
+        accumulation_steps: Micro-batches per optimizer update
+    """
+    model.compile(
+        optimizer=keras.optimizers.Adam(
+            learning_rate=scale_learning_rate(learning_rate, accumulation_steps),
+            gradient_accumulation_steps=accumulation_steps if accumulation_steps > 1 else None
+        ),
+        loss=keras.losses.SparseCategoricalCrossentropy(label_smoothing=config.LABEL_SMOOTHING),
+        metrics=[
+            'accuracy',
+            keras.metrics.SparseTopKCategoricalAccuracy(k=3, name='top_3_accuracy'),
+            keras.metrics.SparseCategoricalCrossentropy(name='ce_loss')
+        ],
+        jit_compile=config.JIT_COMPILE
+    )
+
+
+def _build_classifier(num_classes: int, image_size: Tuple[int, int], weights: Optional[str] = 'imagenet'):
+    """
+    EfficientNetB0 classifier architecture, uncompiled
+    
+    Args:
+        num_classes: Number of output classes
+        image_size: Input (height, width)
+        weights: Backbone weights ('imagenet', or None when they are overwritten anyway)
+    
+    Returns:
+        model, base_model
+    """
     base_model = EfficientNetB0(
         include_top=False,
-        weights='imagenet',
-        input_shape=(*config.IMAGE_SIZE, 3),
+        weights=weights,
+        input_shape=(*image_size, 3),
         pooling='avg'
     )
     
@@ -104,20 +170,20 @@ def build_optimized_model(num_classes: int) -> keras.Model:
     base_model.trainable = False
     
     # Build model with improved architecture
-    inputs = keras.Input(shape=(*config.IMAGE_SIZE, 3))
+    inputs = keras.Input(shape=(*image_size, 3))
     x = base_model(inputs, training=False)
     
     # Deeper classification head for better feature learning
     x = layers.BatchNormalization()(x)
-    x = layers.Dropout(0.4)(x)
+    x = layers.Dropout(config.HEAD_DROPOUT)(x)
     x = layers.Dense(512, activation='relu', kernel_regularizer=keras.regularizers.l2(0.001))(x)
     x = layers.BatchNormalization()(x)
-    x = layers.Dropout(0.3)(x)
+    x = layers.Dropout(config.HEAD_DROPOUT * 0.75)(x)
     x = layers.Dense(256, activation='relu', kernel_regularizer=keras.regularizers.l2(0.001))(x)
-    x = layers.Dropout(0.2)(x)
+    x = layers.Dropout(config.HEAD_DROPOUT * 0.5)(x)
     
-    # Output layer with label smoothing
-    if config.MIXED_PRECISION:
+    # Output layer with label smoothing (kept in float32 under mixed precision)
+    if config.MIXED_PRECISION or config.CPU_MIXED_PRECISION:
         outputs = layers.Dense(
             num_classes, 
             activation='softmax', 
@@ -132,17 +198,27 @@ def build_optimized_model(num_classes: int) -> keras.Model:
         )(x)
     
     model = keras.Model(inputs, outputs, name='plant_disease_efficientnet')
+    return model, base_model
+
+
+def build_optimized_model(num_classes: int, image_size: Tuple[int, int] = None) -> keras.Model:
+    """
+    Build and compile the EfficientNetB0 classifier
+    
+    Args:
+        num_classes: Number of output classes
+        image_size: Input (height, width), IMAGE_SIZE by default; (None, None)
+            accepts any size (progressive resizing)
+    """
+    image_size = tuple(image_size or config.IMAGE_SIZE)
+    
+    print("\n🏗️  Building optimized EfficientNetB0 model...")
+    
+    # Pre-trained EfficientNetB0 backbone with the classification head
+    model, base_model = _build_classifier(num_classes, image_size)
     
     # Compile with label smoothing
-    model.compile(
-        optimizer=keras.optimizers.Adam(learning_rate=config.LEARNING_RATE),
-        loss=keras.losses.SparseCategoricalCrossentropy(label_smoothing=config.LABEL_SMOOTHING),
-        metrics=[
-            'accuracy',
-            keras.metrics.SparseTopKCategoricalAccuracy(k=3, name='top_3_accuracy'),
-            keras.metrics.SparseCategoricalCrossentropy(name='ce_loss')
-        ]
-    )
+    compile_model(model, config.LEARNING_RATE, config.ACCUMULATION_STEPS)
     
     print(f"\n✓ Model built successfully")
     print(f"  - Base model: EfficientNetB0")
@@ -154,6 +230,31 @@ def build_optimized_model(num_classes: int) -> keras.Model:
     return model, base_model
 
 
+def build_head_model(model: keras.Model, base_model: keras.Model) -> keras.Model:
+    """
+    Build a model of the classification head alone, taking pooled features as input
+    
+    The head model reuses the layers of the full model, so training it on
+    cached features trains the full model's head in place.
+    
+    Args:
+        model: Full model
+        base_model: Base EfficientNetB0 model inside the full model
+    
+    Returns:
+        Compiled head model
+    """
+    inputs = keras.Input(shape=(base_model.output_shape[-1],))
+    x = inputs
+    for layer in model.layers[model.layers.index(base_model) + 1:]:
+        x = layer(x)
+    
+    head_model = keras.Model(inputs, x, name='classification_head')
+    compile_model(head_model, config.LEARNING_RATE, config.ACCUMULATION_STEPS)
+    
+    return head_model
+
+
 def unfreeze_model(model: keras.Model, base_model: keras.Model, num_layers: int = 50):
     """
     Unfreeze layers for fine-tuning
@@ -172,45 +273,30 @@ def unfreeze_model(model: keras.Model, base_model: keras.Model, num_layers: int
         layer.trainable = False
     
     # Recompile with lower learning rate
-    model.compile(
-        optimizer=keras.optimizers.Adam(learning_rate=config.LEARNING_RATE / 10),
-        loss=keras.losses.SparseCategoricalCrossentropy(label_smoothing=config.LABEL_SMOOTHING),
-        metrics=[
-            'accuracy',
-            keras.metrics.SparseTopKCategoricalAccuracy(k=3, name='top_3_accuracy'),
-            keras.metrics.SparseCategoricalCrossentropy(name='ce_loss')
-        ]
-    )
+    compile_model(model, config.LEARNING_RATE / 10, config.FINE_TUNE_ACCUMULATION_STEPS)
     
     trainable_params = sum([tf.size(w).numpy() for w in model.trainable_weights])
     print(f"✓ Model unfrozen")
     print(f"  - Trainable parameters: {trainable_params:,}")
-    print(f"  - Learning rate: {config.LEARNING_RATE / 10}")
+    print(f"  - Learning rate: {scale_learning_rate(config.LEARNING_RATE / 10, config.FINE_TUNE_ACCUMULATION_STEPS)}")
+    print(f"  - Effective batch size: {config.BATCH_SIZE * config.FINE_TUNE_ACCUMULATION_STEPS}")
 
 
-def get_callbacks(stage: str = 'stage1'):
+def get_callbacks(stage: str = 'stage1', checkpoint: bool = True, budget: TrainingBudget = None):
     """
     Get training callbacks
     
     Args:
         stage: Training stage ('stage1' or 'stage2')
-        
+        checkpoint: Whether to save the best model (off when training the head alone)
+        budget: Time budget that plans the epochs and stops the stage in time
+    
     Returns:
         List of callbacks
     """
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
     callbacks = [
-        # Save best model
-        ModelCheckpoint(
-            filepath=str(config.MODELS_DIR / f'plant_disease_efficientnet_best_{stage}.h5'),
-            monitor='val_accuracy',
-            mode='max',
-            save_best_only=True,
-            save_weights_only=False,
-            verbose=1
-        ),
-        
         # Early stopping
         EarlyStopping(
             monitor='val_loss',
@@ -228,23 +314,42 @@ def get_callbacks(stage: str = 'stage1'):
             verbose=1
         ),
         
-        # TensorBoard
+        # TensorBoard (scalars only; profiler trace only for the configured window)
         TensorBoard(
             log_dir=str(config.LOGS_DIR / f'{stage}_{timestamp}'),
-            histogram_freq=1,
-            write_graph=True,
-            update_freq='epoch'
-        )
+            histogram_freq=0,
+            write_graph=False,
+            update_freq='epoch',
+            profile_batch=config.PROFILE_STEPS if config.PROFILE_STEPS and stage == config.PROFILE_STAGE else 0
+        ),
+        
+        # Step time split, images/sec, memory and CPU/GPU use
+        ThroughputMonitor(stage)
     ]
     
-    # Add cosine decay scheduler if enabled
+    # Report images the input pipeline had to skip
+    if config.SKIP_CORRUPT_IMAGES:
+        callbacks.append(DecodeErrorMonitor())
+    
+    # Resumable checkpoints (written in the background), best model saved once at the end
+    callbacks.append(AsyncCheckpoint(
+        stage,
+        best_path=config.MODELS_DIR / f'plant_disease_efficientnet_best_{stage}.h5' if checkpoint else None,
+        monitor='val_accuracy'
+    ))
+    
+    # Plan the epochs from their measured cost and stop before the deadline
+    if budget:
+        callbacks.append(BudgetStop(budget, stage))
+    
+    # Add cosine decay scheduler if enabled (decays over the budgeted epochs)
     if config.USE_COSINE_DECAY and stage == 'stage1':
         lr_scheduler = LearningRateScheduler(
             lambda epoch: cosine_decay_with_warmup(
                 epoch,
-                config.EPOCHS,
+                budget.planned['stage1'] if budget else config.EPOCHS,
                 config.WARMUP_EPOCHS,
-                config.LEARNING_RATE,
+                scale_learning_rate(config.LEARNING_RATE, config.ACCUMULATION_STEPS),
                 config.MIN_LEARNING_RATE
             ),
             verbose=1
@@ -312,21 +417,110 @@ def save_training_history(history, filepath: Path):
     print(f"✓ Training history saved to {filepath}")
 
 
-def extract_labels_from_dataset(dataset):
-    """Extract all labels from a tf.data.Dataset"""
-    labels = []
-    for _, batch_labels in dataset.unbatch():
-        labels.append(batch_labels.numpy())
-    return np.array(labels)
+def save_final_model(model: keras.Model, filepath: Path):
+    """Save a trained model and report its size"""
+    print("\n💾 Saving final model...")
+    model.save(filepath)
+    print(f"✓ Final model saved: {filepath}")
+    print(f"  - Model size: {os.path.getsize(filepath) / (1024*1024):.2f} MB")
 
 
-def train_optimized_model(fine_tune: bool = False):
+def resize_model(model: keras.Model, num_classes: int, image_size: Tuple[int, int]) -> keras.Model:
+    """
+    Copy of a trained model with a fixed input size
+    
+    Convolutions and global pooling do not depend on the input size, so the
+    same weights are loaded into a model built for image_size (without
+    ImageNet weights, which would be overwritten). It is compiled with the
+    standard settings, because it is evaluated and saved as a served model.
+    
+    Args:
+        model: Trained model
+        num_classes: Number of output classes
+        image_size: Input (height, width) of the copy
+    """
+    if tuple(model.input_shape[1:3]) == tuple(image_size):
+        return model
+    
+    resized, _ = _build_classifier(num_classes, image_size, weights=None)
+    resized.set_weights(model.get_weights())
+    compile_model(resized, config.LEARNING_RATE)
+    return resized
+
+
+def export_resolutions(model: keras.Model, num_classes: int, test_ds: tf.data.Dataset,
+                       image_sizes: List[Tuple[int, int]] = None) -> Dict:
+    """
+    Save serving models at lower resolutions and measure what they cost
+    
+    Each model is evaluated on the test set downscaled to its size and timed on
+    a single CPU image, so a lower resolution can be chosen where latency matters.
+    
+    Args:
+        model: Trained model
+        num_classes: Number of output classes
+        test_ds: Test dataset at IMAGE_SIZE
+        image_sizes: Sizes to export (default: EXPORT_IMAGE_SIZES)
+    
+    Returns:
+        {"<h>x<w>": {path, test_accuracy, latency}} per exported size
+    """
+    from src.distillation import measure_cpu_latency
+    from src.inference import model_path_for_size
+    
+    image_sizes = config.EXPORT_IMAGE_SIZES if image_sizes is None else image_sizes
+    exports = {}
+    
+    for image_size in image_sizes:
+        image_size = tuple(image_size)
+        print(f"\n📐 Exporting {image_size[0]}x{image_size[1]} model...")
+        resized = resize_model(model, num_classes, image_size)
+        
+        resized_test_ds = test_ds.map(lambda x, y: (tf.image.resize(x, image_size, antialias=True), y))
+        test_results = resized.evaluate(resized_test_ds, verbose=0)
+        
+        path = model_path_for_size(image_size)
+        save_final_model(resized, path)
+        
+        exports[f"{image_size[0]}x{image_size[1]}"] = {
+            'path': str(path),
+            'test_accuracy': float(test_results[1]),
+            'latency': measure_cpu_latency(resized, image_size)
+        }
+        print(f"  - Test accuracy: {test_results[1]*100:.2f}%")
+        print(f"  - CPU latency: {exports[f'{image_size[0]}x{image_size[1]}']['latency']['mean_ms']:.1f} ms/image")
+    
+    return exports
+
+
+def train_optimized_model(fine_tune: bool = False, feature_cache: bool = None, resume: bool = None,
+                          extra_callbacks: list = None, time_budget: float = None,
+                          progressive: bool = None):
     """
     Main training function with optimizations
     
     Args:
         fine_tune: If True, performs two-stage fine-tuning
+        feature_cache: If True, trains stage 1 on cached backbone features
+        resume: If True, continues from the latest checkpoint of an interrupted run;
+                False deletes it and starts over; None (default) continues when an
+                interrupted run left a checkpoint
+        extra_callbacks: Callbacks added to both stages (e.g. sweep trial reporting)
+        time_budget: Minutes the whole run may take; epochs are planned to fit
+        progressive: If True, trains the early stage 1 epochs on smaller images
     """
+    if feature_cache is None:
+        feature_cache = config.USE_FEATURE_CACHE
+    if progressive is None:
+        progressive = config.PROGRESSIVE_RESIZING
+    if progressive and feature_cache:
+        print("⚠️  Progressive resizing does not apply to cached features, training stage 1 at full size")
+        progressive = False
+    if time_budget is None:
+        time_budget = config.TIME_BUDGET_MINUTES
+    extra_callbacks = extra_callbacks or []
+    budget = TrainingBudget(time_budget * 60, fine_tune) if time_budget else None
+    
     print("=" * 80)
     print("🌱 AgriSense AI - Optimized Plant Disease Detection Training")
     print("=" * 80)
@@ -337,17 +531,42 @@ def train_optimized_model(fine_tune: bool = False):
     # Load datasets
     print("\n📂 Loading datasets...")
     train_ds, val_ds, test_ds, dataset_info = create_datasets(config.DATA_DIR)
-    
-    # Extract labels for class weights (only if needed)
+    if budget:
+        splits = dataset_info['splits']
+        budget.eval_ratio = len(splits['test']['labels']) / max(len(splits['val']['labels']), 1)
+    # Class weights from the split labels (no pass over the images needed)
     class_weights = None
     if config.USE_CLASS_WEIGHTS:
-        print("\n📊 Extracting labels for class weight computation...")
-        # Create a temporary dataset to extract labels
-        train_labels = extract_labels_from_dataset(train_ds)
-        class_weights = compute_class_weights(train_labels)
+        class_weights = compute_class_weights(
+            dataset_info['splits']['train']['labels'], dataset_info['num_classes']
+        )
     
-    # Build model
-    model, base_model = build_optimized_model(dataset_info['num_classes'])
+    # Checkpoint to continue from (a finished run removes its checkpoints)
+    if resume is False:
+        clear_checkpoints()
+    resume_state = latest_checkpoint()
+    if resume and resume_state is None:
+        print("⚠️  No checkpoint found, starting from scratch")
+    elif resume is None and resume_state is not None:
+        print(f"⏩ Continuing the interrupted run from {Path(resume_state['path']).name} "
+              f"(--fresh starts over)")
+    stage1_done = completed_stage('stage1') if resume_state else None
+    
+    # Smaller images in the early stage 1 epochs (the schedule follows the time budget)
+    resizing = None
+    if progressive:
+        resizing = ProgressiveResizing(lambda: budget.planned['stage1'] if budget else config.EPOCHS)
+        train_ds = resizing.apply(train_ds)
+    
+    # Lets ThroughputMonitor measure input wait (class weights become sample weights);
+    # balanced sampling already evens out the classes of the image dataset
+    balanced = dataset_info['sampling'] == 'balanced'
+    train_ds = instrument_dataset(train_ds, None if balanced else class_weights)
+    
+    # Build model (any input size when the training size changes)
+    model, base_model = build_optimized_model(
+        dataset_info['num_classes'], (None, None) if progressive else config.IMAGE_SIZE
+    )
     
     # Print model summary
     print("\n" + "="*80)
@@ -359,24 +578,68 @@ def train_optimized_model(fine_tune: bool = False):
     print("📚 Stage 1: Training with frozen base model")
     print("="*80)
     print(f"  - Epochs: {config.EPOCHS}")
-    print(f"  - Initial LR: {config.LEARNING_RATE}")
-    print(f"  - Batch size: {config.BATCH_SIZE}")
+    if budget:
+        print(f"  - Time budget: {time_budget:g} minutes (epochs planned after the first one)")
+    print(f"  - Initial LR: {scale_learning_rate(config.LEARNING_RATE, config.ACCUMULATION_STEPS)}")
+    print(f"  - Batch size: {config.BATCH_SIZE} x {config.ACCUMULATION_STEPS} accumulation step(s)")
     print(f"  - Class weights: {'Enabled' if class_weights else 'Disabled'}")
+    if balanced:
+        print(f"  - Sampling: class-balanced, {dataset_info['steps_per_epoch']} steps per epoch")
     print(f"  - Label smoothing: {config.LABEL_SMOOTHING}")
     print(f"  - Cosine decay: {'Enabled' if config.USE_COSINE_DECAY else 'Disabled'}")
+    print(f"  - Feature cache: {f'Enabled ({config.FEATURE_CACHE_VIEWS} view(s))' if feature_cache else 'Disabled'}")
+    print(f"  - Progressive resizing: {'Enabled' if progressive else 'Disabled'}")
+    print(f"  - Precision policy: {keras.mixed_precision.global_policy().name}")
+    print(f"  - XLA: {'Enabled' if config.JIT_COMPILE else 'Disabled'}")
     
     start_time = time.time()
+    stage1_state = resume_state if resume_state and resume_state['stage'] == 'stage1' else None
+    
+    if stage1_done:
+        print("\n⏭️  Stage 1 already completed, restoring its final weights")
+        restore_checkpoint(model, stage1_done)
+        history_stage1 = keras.callbacks.History()
+        history_stage1.history = stage1_done['history']
+    elif feature_cache:
+        # Base is frozen, so run it once and train the head on its features
+        splits = dataset_info['splits']
+        train_features, train_feature_labels = build_feature_cache(
+            base_model, splits['train']['paths'], splits['train']['labels'], 'train',
+            views=config.FEATURE_CACHE_VIEWS, augment=config.FEATURE_CACHE_AUGMENT
+        )
+        val_features, val_feature_labels = build_feature_cache(
+            base_model, splits['val']['paths'], splits['val']['labels'], 'val'
+        )
+        
+        head_model = build_head_model(model, base_model)
+        history_stage1 = fit_resumable(
+            head_model,
+            instrument_dataset(
+                create_feature_dataset(train_features, train_feature_labels, is_training=True), class_weights
+            ),
+            validation_data=create_feature_dataset(val_features, val_feature_labels),
+            epochs=config.EPOCHS,
+            callbacks=get_callbacks('stage1', checkpoint=False, budget=budget) + extra_callbacks,
+            state=stage1_state,
+            verbose=1
+        )
+    else:
+        history_stage1 = fit_resumable(
+            model,
+            train_ds,
+            validation_data=val_ds,
+            epochs=config.EPOCHS,
+            steps_per_epoch=dataset_info['steps_per_epoch'],
+            callbacks=get_callbacks('stage1', budget=budget) + ([resizing] if resizing else []) + extra_callbacks,
+            state=stage1_state,
+            verbose=1
+        )
     
-    history_stage1 = model.fit(
-        train_ds,
-        validation_data=val_ds,
-        epochs=config.EPOCHS,
-        class_weight=class_weights,
-        callbacks=get_callbacks('stage1'),
-        verbose=1
-    )
-    
-    stage1_time = time.time() - start_time
+    if stage1_done:
+        stage1_time = stage1_done['elapsed_seconds']
+    else:
+        stage1_time = time.time() - start_time + (stage1_state['elapsed_seconds'] if stage1_state else 0)
+        save_stage_checkpoint(model, 'stage1', history_stage1.history, stage1_time)
     
     print(f"\n✓ Stage 1 completed in {stage1_time/60:.2f} minutes")
     
@@ -406,6 +669,10 @@ def train_optimized_model(fine_tune: bool = False):
     # Stage 2: Fine-tuning (if enabled)
     final_test_accuracy = test_results[1]
     
+    if fine_tune and budget and not budget.planned['stage2']:
+        print("\n⏳ Time budget: no fine-tuning epoch fits, skipping stage 2")
+        fine_tune = False
+    
     if fine_tune:
         print("\n" + "="*80)
         print("🔧 Stage 2: Fine-tuning with unfrozen layers")
@@ -413,21 +680,24 @@ def train_optimized_model(fine_tune: bool = False):
         
         unfreeze_model(model, base_model, num_layers=config.FINE_TUNE_LAYERS)
         
-        print(f"  - Epochs: {config.FINE_TUNE_EPOCHS}")
-        print(f"  - Fine-tune LR: {config.LEARNING_RATE / 10}")
+        print(f"  - Epochs: {budget.planned['stage2'] if budget else config.FINE_TUNE_EPOCHS}")
+        print(f"  - Fine-tune LR: {scale_learning_rate(config.LEARNING_RATE / 10, config.FINE_TUNE_ACCUMULATION_STEPS)}")
         
         start_time = time.time()
+        stage2_state = resume_state if resume_state and resume_state['stage'] == 'stage2' else None
         
-        history_stage2 = model.fit(
+        history_stage2 = fit_resumable(
+            model,
             train_ds,
             validation_data=val_ds,
             epochs=config.FINE_TUNE_EPOCHS,
-            class_weight=class_weights,
-            callbacks=get_callbacks('stage2'),
+            steps_per_epoch=dataset_info['steps_per_epoch'],
+            callbacks=get_callbacks('stage2', budget=budget) + extra_callbacks,
+            state=stage2_state,
             verbose=1
         )
         
-        stage2_time = time.time() - start_time
+        stage2_time = time.time() - start_time + (stage2_state['elapsed_seconds'] if stage2_state else 0)
         
         print(f"\n✓ Stage 2 completed in {stage2_time/60:.2f} minutes")
         
@@ -452,10 +722,31 @@ def train_optimized_model(fine_tune: bool = False):
             config.MODELS_DIR / "training_history_stage2.json"
         )
     
-    # Save final model
-    print("\n💾 Saving final model...")
-    model.save(config.MODEL_H5_PATH)
-    print(f"✓ Final model saved: {config.MODEL_H5_PATH}")
+    # Save final model (fixed at IMAGE_SIZE)
+    save_final_model(resize_model(model, dataset_info['num_classes'], config.IMAGE_SIZE), config.MODEL_H5_PATH)
+    
+    # The budget keeps time back for the serving exports; skip them if it ran out anyway
+    run_exports = not budget or budget.remaining_seconds() >= budget.export_seconds()
+    if not run_exports:
+        print("\n⏳ Time budget: no time left for the serving exports, skipping them")
+    
+    # Lower-resolution serving models
+    exports = export_resolutions(model, dataset_info['num_classes'], test_ds) if run_exports else {}
+    
+    # Inference-only copy (BatchNorm folded, no Dropout) for the predictor
+    inference_export = None
+    if config.EXPORT_INFERENCE_MODEL and run_exports:
+        # The trained model is already saved, so a failed export must not end the run
+        try:
+            report = export_inference_model(config.MODEL_H5_PATH, test_ds=test_ds)
+            inference_export = {
+                'path': report['inference']['path'],
+                'parity_max_abs_diff': report['parity']['max_abs_diff'],
+                'speedup': report['speedup']
+            }
+        except Exception as e:
+            print(f"\n⚠️  Inference-only export failed, serving the trained model: {e}")
+            inference_export = {'error': str(e)}
     
     # Save training info
     training_info = {
@@ -464,6 +755,7 @@ def train_optimized_model(fine_tune: bool = False):
         'class_names': dataset_info['class_names'],
         'image_size': config.IMAGE_SIZE,
         'batch_size': config.BATCH_SIZE,
+        'accumulation_steps': config.ACCUMULATION_STEPS,
         'stage1_epochs': len(history_stage1.history['loss']),
         'final_train_accuracy': float(history_stage1.history['accuracy'][-1]),
         'final_val_accuracy': float(history_stage1.history['val_accuracy'][-1]),
@@ -471,14 +763,28 @@ def train_optimized_model(fine_tune: bool = False):
         'training_time_stage1_minutes': stage1_time / 60,
         'fine_tuned': fine_tune,
         'class_weights_used': config.USE_CLASS_WEIGHTS,
+        'sampling': dataset_info['sampling'],
+        'steps_per_epoch': dataset_info['steps_per_epoch'],
+        'class_counts': dataset_info['class_counts'],
         'label_smoothing': config.LABEL_SMOOTHING,
+        'head_dropout': config.HEAD_DROPOUT,
         'cosine_decay': config.USE_COSINE_DECAY,
+        'feature_cache': feature_cache,
+        'progressive_resizing': [f"{h}x{w}" for h, w in resizing.epoch_sizes] if resizing else None,
+        'exported_resolutions': exports,
+        'inference_export': inference_export,
+        'precision_policy': keras.mixed_precision.global_policy().name,
+        'jit_compile': config.JIT_COMPILE,
+        'skipped_images': decode_error_counts(),
+        'resumed_from': Path(resume_state['path']).name if resume_state else None,
+        'time_budget': budget.summary() if budget else None,
         'timestamp': datetime.now().isoformat()
     }
     
     if fine_tune:
         training_info.update({
             'stage2_epochs': len(history_stage2.history['loss']),
+            'fine_tune_accumulation_steps': config.FINE_TUNE_ACCUMULATION_STEPS,
             'training_time_stage2_minutes': stage2_time / 60,
             'total_training_time_minutes': (stage1_time + stage2_time) / 60
         })
@@ -488,15 +794,22 @@ def train_optimized_model(fine_tune: bool = False):
     with open(config.MODELS_DIR / "training_info.json", 'w') as f:
         json.dump(training_info, f, indent=4)
     
+    # The run is complete: the next one starts fresh instead of resuming it
+    clear_checkpoints()
+    
     print("\n" + "="*80)
     print("✅ TRAINING COMPLETED SUCCESSFULLY!")
     print("="*80)
     print(f"\n📊 Final Results:")
     print(f"  - Test Accuracy: {final_test_accuracy*100:.2f}%")
     print(f"  - Total Training Time: {training_info['total_training_time_minutes']:.2f} minutes")
+    if budget:
+        print(f"  - Time budget: {budget.summary()['used_minutes']:.2f} of {time_budget:g} minutes used")
     print(f"  - Model Size: {os.path.getsize(config.MODEL_H5_PATH) / (1024*1024):.2f} MB")
     print(f"\n📁 Output Files:")
     print(f"  - Model: {config.MODEL_H5_PATH}")
+    if inference_export and 'path' in inference_export:
+        print(f"  - Inference Model: {inference_export['path']}")
     print(f"  - Training Info: {config.MODELS_DIR / 'training_info.json'}")
     print(f"  - Logs: {config.LOGS_DIR}")
     
@@ -522,13 +835,95 @@ if __name__ == "__main__":
                        help='Enable two-stage fine-tuning for better accuracy')
     parser.add_argument('--epochs', type=int, default=None,
                        help='Override number of epochs')
+    parser.add_argument('--feature-cache', action='store_true',
+                       help='Train stage 1 on cached backbone features (frozen base)')
+    parser.add_argument('--cache-views', type=int, default=None,
+                       help='Augmented views per image stored in the feature cache')
+    parser.add_argument('--distill', action='store_true',
+                       help='Distill the trained model into a small CPU-friendly student')
+    parser.add_argument('--optimize', action='store_true',
+                       help='After training, prune and cluster the model (see src/model_optimization.py)')
+    parser.add_argument('--xla', action='store_true',
+                       help='XLA-compile the training step')
+    parser.add_argument('--accumulation-steps', type=int, default=None,
+                       help='Micro-batches per optimizer update when fine-tuning')
+    parser.add_argument('--bf16', action='store_true',
+                       help='Use bfloat16 mixed precision on CPUs with AVX512_BF16/AMX')
+    parser.add_argument('--resume', action='store_true', default=None,
+                       help='Continue an interrupted run from its latest checkpoint '
+                            '(the default when one exists)')
+    parser.add_argument('--fresh', action='store_false', dest='resume',
+                       help="Delete an interrupted run's checkpoints and start over")
+    parser.add_argument('--checkpoint-every', type=int, default=None,
+                       help='Also checkpoint every N steps within an epoch')
+    parser.add_argument('--profile-steps', type=str, default=None,
+                       help='Trace steps FIRST,LAST with the TensorFlow profiler (e.g. 100,120)')
+    parser.add_argument('--profile-stage', choices=['stage1', 'stage2'], default=None,
+                       help='Stage the profiler window applies to (default: stage1)')
+    parser.add_argument('--time-budget', type=float, default=None,
+                       help='Minutes the whole run may take; epochs are planned to fit')
+    parser.add_argument('--progressive', action='store_true',
+                       help='Train the early stage 1 epochs on smaller images')
+    parser.add_argument('--balanced-sampling', action='store_true',
+                       help='Draw training batches class-balanced instead of weighting the loss')
+    parser.add_argument('--steps-per-epoch', type=int, default=None,
+                       help='Epoch length with balanced sampling')
+    parser.add_argument('--export-sizes', type=str, default=None,
+                       help='Also save serving models at these sizes (e.g. 160,192; "none" to skip)')
     
     args = parser.parse_args()
     
     # Override config if needed
     if args.epochs:
         config.EPOCHS = args.epochs
+        config.DISTILL_EPOCHS = args.epochs
         print(f"✓ Epochs set to: {args.epochs}")
     
+    if args.cache_views:
+        config.FEATURE_CACHE_VIEWS = args.cache_views
+    
+    if args.accumulation_steps:
+        config.FINE_TUNE_ACCUMULATION_STEPS = args.accumulation_steps
+    
+    if args.xla:
+        config.JIT_COMPILE = True
+    
+    if args.bf16:
+        config.CPU_MIXED_PRECISION = True
+    
+    if args.checkpoint_every:
+        config.CHECKPOINT_EVERY_STEPS = args.checkpoint_every
+    
+    if args.profile_steps:
+        config.PROFILE_STEPS = tuple(int(step) for step in args.profile_steps.split(','))
+    
+    if args.profile_stage:
+        config.PROFILE_STAGE = args.profile_stage
+    
+    if args.balanced_sampling:
+        config.TRAIN_SAMPLING = 'balanced'
+    
+    if args.steps_per_epoch:
+        config.SAMPLER_STEPS_PER_EPOCH = args.steps_per_epoch
+    
+    if args.export_sizes:
+        config.EXPORT_IMAGE_SIZES = [] if args.export_sizes == 'none' else [
+            (int(size), int(size)) for size in args.export_sizes.split(',')
+        ]
+    
     # Train model
-    model, info = train_optimized_model(fine_tune=args.fine_tune)
+    if args.distill:
+        from src.distillation import train_distilled_student
+        model, info = train_distilled_student()
+    else:
+        model, info = train_optimized_model(
+            fine_tune=args.fine_tune,
+            feature_cache=args.feature_cache or config.USE_FEATURE_CACHE,
+            resume=args.resume,
+            time_budget=args.time_budget,
+            progressive=args.progressive or config.PROGRESSIVE_RESIZING
+        )
+        
+        if args.optimize:
+            from src.model_optimization import optimize_model
+            optimize_model()
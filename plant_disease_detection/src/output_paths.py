@@ -0,0 +1,58 @@
+"""
+Per-run output directories
+Sweep trials and non-chief distributed workers train with the same code as
+a normal run, but must not overwrite the models the API serves. Everything a
+run writes (models, reports, logs, checkpoints and model-specific caches) is
+pointed at its own directory; the dataset index, split manifest, dedup and
+dataset caches stay shared.
+"""
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+
+
+# Files written by training, export and evaluation (config attribute names)
+OUTPUT_FILES = (
+    'MODEL_H5_PATH',
+    'CLASS_MAPPING_PATH',
+    'TRAINING_HISTORY_PATH',
+    'FAST_MODEL_H5_PATH',
+    'CASCADE_CONFIG_PATH',
+    'DISTILLATION_REPORT_PATH',
+    'OPTIMIZED_MODEL_H5_PATH',
+    'OPTIMIZATION_REPORT_PATH',
+    'INFERENCE_MODEL_H5_PATH',
+    'INFERENCE_EXPORT_REPORT_PATH',
+)
+
+# Directories written by training (depend on the model, not only on the data)
+OUTPUT_DIRS = (
+    'MODEL_SAVEDMODEL_PATH',
+    'CHECKPOINT_DIR',
+    'FEATURE_CACHE_DIR',
+    'DISTILL_CACHE_DIR',
+)
+
+
+def redirect_outputs(directory: Path) -> Path:
+    """
+    Point every training output at a directory
+    
+    Args:
+        directory: Directory of the run (created if missing)
+    
+    Returns:
+        The directory
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    
+    config.MODELS_DIR = directory
+    config.LOGS_DIR = directory / "logs"
+    for name in OUTPUT_FILES + OUTPUT_DIRS:
+        setattr(config, name, directory / getattr(config, name).name)
+    
+    return directory
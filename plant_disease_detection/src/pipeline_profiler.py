@@ -0,0 +1,270 @@
+"""
+Input pipeline profiler
+Benchmarks the training input pipeline stage by stage (read, decode, resize,
+augment, batch, prefetch), measures images/sec and CPU utilisation, compares
+it with the model's training step time and recommends tf.data settings that
+can be applied through config.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+from src.data_preprocessing import (
+    setup_gpu,
+    create_tf_dataset,
+    decode_and_resize,
+    preprocess_cached_image,
+    augment_and_normalize_batch,
+    parallel_calls
+)
+from src.dataset_split import load_split
+
+
+TUNABLE_SETTINGS = (
+    'PIPELINE_NUM_PARALLEL_CALLS',
+    'SHUFFLE_BUFFER_SIZE',
+    'PREFETCH_BUFFER_SIZE',
+    'PRIVATE_THREADPOOL_SIZE',
+    'DETERMINISTIC_PIPELINE'
+)
+
+
+def measure_pipeline(dataset: tf.data.Dataset, num_images: int) -> dict:
+    """
+    Iterate a dataset until num_images images were produced
+    
+    Works for batched and unbatched datasets. The first element is excluded so
+    graph tracing and buffer warm-up are not timed.
+    
+    Returns:
+        Images/sec and CPU utilisation (share of all cores used by this process)
+    """
+    iterator = iter(dataset)
+    next(iterator)
+    
+    images = 0
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for element in iterator:
+        first = element[0] if isinstance(element, tuple) else element
+        images += int(first.shape[0]) if first.shape.rank == 4 else 1
+        if images >= num_images:
+            break
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    
+    return {
+        'images_per_sec': images / wall if wall > 0 else 0.0,
+        'cpu_utilisation': cpu / (wall * os.cpu_count()) if wall > 0 else 0.0
+    }
+
+
+def stage_pipelines(paths: np.ndarray, labels: np.ndarray) -> dict:
+    """
+    Pipelines that each add one stage of the training pipeline
+    
+    The last one is create_tf_dataset itself (training mode, current config).
+    """
+    base = tf.data.Dataset.from_tensor_slices((paths, labels)).repeat()
+    image_size = config.IMAGE_SIZE
+    
+    def augment(x, y):
+        return preprocess_cached_image(x, y, is_training=True, image_size=image_size)
+    
+    read = base.map(lambda x, y: (tf.io.read_file(x), y), num_parallel_calls=parallel_calls())
+    decode = base.map(
+        lambda x, y: (tf.io.decode_image(tf.io.read_file(x), channels=3, expand_animations=False), y),
+        num_parallel_calls=parallel_calls()
+    )
+    resize = base.map(lambda x, y: (decode_and_resize(x, image_size), y),
+                      num_parallel_calls=parallel_calls())
+    
+    stages = {'read': read, 'decode': decode, 'resize': resize}
+    
+    # Batched augmentation runs after batch(), per-image augmentation before it
+    if config.BATCH_AUGMENTATION:
+        stages['batch'] = resize.batch(config.BATCH_SIZE)
+        stages['augment'] = stages['batch'].map(augment_and_normalize_batch,
+                                                num_parallel_calls=parallel_calls())
+    else:
+        stages['augment'] = resize.map(augment, num_parallel_calls=parallel_calls())
+        stages['batch'] = stages['augment'].batch(config.BATCH_SIZE)
+    
+    stages['prefetch'] = create_tf_dataset(paths, labels, is_training=True).repeat()
+    
+    return stages
+
+
+def measure_model_step(num_classes: int, steps: int = 10, fine_tune: bool = False) -> float:
+    """
+    Training step time of the EfficientNetB0 model on synthetic batches
+    
+    Args:
+        num_classes: Size of the output layer
+        steps: Timed steps
+        fine_tune: Time the stage 2 step (last FINE_TUNE_LAYERS of the base unfrozen)
+    
+    Returns:
+        Milliseconds per step
+    """
+    from src.model_training_optimized import build_optimized_model, unfreeze_model
+    
+    model, base_model = build_optimized_model(num_classes)
+    if fine_tune:
+        unfreeze_model(model, base_model, num_layers=config.FINE_TUNE_LAYERS)
+    images = tf.random.uniform([config.BATCH_SIZE, *config.IMAGE_SIZE, 3])
+    labels = tf.random.uniform([config.BATCH_SIZE], 0, num_classes, dtype=tf.int64)
+    
+    model.train_on_batch(images, labels)  # Warm-up (and XLA compilation)
+    start = time.perf_counter()
+    for _ in range(steps):
+        model.train_on_batch(images, labels)
+    
+    return (time.perf_counter() - start) * 1000 / steps
+
+
+def tune_settings(paths: np.ndarray, labels: np.ndarray, num_images: int) -> tuple:
+    """
+    Coordinate search over the tf.data knobs on the full training pipeline
+    
+    Each knob is tried in turn while the others keep their best value so far.
+    
+    Returns:
+        Best settings and the throughput of every candidate
+    """
+    cores = os.cpu_count()
+    candidates = {
+        'PIPELINE_NUM_PARALLEL_CALLS': [None, cores, max(cores // 2, 1)],
+        'PRIVATE_THREADPOOL_SIZE': [0, cores],
+        'PREFETCH_BUFFER_SIZE': [None, 2, 8],
+        'DETERMINISTIC_PIPELINE': [True, False]
+    }
+    
+    best = {name: getattr(config, name) for name in candidates}
+    trials = []
+    
+    for name, values in candidates.items():
+        rates = {}
+        for value in values:
+            setattr(config, name, value)
+            dataset = create_tf_dataset(paths, labels, is_training=True).repeat()
+            rates[value] = measure_pipeline(dataset, num_images)['images_per_sec']
+            trials.append({**best, name: value, 'images_per_sec': rates[value]})
+            print(f"  - {name}={value}: {rates[value]:,.0f} images/sec")
+        
+        best[name] = max(rates, key=rates.get)
+        setattr(config, name, best[name])
+    
+    # Shuffling paths is cheap, so shuffle as much of the split as possible
+    best['SHUFFLE_BUFFER_SIZE'] = int(min(len(paths), 100_000))
+    
+    return best, trials
+
+
+def profile_pipeline(num_images: int = 512, include_model: bool = True) -> dict:
+    """
+    Profile the training input pipeline and recommend settings
+    
+    Args:
+        num_images: Images to pull through each pipeline variant
+        include_model: Whether to measure the model training step for comparison
+    
+    Returns:
+        Profiling report
+    """
+    print("=" * 80)
+    print("🌱 AgriSense AI - Input Pipeline Profiler")
+    print("=" * 80)
+    
+    setup_gpu()
+    
+    # Pipelines are built without a split name, so disk caches and shards are bypassed
+    paths, labels, class_names = load_split(config.DATA_DIR, 'train')
+    
+    print(f"\n⏱️  Stage throughput ({num_images} images each, stages are cumulative)...")
+    stages = {}
+    for name, dataset in stage_pipelines(paths, labels).items():
+        stages[name] = measure_pipeline(dataset, num_images)
+        print(f"  - +{name:<10} {stages[name]['images_per_sec']:>10,.0f} images/sec  "
+              f"CPU {stages[name]['cpu_utilisation']*100:5.1f}%")
+    
+    pipeline_rate = stages['prefetch']['images_per_sec']
+    
+    print("\n🔧 Tuning tf.data settings...")
+    current = {name: getattr(config, name) for name in TUNABLE_SETTINGS}
+    recommended, trials = tune_settings(paths, labels, num_images)
+    tuned_rate = max(t['images_per_sec'] for t in trials)
+    for name, value in current.items():
+        setattr(config, name, value)
+    
+    report = {
+        'stages': stages,
+        'pipeline_images_per_sec': pipeline_rate,
+        'tuned_pipeline_images_per_sec': tuned_rate,
+        'current_settings': current,
+        'recommended_settings': recommended,
+        'trials': trials,
+        'cpu_count': os.cpu_count(),
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    if include_model:
+        print("\n🏗️  Measuring model training step...")
+        step_ms = measure_model_step(len(class_names))
+        model_rate = config.BATCH_SIZE * 1000 / step_ms
+        report.update({
+            'model_step_ms': step_ms,
+            'model_images_per_sec': model_rate,
+            'input_bound': tuned_rate < model_rate
+        })
+    
+    with open(config.MODELS_DIR / "pipeline_profile.json", 'w') as f:
+        json.dump(report, f, indent=4, default=str)
+    
+    print("\n📊 Summary:")
+    print(f"  - Input pipeline: {pipeline_rate:,.0f} images/sec (tuned: {tuned_rate:,.0f})")
+    if include_model:
+        print(f"  - Model step: {report['model_step_ms']:.1f} ms "
+              f"({report['model_images_per_sec']:,.0f} images/sec)")
+        if report['input_bound']:
+            print("  ⚠️  Training is input-bound: the model waits for data")
+        else:
+            print("  ✓ Training is compute-bound: the input pipeline keeps up")
+    print("\n💡 Recommended settings:")
+    for name, value in recommended.items():
+        print(f"  - {name} = {value}")
+    print(f"\n✓ Report saved to {config.MODELS_DIR / 'pipeline_profile.json'}")
+    
+    return report
+
+
+def apply_settings(settings: dict):
+    """Persist settings so config.py picks them up on this machine"""
+    with open(config.PIPELINE_TUNING_PATH, 'w') as f:
+        json.dump({'settings': settings, 'timestamp': datetime.now().isoformat()}, f, indent=4)
+    print(f"✓ Settings written to {config.PIPELINE_TUNING_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Profile and tune the training input pipeline')
+    parser.add_argument('--images', type=int, default=512,
+                       help='Images to pull through each pipeline variant')
+    parser.add_argument('--no-model', action='store_true',
+                       help='Skip measuring the model training step')
+    parser.add_argument('--apply', action='store_true',
+                       help='Write the recommended settings to pipeline_tuning.json')
+    
+    args = parser.parse_args()
+    
+    report = profile_pipeline(args.images, include_model=not args.no_model)
+    
+    if args.apply:
+        apply_settings(report['recommended_settings'])
@@ -0,0 +1,108 @@
+"""
+Training step benchmark for XLA and mixed precision
+Times the training step of the EfficientNetB0 model for every combination of
+XLA compilation (on/off) and precision policy (float32, mixed_bfloat16 on CPU
+or mixed_float16 on GPU) so the fastest mode for a machine can be picked.
+"""
+import sys
+import json
+import argparse
+import tensorflow as tf
+from tensorflow import keras
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+from src.data_preprocessing import cpu_supports_bfloat16
+from src.pipeline_profiler import measure_model_step
+
+
+def candidate_policies() -> list:
+    """Precision policies worth measuring on this machine"""
+    if tf.config.list_physical_devices('GPU'):
+        return ['float32', 'mixed_float16']
+    
+    # bfloat16 also runs without native support, just emulated (and slower)
+    return ['float32', 'mixed_bfloat16']
+
+
+def benchmark_training_step(num_classes: int = 15, steps: int = 10, fine_tune: bool = False) -> dict:
+    """
+    Measure the training step for every XLA/precision combination
+    
+    Args:
+        num_classes: Size of the output layer
+        steps: Timed steps per combination
+        fine_tune: Whether to unfreeze the last FINE_TUNE_LAYERS of the base
+                   (stage 2) instead of timing the frozen stage 1 step
+    
+    Returns:
+        Benchmark report
+    """
+    original_policy = keras.mixed_precision.global_policy().name
+    original_jit = config.JIT_COMPILE
+    results = []
+    
+    for policy in candidate_policies():
+        for jit_compile in (False, True):
+            keras.backend.clear_session()
+            keras.mixed_precision.set_global_policy(policy)
+            config.JIT_COMPILE = jit_compile
+            
+            step_ms = measure_model_step(num_classes, steps, fine_tune)
+            
+            results.append({
+                'policy': policy,
+                'jit_compile': jit_compile,
+                'step_ms': step_ms,
+                'images_per_sec': config.BATCH_SIZE * 1000 / step_ms
+            })
+            print(f"  - {policy:<15} XLA {'on ' if jit_compile else 'off'}: "
+                  f"{step_ms:8.1f} ms/step ({results[-1]['images_per_sec']:,.0f} images/sec)")
+    
+    keras.backend.clear_session()
+    keras.mixed_precision.set_global_policy(original_policy)
+    config.JIT_COMPILE = original_jit
+    
+    baseline = results[0]['step_ms']
+    for result in results:
+        result['speedup'] = baseline / result['step_ms']
+    
+    return {
+        'stage': 'stage2' if fine_tune else 'stage1',
+        'batch_size': config.BATCH_SIZE,
+        'native_bfloat16': cpu_supports_bfloat16(),
+        'results': results,
+        'fastest': min(results, key=lambda r: r['step_ms']),
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark XLA and mixed precision training steps')
+    parser.add_argument('--steps', type=int, default=10,
+                       help='Timed training steps per combination')
+    parser.add_argument('--num-classes', type=int, default=15,
+                       help='Number of output classes')
+    parser.add_argument('--fine-tune', action='store_true',
+                       help='Time the stage 2 step with the top of the base unfrozen')
+    
+    args = parser.parse_args()
+    
+    print("=" * 80)
+    print("🌱 AgriSense AI - Training Step Benchmark")
+    print("=" * 80)
+    print(f"\n⏱️  Batch size {config.BATCH_SIZE}, native bfloat16: {cpu_supports_bfloat16()}")
+    
+    report = benchmark_training_step(args.num_classes, args.steps, args.fine_tune)
+    
+    report_path = config.MODELS_DIR / "precision_benchmark.json"
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    
+    fastest = report['fastest']
+    print(f"\n💡 Fastest: {fastest['policy']} with XLA {'on' if fastest['jit_compile'] else 'off'} "
+          f"({fastest['speedup']:.2f}x vs float32 without XLA)")
+    print(f"✓ Report saved to {report_path}")
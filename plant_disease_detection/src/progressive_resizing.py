@@ -0,0 +1,106 @@
+"""
+Progressive resizing
+Trains the early stage 1 epochs on smaller images (PROGRESSIVE_SIZES) and the
+final ones at IMAGE_SIZE. The input pipeline still decodes and augments at
+IMAGE_SIZE; whole batches are downscaled at the end of the pipeline, so one
+dataset and one fit() call serve every phase. The model has to accept any
+input size (build_optimized_model(..., image_size=(None, None))).
+"""
+import sys
+import tensorflow as tf
+from pathlib import Path
+from typing import Callable, List, Tuple, Union
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+
+
+def progressive_schedule(epochs: int, sizes: List[Tuple[int, int]] = None,
+                         full_size_fraction: float = None) -> List[Tuple[int, Tuple[int, int]]]:
+    """
+    Image size of each training phase
+    
+    The last full_size_fraction of the epochs (at least one) run at IMAGE_SIZE;
+    the epochs before are split evenly between the smaller sizes, smallest first.
+    
+    Args:
+        epochs: Epochs in the stage
+        sizes: Smaller image sizes (default: PROGRESSIVE_SIZES)
+        full_size_fraction: Share of epochs at IMAGE_SIZE (default: PROGRESSIVE_FULL_SIZE_FRACTION)
+    
+    Returns:
+        List of (first epoch, image size), in epoch order
+    """
+    sizes = [tuple(size) for size in (config.PROGRESSIVE_SIZES if sizes is None else sizes)]
+    if full_size_fraction is None:
+        full_size_fraction = config.PROGRESSIVE_FULL_SIZE_FRACTION
+    
+    early_epochs = max(epochs - max(round(epochs * full_size_fraction), 1), 0)
+    
+    schedule = []
+    for i, size in enumerate(sorted(sizes)):
+        first_epoch = early_epochs * i // len(sizes)
+        # A size left without epochs is dropped
+        if first_epoch < early_epochs * (i + 1) // len(sizes):
+            schedule.append((first_epoch, size))
+    schedule.append((early_epochs, tuple(config.IMAGE_SIZE)))
+    
+    return schedule
+
+
+class ProgressiveResizing(tf.keras.callbacks.Callback):
+    """
+    Switch the training image size at the start of every phase
+    
+    apply() adds the downscaling to the training dataset; the callback sets the
+    size it resizes to. At the end of training the size goes back to IMAGE_SIZE,
+    so the same dataset can be used for fine-tuning.
+    """
+    
+    def __init__(self, epochs: Union[int, Callable[[], int]]):
+        """
+        Args:
+            epochs: Epochs in the stage, or a function returning the current plan
+                (the schedule then follows a time budget)
+        """
+        super().__init__()
+        self.epochs = epochs
+        self.image_size = tf.Variable(config.IMAGE_SIZE, dtype=tf.int32, trainable=False)
+        self.epoch_sizes = []
+    
+    def apply(self, dataset: tf.data.Dataset) -> tf.data.Dataset:
+        """
+        Downscale batches of (images, labels[, weights]) to the current size
+        
+        A few batches already prefetched when the phase changes keep the
+        previous size.
+        """
+        def resize(images, *rest):
+            images = tf.cond(
+                tf.reduce_all(tf.shape(images)[1:3] == self.image_size),
+                lambda: images,
+                lambda: tf.image.resize(images, self.image_size, antialias=True)
+            )
+            return (images, *rest)
+        
+        return dataset.map(resize, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+    
+    def size_for_epoch(self, epoch: int) -> Tuple[int, int]:
+        """Image size of an epoch under the current schedule"""
+        epochs = self.epochs() if callable(self.epochs) else self.epochs
+        size = tuple(config.IMAGE_SIZE)
+        for first_epoch, phase_size in progressive_schedule(epochs):
+            if epoch >= first_epoch:
+                size = phase_size
+        return size
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        size = self.size_for_epoch(epoch)
+        if size != tuple(self.image_size.numpy()):
+            print(f"\n📐 Progressive resizing: training at {size[0]}x{size[1]} from epoch {epoch + 1}")
+            self.image_size.assign(size)
+        self.epoch_sizes.append(size)
+    
+    def on_train_end(self, logs=None):
+        self.image_size.assign(config.IMAGE_SIZE)
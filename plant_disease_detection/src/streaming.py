@@ -0,0 +1,171 @@
+"""
+Streaming inference utilities for live camera diagnosis
+Provides a shared micro-batcher for concurrent streams and per-stream
+frame skipping / prediction smoothing
+"""
+import asyncio
+import numpy as np
+from pathlib import Path
+from typing import Callable, Optional
+import sys
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+
+
+class InferenceBatcher:
+    """Collects single images from concurrent callers and runs them as one batch"""
+    
+    def __init__(self, predict_fn: Callable[[np.ndarray], np.ndarray],
+                 max_batch_size: int = None, max_wait_ms: float = None):
+        """
+        Initialize the batcher
+        
+        Args:
+            predict_fn: Function mapping a (batch, H, W, 3) array to probabilities
+            max_batch_size: Maximum number of images per model call
+            max_wait_ms: Maximum time to wait for a batch to fill
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size or config.INFERENCE_MAX_BATCH_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else config.INFERENCE_MAX_WAIT_MS) / 1000.0
+        
+        self._queue = None
+        self._worker = None
+    
+    async def start(self):
+        """Start the background batching task"""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop the background batching task"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+    
+    async def submit(self, image_array: np.ndarray) -> np.ndarray:
+        """
+        Queue a preprocessed image and wait for its probabilities
+        
+        Args:
+            image_array: Preprocessed image of shape (H, W, 3)
+        
+        Returns:
+            Class probabilities for the image
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_array, future))
+        return await future
+    
+    async def _run(self):
+        """Drain the queue into batches and run them off the event loop"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            
+            # Fill the batch until it is full or the wait budget is spent
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            images = np.stack([image for image, _ in batch])
+            try:
+                probabilities = await loop.run_in_executor(None, self.predict_fn, images)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), probs in zip(batch, np.asarray(probabilities)):
+                if not future.done():
+                    future.set_result(probs)
+
+
+class FrameStream:
+    """Per-connection state for a live camera stream"""
+    
+    def __init__(self, diff_threshold: float = None, ema_alpha: float = None,
+                 thumbnail_stride: int = 7):
+        """
+        Initialize the stream state
+        
+        Args:
+            diff_threshold: Mean absolute thumbnail difference below which a frame is skipped
+            ema_alpha: Weight of the newest prediction in the moving average
+            thumbnail_stride: Pixel stride used to subsample frames for the difference metric
+        """
+        self.diff_threshold = (diff_threshold if diff_threshold is not None
+                               else config.STREAM_FRAME_DIFF_THRESHOLD)
+        self.ema_alpha = ema_alpha if ema_alpha is not None else config.STREAM_EMA_ALPHA
+        self.thumbnail_stride = thumbnail_stride
+        
+        self.last_thumbnail: Optional[np.ndarray] = None
+        self.smoothed: Optional[np.ndarray] = None
+        
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_skipped = 0
+        self.frames_processed = 0
+    
+    def is_near_duplicate(self, image_array: np.ndarray) -> bool:
+        """
+        Check whether a frame is nearly identical to the last processed one
+        
+        Uses the mean absolute difference of strided grayscale thumbnails,
+        which costs a few microseconds per frame.
+        
+        Args:
+            image_array: Preprocessed frame of shape (H, W, 3) in [0, 1]
+        """
+        stride = self.thumbnail_stride
+        thumbnail = image_array[::stride, ::stride].mean(axis=2)
+        
+        if self.last_thumbnail is not None and self.last_thumbnail.shape == thumbnail.shape:
+            if float(np.mean(np.abs(thumbnail - self.last_thumbnail))) < self.diff_threshold:
+                return True
+        
+        self.last_thumbnail = thumbnail
+        return False
+    
+    def update(self, probabilities: np.ndarray) -> np.ndarray:
+        """
+        Fold new probabilities into the exponential moving average
+        
+        Args:
+            probabilities: Class probabilities for the latest frame
+        
+        Returns:
+            Smoothed class probabilities
+        """
+        probabilities = np.asarray(probabilities, dtype=np.float32)
+        
+        if self.smoothed is None:
+            self.smoothed = probabilities
+        else:
+            self.smoothed = self.ema_alpha * probabilities + (1 - self.ema_alpha) * self.smoothed
+        
+        self.frames_processed += 1
+        return self.smoothed
+    
+    def stats(self) -> dict:
+        """Frame counters for the stream"""
+        return {
+            'received': self.frames_received,
+            'dropped': self.frames_dropped,
+            'skipped': self.frames_skipped,
+            'processed': self.frames_processed
+        }
@@ -0,0 +1,173 @@
+"""
+Time-budgeted training
+Fits the two-stage training into a fixed time window. The cost of an epoch
+is measured while training, the number of stage 1 and fine-tuning epochs is
+planned from it (in proportion to EPOCHS and FINE_TUNE_EPOCHS, never more),
+and training stops early enough to leave time for the final evaluation, model
+saving and the serving exports.
+"""
+import sys
+import time
+import math
+import tensorflow as tf
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+
+
+class TrainingBudget:
+    """
+    Epoch plan and deadline of a time-budgeted run
+    
+    The budget starts when the object is created, so dataset loading and
+    model building count against it.
+    """
+    
+    def __init__(self, seconds: float, fine_tune: bool, eval_ratio: float = 1.0):
+        """
+        Args:
+            seconds: Total time available
+            fine_tune: Whether stage 2 is planned
+            eval_ratio: Size of the test split relative to the validation split
+                (a test evaluation is estimated from the measured validation time)
+        """
+        self.seconds = seconds
+        self.fine_tune = fine_tune
+        self.eval_ratio = eval_ratio
+        self.start = time.time()
+        self.planned = {'stage1': config.EPOCHS, 'stage2': config.FINE_TUNE_EPOCHS if fine_tune else 0}
+        self.done = {'stage1': 0, 'stage2': 0}
+        self.measured = {'stage1': 0, 'stage2': 0}
+        self.epoch_seconds = {'stage1': None, 'stage2': None}
+        self.trace_seconds = 0.0
+        self.eval_seconds = 0.0
+        self.stopped_by_deadline = False
+    
+    def stage_overhead(self) -> float:
+        """Test evaluation and model saving at the end of a stage"""
+        return self.eval_seconds + config.BUDGET_SAVE_SECONDS
+    
+    def export_seconds(self) -> float:
+        """
+        Serving exports after training
+        
+        Every lower-resolution model is rebuilt, evaluated on the test set and
+        timed; the inference-only model is folded, checked and timed.
+        """
+        exports = len(config.EXPORT_IMAGE_SIZES) + int(config.EXPORT_INFERENCE_MODEL)
+        return exports * config.BUDGET_EXPORT_SECONDS + len(config.EXPORT_IMAGE_SIZES) * self.eval_seconds
+    
+    def epoch_cost(self, stage: str) -> float:
+        """Measured (or, for stage 2 before it starts, estimated) seconds per epoch"""
+        if self.epoch_seconds[stage] is not None:
+            return self.epoch_seconds[stage]
+        if self.epoch_seconds['stage1'] is not None:
+            return self.epoch_seconds['stage1'] * config.BUDGET_FINE_TUNE_COST_RATIO
+        return 0.0
+    
+    def deadline(self, stage: str) -> float:
+        """Time by which a stage has to stop training"""
+        deadline = self.start + self.seconds - self.stage_overhead() - self.export_seconds()
+        if stage == 'stage1' and self.planned['stage2']:
+            deadline -= self.planned['stage2'] * self.epoch_cost('stage2') + self.trace_seconds + self.stage_overhead()
+        return deadline
+    
+    def record_epoch(self, stage: str, epoch: int, train_seconds: float, val_seconds: float):
+        """Update the epoch cost and re-plan the remaining epochs"""
+        self.done[stage] = epoch + 1
+        self.measured[stage] += 1
+        seconds = train_seconds + val_seconds
+        # The first epoch includes tracing: the second replaces it, later ones only raise it
+        if self.measured[stage] == 2:
+            self.trace_seconds = max(self.epoch_seconds[stage] - seconds, 0.0)
+        if self.measured[stage] <= 2:
+            self.epoch_seconds[stage] = seconds
+        else:
+            self.epoch_seconds[stage] = max(self.epoch_seconds[stage], seconds)
+        self.eval_seconds = val_seconds * self.eval_ratio
+        self.plan(stage)
+    
+    def plan(self, stage: str):
+        """
+        Epochs that still fit in the budget
+        
+        In stage 1, the remaining stage 1 and fine-tuning epochs are shortened
+        by the same factor; in stage 2, as many epochs as fit are kept.
+        """
+        left = self.start + self.seconds - time.time() - self.stage_overhead() - self.export_seconds()
+        cost1, cost2 = self.epoch_cost('stage1'), self.epoch_cost('stage2')
+        
+        if stage == 'stage2':
+            fits = int(max(left, 0) // cost2) if cost2 else 0
+            self.planned['stage2'] = self.done['stage2'] + min(config.FINE_TUNE_EPOCHS - self.done['stage2'], fits)
+            return
+        
+        more1 = config.EPOCHS - self.done['stage1']
+        more2 = config.FINE_TUNE_EPOCHS if self.fine_tune else 0
+        between = self.stage_overhead() if self.fine_tune else 0.0
+        # Stage 2 traces a new training step after unfreezing
+        if more2:
+            between += self.trace_seconds
+        needed = more1 * cost1 + more2 * cost2
+        
+        if needed and needed > left - between:
+            scale = max(left - between, 0) / needed
+            more1 = math.floor(more1 * scale)
+            more2 = min(more2, math.floor(max(left - between - more1 * cost1, 0) / cost2)) if cost2 else 0
+        
+        self.planned['stage1'] = self.done['stage1'] + more1
+        self.planned['stage2'] = more2
+    
+    def remaining_seconds(self) -> float:
+        return self.start + self.seconds - time.time()
+    
+    def summary(self) -> dict:
+        """Budget accounting for training_info.json"""
+        used = self.seconds - self.remaining_seconds()
+        return {
+            'budget_minutes': self.seconds / 60,
+            'used_minutes': used / 60,
+            'remaining_minutes': (self.seconds - used) / 60,
+            'planned_epochs': dict(self.planned),
+            'completed_epochs': dict(self.done),
+            'epoch_minutes': {stage: s / 60 if s else None for stage, s in self.epoch_seconds.items()},
+            'estimated_evaluation_minutes': self.eval_seconds / 60,
+            'estimated_export_minutes': self.export_seconds() / 60,
+            'stopped_by_deadline': self.stopped_by_deadline
+        }
+
+
+class BudgetStop(tf.keras.callbacks.Callback):
+    """
+    Stop a stage when its planned epochs are done or its deadline is reached
+    
+    The deadline is checked after every step, so an epoch that would overrun
+    is cut short (Keras still runs its validation pass).
+    """
+    
+    def __init__(self, budget: TrainingBudget, stage: str):
+        super().__init__()
+        self.budget = budget
+        self.stage = stage
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start = self._train_end = time.time()
+    
+    def on_train_batch_end(self, batch, logs=None):
+        self._train_end = time.time()
+        if self._train_end > self.budget.deadline(self.stage):
+            self.budget.stopped_by_deadline = True
+            self.model.stop_training = True
+    
+    def on_epoch_end(self, epoch, logs=None):
+        now = time.time()
+        self.budget.record_epoch(self.stage, epoch, self._train_end - self._epoch_start, now - self._train_end)
+        
+        planned = self.budget.planned[self.stage]
+        if epoch + 1 >= planned or now + self.budget.epoch_cost(self.stage) > self.budget.deadline(self.stage):
+            if not self.model.stop_training:
+                print(f"\n⏳ Time budget: stopping {self.stage} after epoch {epoch + 1} "
+                      f"(planned {planned}, {self.budget.summary()['remaining_minutes']:.1f} min left)")
+            self.model.stop_training = True
@@ -0,0 +1,212 @@
+"""
+Training throughput and resource monitor
+Records, per epoch and every few steps, how long training steps take and how
+much of that time is spent waiting for the input pipeline, the images/sec
+reached, peak memory and CPU/GPU utilisation. Records are appended to a JSONL
+file per stage next to training_history_stage*.json.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import subprocess
+import collections
+import tensorflow as tf
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+import config
+
+
+# (time, batch size) of every batch handed to the training step by an instrumented dataset
+_BATCH_READY = collections.deque(maxlen=1024)
+
+
+def _record_batch(size):
+    _BATCH_READY.append((time.perf_counter(), int(size)))
+    return size
+
+
+def instrument_dataset(dataset: tf.data.Dataset, class_weights: dict = None) -> tf.data.Dataset:
+    """
+    Timestamp every batch when the training step receives it
+    
+    Must be the last transformation (after prefetch), so the timestamp is taken
+    in the consumer's call: a batch that was already waiting in the prefetch
+    buffer is stamped immediately, one that was not is stamped when it arrives.
+    Keras adds its own prefetch when fit() gets class_weight, so class weights
+    are applied here as sample weights instead.
+    
+    Args:
+        dataset: Batched (images, labels) dataset
+        class_weights: Optional {class: weight}, applied as sample weights
+    
+    Returns:
+        Dataset to pass to fit() without class_weight
+    """
+    if class_weights:
+        weights = tf.constant([class_weights[i] for i in range(len(class_weights))], dtype=tf.float32)
+        dataset = dataset.map(lambda x, y: (x, y, tf.gather(weights, y)))
+    
+    def stamp(*batch):
+        size = tf.shape(tf.nest.flatten(batch)[0])[0]
+        ready = tf.py_function(_record_batch, [size], tf.int32)
+        with tf.control_dependencies([ready]):
+            return tf.nest.map_structure(tf.identity, batch)
+    
+    return dataset.map(stamp)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def gpu_stats() -> Optional[dict]:
+    """
+    Utilisation and memory of the first GPU (None without a GPU)
+    
+    Utilisation comes from nvidia-smi when it is installed; the peak memory
+    allocated by TensorFlow is read from the device itself.
+    """
+    if not tf.config.list_physical_devices('GPU'):
+        return None
+    
+    stats = {'gpu_peak_memory_mb': tf.config.experimental.get_memory_info('GPU:0')['peak'] / 2**20}
+    if shutil.which('nvidia-smi'):
+        output = subprocess.run(
+            ['nvidia-smi', '--query-gpu=utilization.gpu', '--format=csv,noheader,nounits', '-i', '0'],
+            capture_output=True, text=True
+        ).stdout.strip()
+        if output.isdigit():
+            stats['gpu_utilisation'] = int(output) / 100
+    
+    return stats
+
+
+class _Window:
+    """Step timings accumulated since the last record"""
+    
+    def __init__(self):
+        self.steps = 0
+        self.images = 0
+        self.step_time = 0.0
+        self.input_wait = 0.0
+        self.measured_wait = False
+        self.wall_start = self.wall_end = time.perf_counter()
+        self.cpu_start = self.cpu_end = time.process_time()
+    
+    def add(self, step_time: float, input_wait: Optional[float], images: int):
+        self.steps += 1
+        self.images += images
+        self.step_time += step_time
+        if input_wait is not None:
+            self.input_wait += input_wait
+            self.measured_wait = True
+        # Up to the last step, so validation at the end of an epoch is not counted
+        self.wall_end = time.perf_counter()
+        self.cpu_end = time.process_time()
+    
+    def summary(self) -> dict:
+        wall = self.wall_end - self.wall_start
+        cpu = self.cpu_end - self.cpu_start
+        steps = max(self.steps, 1)
+        summary = {
+            'steps': self.steps,
+            'images': self.images,
+            'step_time_ms': self.step_time * 1000 / steps,
+            'input_wait_ms': self.input_wait * 1000 / steps if self.measured_wait else None,
+            'compute_ms': (self.step_time - self.input_wait) * 1000 / steps if self.measured_wait else None,
+            'input_wait_fraction': self.input_wait / self.step_time if self.measured_wait and self.step_time else None,
+            'images_per_sec': self.images / wall if wall > 0 else 0.0,
+            'cpu_utilisation': cpu / (wall * os.cpu_count()) if wall > 0 else 0.0,
+            'peak_rss_mb': peak_rss_mb()
+        }
+        summary.update(gpu_stats() or {})
+        return summary
+
+
+class ThroughputMonitor(tf.keras.callbacks.Callback):
+    """
+    Log step time (input wait vs compute), images/sec, peak RSS and CPU/GPU use
+    
+    Writes one 'steps' record every every_steps steps and one 'epoch' record at
+    the end of every epoch to models/training_metrics_<stage>.jsonl. Input wait
+    is only measured when the training dataset went through instrument_dataset;
+    otherwise the whole step counts as compute. The first step of every fit()
+    call is left out, since it includes tracing the training function.
+    """
+    
+    def __init__(self, stage: str, every_steps: int = None, log_path: Path = None):
+        super().__init__()
+        self.stage = stage
+        self.every_steps = config.METRICS_EVERY_STEPS if every_steps is None else every_steps
+        self.log_path = log_path or config.MODELS_DIR / f"training_metrics_{stage}.jsonl"
+        self.epoch_summaries = []
+        self._mode = 'w'
+    
+    def _write(self, record: dict):
+        record = {'stage': self.stage, **record, 'timestamp': datetime.now().isoformat()}
+        with open(self.log_path, self._mode) as f:
+            f.write(json.dumps(record) + '\n')
+        self._mode = 'a'
+    
+    def on_train_begin(self, logs=None):
+        self._traced = False
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = epoch
+        self._epoch_window = _Window()
+        self._window = _Window()
+        _BATCH_READY.clear()
+    
+    def on_train_batch_begin(self, batch, logs=None):
+        self._step_start = time.perf_counter()
+    
+    def on_train_batch_end(self, batch, logs=None):
+        step_end = time.perf_counter()
+        step_time = step_end - self._step_start
+        
+        if not self._traced:
+            self._traced = True
+            _BATCH_READY.clear()
+            self._window = _Window()
+            self._epoch_window = _Window()
+            return
+        
+        # The batch this step consumed is the newest stamp
+        input_wait, images = None, config.BATCH_SIZE
+        if _BATCH_READY:
+            ready, images = _BATCH_READY[-1]
+            _BATCH_READY.clear()
+            input_wait = min(max(ready - self._step_start, 0.0), step_time)
+        
+        self._window.add(step_time, input_wait, images)
+        self._epoch_window.add(step_time, input_wait, images)
+        
+        if self.every_steps and self._window.steps >= self.every_steps:
+            self._write({'event': 'steps', 'epoch': self._epoch + 1, 'step': batch + 1,
+                         **self._window.summary()})
+            self._window = _Window()
+    
+    def on_epoch_end(self, epoch, logs=None):
+        summary = self._epoch_window.summary()
+        self.epoch_summaries.append(summary)
+        self._write({'event': 'epoch', 'epoch': epoch + 1, **summary})
+    
+    def on_train_end(self, logs=None):
+        if not self.epoch_summaries:
+            return
+        
+        last = self.epoch_summaries[-1]
+        wait = last['input_wait_fraction']
+        print(f"\n⏱️  {self.stage} throughput (last epoch): {last['images_per_sec']:,.0f} images/sec, "
+              f"{last['step_time_ms']:.0f} ms/step"
+              + (f", {wait*100:.0f}% waiting for input" if wait is not None else "")
+              + f", peak RSS {last['peak_rss_mb']:,.0f} MB")
+        print(f"✓ Throughput log: {self.log_path}")